@@ -0,0 +1,127 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Peak memory and throughput of extracting a tar with many members.
+
+Each extraction runs in a child process that reports its own peak RSS,
+the one wait4() returns on Linux keeps the high-water mark of the parent
+it was forked from.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import tarfile
+import subprocess
+from harness import benchmark, BenchmarkException
+
+FILES_PER_DIRECTORY = 1000
+
+def write_synthetic_tar(tar_path, files):
+    """A tar of files small files, FILES_PER_DIRECTORY in each directory,
+    with a hard link every 100 files"""
+    with open(str(tar_path), 'wb') as tar_file, \
+            tarfile.open(fileobj=tar_file, mode='w|', format=tarfile.PAX_FORMAT) as archive:
+        for index in range(files):
+            directory = 'dir%05d' % (index // FILES_PER_DIRECTORY)
+            if index % FILES_PER_DIRECTORY == 0:
+                tar_info = tarfile.TarInfo(directory)
+                tar_info.type = tarfile.DIRTYPE
+                tar_info.mode = 0o755
+                archive.addfile(tar_info)
+            name = '%s/file%07d' % (directory, index)
+            tar_info = tarfile.TarInfo(name)
+            if index % 100 == 99:
+                tar_info.type = tarfile.LNKTYPE
+                tar_info.linkname = '%s/file%07d' % (directory, index - 1)
+                archive.addfile(tar_info)
+            else:
+                data = ('%d\n' % index).encode() * 4
+                tar_info.size = len(data)
+                tar_info.mode = 0o644
+                archive.addfile(tar_info, io.BytesIO(data))
+            archive.members.clear()
+
+def prepare(context):
+    files = context.options.extract_files
+    tar_path = context.get_path('extract').joinpath('synthetic-%d.tar' % files)
+    if not tar_path.is_file():
+        write_synthetic_tar(tar_path, files)
+    return (tar_path, context.get_path('extract').joinpath('target'))
+
+def run_child(context, method, state):
+    (tar_path, target_path) = state
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), method,
+        str(tar_path), str(target_path)], stdout=subprocess.PIPE)
+    output = process.stdout.read()
+    process.stdout.close()
+    if process.wait() != 0:
+        raise BenchmarkException('Extraction with %s failed' % method)
+    result = json.loads(output.decode())
+    return {
+        'operations': result['members'],
+        'bytes': tar_path.stat().st_size,
+        'extract_seconds': result['seconds'],
+        'members_per_second': result['members'] / result['seconds'],
+        'peak_rss': result['peak_rss']
+    }
+
+def remove_target(context, state):
+    shutil.rmtree(str(state[1]), ignore_errors=True)
+
+@benchmark('archive/extract', setup=prepare, teardown=remove_target)
+def archive_extract(context, state):
+    """Extract a synthetic tar of --extract-files members with extract_tar"""
+    return run_child(context, 'extract_tar', state)
+
+@benchmark('archive/extract-tarfile', setup=prepare, teardown=remove_target)
+def archive_extract_tarfile(context, state):
+    """Extract the same tar with tarfile, as the oci_api untar does"""
+    return run_child(context, 'tarfile', state)
+
+def get_peak_rss():
+    """Peak RSS of this process in bytes"""
+    try:
+        with open('/proc/self/status') as status_file:
+            for line in status_file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    # Kilobytes on Linux, bytes elsewhere
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss * 1024 if sys.platform.startswith('linux') else peak_rss
+
+def main(method, tar_path, target_path):
+    shutil.rmtree(target_path, ignore_errors=True)
+    with open(tar_path, 'rb') as input_file:
+        start = time.perf_counter()
+        if method == 'extract_tar':
+            from oci_cli.util.archive import extract_tar
+            members = extract_tar(input_file, target_path)
+        else:
+            with tarfile.open(fileobj=input_file, mode='r|') as archive:
+                archive.extractall(target_path, numeric_owner=True)
+                members = len(archive.members)
+        seconds = time.perf_counter() - start
+    print(json.dumps({'members': members, 'seconds': seconds, 'peak_rss': get_peak_rss()}))
+
+if __name__ == '__main__':
+    benchmarks_path = os.path.dirname(os.path.abspath(__file__))
+    sys.path[:0] = [os.path.join(benchmarks_path, 'fakes'), os.path.dirname(benchmarks_path)]
+    main(*sys.argv[1:])
@@ -0,0 +1,118 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Startup and the read only commands over the seeded store"""
+
+import os
+import sys
+import subprocess
+from harness import benchmark, BenchmarkException, SkipBenchmark
+from oci_api import store
+from oci_api.seed import seed_image
+
+FAKES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fakes')
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run_subprocess(context, *args):
+    environment = os.environ.copy()
+    environment['PYTHONPATH'] = os.pathsep.join([FAKES_PATH, REPOSITORY_PATH])
+    environment['OCI_ROOT'] = str(context.root)
+    result = subprocess.run([sys.executable, '-m', 'oci_cli.cli'] + list(args),
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=environment)
+    if result.returncode != 0:
+        raise BenchmarkException('oci %s exited with %d: %s' %
+            (' '.join(args), result.returncode, result.stderr.decode().strip()))
+
+@benchmark('startup/version')
+def startup_version(context, state):
+    """Interpreter start, imports and parser construction"""
+    run_subprocess(context, '--version')
+
+@benchmark('startup/image-ls')
+def startup_image_ls(context, state):
+    """oci image ls in a new process, over an empty store"""
+    run_subprocess(context, 'image', 'ls')
+
+@benchmark('image/ls')
+def image_ls(context, state):
+    """oci image ls over the seeded images"""
+    context.run_cli('image', 'ls')
+
+@benchmark('image/ls-digests')
+def image_ls_digests(context, state):
+    """oci image ls --digests --no-trunc over the seeded images"""
+    context.run_cli('image', 'ls', '--digests', '--no-trunc')
+
+def get_image_ids(context):
+    return [image.id for image in store.images.values()]
+
+@benchmark('image/inspect', setup=get_image_ids)
+def image_inspect(context, image_ids):
+    """oci image inspect of every seeded image in one call"""
+    context.run_cli('image', 'inspect', *image_ids)
+    return {'operations': len(image_ids)}
+
+@benchmark('image/inspect-format', setup=get_image_ids)
+def image_inspect_format(context, image_ids):
+    """oci image inspect --format of every seeded image in one call"""
+    context.run_cli('image', 'inspect', '--format', '{{.Id}} {{.Size}}', *image_ids)
+    return {'operations': len(image_ids)}
+
+@benchmark('image/inspect-one')
+def image_inspect_one(context, state):
+    """oci image inspect of one image by tag, with every image in the store"""
+    context.run_cli('image', 'inspect', 'repository0:tag0')
+
+def prepare_inspect_many(context):
+    images = list(store.images.values())
+    base_layer = images[0].layers[0]
+    for index in range(len(images), context.options.inspect_images):
+        images.append(seed_image('inspect%d' % index, 2, ['inspect%d:latest' % index], 1,
+            context.options.file_size, base_layer))
+    return [image.id for image in images[:context.options.inspect_images]]
+
+@benchmark('image/inspect-many', setup=prepare_inspect_many)
+def image_inspect_many(context, image_ids):
+    """oci image inspect of --inspect-images images in one call"""
+    context.run_cli('image', 'inspect', *image_ids)
+    return {'operations': len(image_ids)}
+
+@benchmark('image/history')
+def image_history(context, state):
+    """oci image history of the image with --history-layers layers"""
+    context.run_cli('image', 'history', 'deep')
+    return {'operations': context.options.history_layers}
+
+@benchmark('image/history-quiet')
+def image_history_quiet(context, state):
+    """oci image history --quiet --no-trunc, without sizes"""
+    context.run_cli('image', 'history', '--quiet', '--no-trunc', 'deep')
+    return {'operations': context.options.history_layers}
+
+@benchmark('container/ls')
+def container_ls(context, state):
+    """oci container ls over the seeded containers"""
+    context.run_cli('container', 'ls')
+
+def get_container_names(context):
+    names = [container.name for container in store.containers.values()]
+    if len(names) == 0:
+        raise SkipBenchmark('No containers seeded')
+    return names
+
+@benchmark('container/inspect', setup=get_container_names)
+def container_inspect(context, names):
+    """oci container inspect of every seeded container in one call"""
+    context.run_cli('container', 'inspect', *names)
+    return {'operations': len(names)}
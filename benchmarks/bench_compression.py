@@ -0,0 +1,92 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ratio and throughput of every registered codec at a few levels"""
+
+import io
+import tarfile
+from harness import benchmark, SkipBenchmark
+from oci_api import store
+from oci_api.util.file import add_tree
+from oci_cli.util.compression import CompressionException, get_codec, get_codec_names
+
+LEVELS = {
+    'none': (None,),
+    'gzip': (1, 6, 9),
+    'zstd': (1, 3, 9, 19),
+    'lz4': (0, 9),
+    'xz': (0, 6),
+    'bzip2': (1, 9)
+}
+
+def get_layer_data(context):
+    """A tar of generated files of about --compression-size MB"""
+    def create():
+        source_path = context.get_path('compression-source')
+        file_size = context.options.file_size
+        files = max(context.options.compression_size * 1024 * 1024 // file_size, 1)
+        store.write_contents(source_path, 'compression', files, file_size)
+        data = io.BytesIO()
+        with tarfile.open(fileobj=data, mode='w|') as archive:
+            add_tree(archive, source_path)
+        return data.getvalue()
+    return context.once('layer data', create)
+
+def compress(codec, level, data):
+    output = io.BytesIO()
+    with codec.open_writer(output, level) as writer:
+        writer.write(data)
+    return output.getvalue()
+
+def decompress(codec, data):
+    with codec.open_reader(io.BytesIO(data)) as reader:
+        return len(reader.read())
+
+def register(codec_name, level):
+    name = codec_name if level is None else '%s-%d' % (codec_name, level)
+
+    def prepare(context):
+        codec = get_codec(codec_name)
+        data = get_layer_data(context)
+        try:
+            compressed = compress(codec, level, data)
+        except CompressionException as e:
+            raise SkipBenchmark(e.args[0])
+        return (codec, data, compressed)
+
+    def run_compress(context, state):
+        (codec, data, compressed) = state
+        compress(codec, level, data)
+        return {'bytes': len(data), 'ratio': len(compressed) / len(data)}
+    if codec_name == 'none':
+        run_compress.__doc__ = 'Copy a generated layer uncompressed, the baseline rate'
+    else:
+        run_compress.__doc__ = 'Compress a generated layer with %s' % name
+
+    def run_decompress(context, state):
+        (codec, data, compressed) = state
+        decompress(codec, compressed)
+        return {'bytes': len(data), 'ratio': len(compressed) / len(data)}
+    run_decompress.__doc__ = 'Decompress a generated layer compressed with %s' % name
+
+    benchmark('compression/%s/compress' % name, setup=prepare)(run_compress)
+    # Reading back an uncompressed BytesIO hands out its buffer without a
+    # copy, so there is no decompress rate to compare with; none/compress
+    # is the baseline copy rate for both directions
+    if codec_name != 'none':
+        benchmark('compression/%s/decompress' % name, setup=prepare)(run_decompress)
+
+for codec_name in get_codec_names():
+    for level in LEVELS.get(codec_name, (None,)):
+        register(codec_name, level)
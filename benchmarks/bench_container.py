@@ -0,0 +1,54 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""oci container create of the first container of an image against one
+more container of an image that already has many"""
+
+import itertools
+from harness import benchmark
+from oci_api import store
+from oci_api.runtime import Runtime
+from oci_api.seed import seed_image
+
+def prepare_create_first(context):
+    # A fresh image for every container created in every run
+    count = context.options.creates * context.options.repeat
+    base_layer = next(iter(store.images.values())).layers[0]
+    images = [seed_image('first%d' % index, 2, ['first%d:latest' % index],
+        context.options.files, context.options.file_size, base_layer) for index in range(count)]
+    return iter(images)
+
+@benchmark('container/create-first', setup=prepare_create_first)
+def container_create_first(context, images):
+    """--creates oci container create, each the first container of its image"""
+    for _ in range(context.options.creates):
+        context.run_cli('container', 'create', next(images).tags[0])
+    return {'operations': context.options.creates}
+
+def prepare_create_nth(context):
+    image = next(iter(store.images.values()))
+    runtime = Runtime()
+    existing = len(runtime.get_containers_using_image(image.id))
+    for index in range(existing, context.options.containers):
+        runtime.create_container(image, name='nth%d' % index)
+    return (image, itertools.count())
+
+@benchmark('container/create-nth', setup=prepare_create_nth)
+def container_create_nth(context, state):
+    """--creates oci container create of an image with --containers containers"""
+    (image, counter) = state
+    for _ in range(context.options.creates):
+        context.run_cli('container', 'create', '--name', 'nth-created%d' % next(counter),
+            image.tags[0])
+    return {'operations': context.options.creates}
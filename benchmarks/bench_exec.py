@@ -0,0 +1,92 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""oci container exec against a fake container backed by a real process.
+
+The oci container exec benchmarks time the whole command, the
+exec-process ones only what runs once the container is resolved: forking
+into the container for each exec, or handing the command to the helper
+that already entered it.
+"""
+
+import os
+import subprocess
+from harness import benchmark, SkipBenchmark
+from oci_api import store
+from oci_api.runtime import Runtime
+from oci_cli.container.execution import ExecHelper, connect_helper, get_process_config, \
+    run_process, run_with_helper
+
+def start_container(context):
+    if os.geteuid() != 0:
+        raise SkipBenchmark('Entering the namespaces of a process needs root')
+    image = next(iter(store.images.values()))
+    container = Runtime().create_container(image, name='exec-%d' % len(store.containers),
+        command=['sleep', 'infinity'])
+    process = subprocess.Popen(['sleep', '3600'])
+    container.set_running(process.pid)
+    return (container, process)
+
+def stop_container(context, state):
+    (container, process) = state
+    process.kill()
+    process.wait()
+    container.status = 'stopped'
+    container.pid = None
+
+def run_execs(context, container, *options):
+    for _ in range(context.options.execs):
+        context.run_cli('container', 'exec', *options, container.name, 'true')
+    return {'operations': context.options.execs}
+
+@benchmark('container/exec', setup=start_container, teardown=stop_container)
+def container_exec(context, state):
+    """--execs sequential oci container exec, forking into the container each time"""
+    return run_execs(context, state[0])
+
+@benchmark('container/exec-helper', setup=start_container, teardown=stop_container)
+def container_exec_helper(context, state):
+    """--execs sequential oci container exec --helper, served by the exec helper"""
+    return run_execs(context, state[0], '--helper')
+
+def run_processes(context, execute):
+    null_fd = os.open(os.devnull, os.O_RDONLY)
+    try:
+        for _ in range(context.options.execs):
+            execute((null_fd, 1, 2))
+    finally:
+        os.close(null_fd)
+    return {'operations': context.options.execs}
+
+@benchmark('container/exec-process', setup=start_container, teardown=stop_container)
+def container_exec_process(context, state):
+    """--execs sequential execs of a resolved container, forking into it each time"""
+    (container, process) = state
+    process_config = get_process_config(container)
+    return run_processes(context,
+        lambda fds: run_process(process.pid, process_config, ['true'], fds=fds))
+
+def start_helper(context):
+    (container, process) = start_container(context)
+    ExecHelper(str(context.root), container.id, process.pid,
+        get_process_config(container)).start()
+    return (container, process)
+
+@benchmark('container/exec-process-helper', setup=start_helper, teardown=stop_container)
+def container_exec_process_helper(context, state):
+    """--execs sequential execs handed to the exec helper of the container"""
+    container = state[0]
+    return run_processes(context,
+        lambda fds: run_with_helper(connect_helper(str(context.root), container.id), ['true'],
+            fds=fds))
@@ -0,0 +1,160 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Dockerfile parsing and the commands that write images: build, import,
+save and load"""
+
+import gzip
+import shutil
+import tarfile
+import itertools
+from harness import benchmark
+from oci_api import store
+from oci_api.util.file import add_tree
+from oci_cli.image import dockerfile as dockerfile_module
+from oci_cli.image.dockerfile import parse, parse_file
+
+DOCKERFILE_HEADER = '''# syntax=docker/dockerfile:1
+# escape=\\
+ARG BASE=repository0:tag0
+FROM ${BASE} AS build
+'''
+
+DOCKERFILE_BLOCKS = [
+    '''ENV APP_HOME=/opt/app{0} \\
+    APP_VERSION="{0}.0" \\
+    PATH=$APP_HOME/bin:$PATH
+''',
+    '''# Install the dependencies of step {0}
+RUN set -eux; \\
+    apt-get update; \\
+    apt-get install -y --no-install-recommends ca-certificates curl; \\
+    rm -rf /var/lib/apt/lists/*
+''',
+    '''COPY --chown=1000:1000 ["src/{0}.py", "/opt/app/{0}.py"]
+''',
+    '''RUN <<EOF
+echo "step {0}" > /etc/step-{0}
+test -f /etc/step-{0}
+EOF
+''',
+    '''COPY <<-'CONFIG' /etc/app/{0}.conf
+\tname = step-{0}
+\thome = $APP_HOME
+CONFIG
+''',
+    '''WORKDIR ${{APP_HOME:-/opt/app}}/{0}
+''',
+    '''LABEL org.opencontainers.image.title="step {0}" version={0}
+''',
+    '''CMD ["/opt/app/bin/start", "--step", "{0}"]
+'''
+]
+
+def generate_dockerfile(instructions):
+    blocks = itertools.cycle(DOCKERFILE_BLOCKS)
+    return DOCKERFILE_HEADER + ''.join(next(blocks).format(index)
+        for index in range(max(instructions - 2, 0)))
+
+def write_rootfs_tar(context, name, compressed=False):
+    """Tar of --files generated files, returns its path"""
+    source_path = context.get_path(name + '-source')
+    if not any(source_path.iterdir()):
+        store.write_contents(source_path, name, context.options.files, context.options.file_size)
+    tar_path = context.get_path().joinpath(name + ('.tar.gz' if compressed else '.tar'))
+    with tar_path.open('wb') as tar_file:
+        if compressed:
+            tar_file = gzip.GzipFile(fileobj=tar_file, mode='wb', mtime=0)
+        with tar_file, tarfile.open(fileobj=tar_file, mode='w|') as archive:
+            add_tree(archive, source_path)
+    return tar_path
+
+def prepare_dockerfile(context):
+    text = generate_dockerfile(context.options.instructions)
+    dockerfile_path = context.get_path('parse').joinpath('Dockerfile')
+    dockerfile_path.write_text(text)
+    cache_path = context.get_path('parse', 'cache')
+    # Fill the cache, parse measures the first parse of a file
+    parse_file(dockerfile_path, cache_path)
+    return (text, dockerfile_path, cache_path)
+
+@benchmark('dockerfile/parse', setup=prepare_dockerfile)
+def dockerfile_parse(context, state):
+    """Parse a generated Dockerfile of --instructions instructions"""
+    (text, _, _) = state
+    dockerfile = parse(text)
+    return {'bytes': len(text.encode()), 'operations': len(dockerfile)}
+
+@benchmark('dockerfile/parse-cached', setup=prepare_dockerfile)
+def dockerfile_parse_cached(context, state):
+    """Parse the same Dockerfile again, through the on-disk parse cache"""
+    (text, dockerfile_path, cache_path) = state
+    # Without the in-process cache, this is what a new oci process pays
+    dockerfile_module._parse_cache.clear()
+    dockerfile = parse_file(dockerfile_path, cache_path)
+    return {'bytes': len(text.encode()), 'operations': len(dockerfile)}
+
+BUILD_DOCKERFILE = '''ARG VERSION=1.0
+FROM repository0:tag0
+ENV APP_HOME=/opt/app VERSION=${VERSION}
+WORKDIR $APP_HOME
+COPY app.bin /opt/app/app.bin
+ADD rootfs.tar /opt/rootfs/
+COPY <<EOF /etc/app.conf
+home = $APP_HOME
+version = $VERSION
+EOF
+CMD ["/opt/app/app.bin"]
+'''
+
+def prepare_build(context):
+    context_path = context.get_path('build')
+    context_path.joinpath('Dockerfile').write_text(BUILD_DOCKERFILE)
+    context_path.joinpath('app.bin').write_bytes(bytes(range(256)) * 4096)
+    shutil.copyfile(str(write_rootfs_tar(context, 'rootfs')),
+        str(context_path.joinpath('rootfs.tar')))
+    return context_path
+
+@benchmark('image/build', setup=prepare_build)
+def image_build(context, context_path):
+    """oci image build of three layers, ADD extracts a tar of --files files"""
+    context.run_cli('image', 'build', '-t', 'built:latest', str(context_path))
+
+def prepare_import(context):
+    return write_rootfs_tar(context, 'import', compressed=True)
+
+@benchmark('image/import', setup=prepare_import)
+def image_import(context, tar_path):
+    """oci image import of a tar+gzip of --files files"""
+    context.run_cli('image', 'import', str(tar_path), 'imported:latest')
+    return {'bytes': tar_path.stat().st_size}
+
+@benchmark('image/save')
+def image_save(context, state):
+    """oci image save of a seeded image to a file"""
+    output_path = context.get_path('save').joinpath('image.tar')
+    context.run_cli('image', 'save', '-o', str(output_path), 'repository0:tag0')
+    return {'bytes': output_path.stat().st_size}
+
+def prepare_load(context):
+    input_path = context.get_path('load').joinpath('image.tar')
+    context.run_cli('image', 'save', '-o', str(input_path), 'repository0:tag0')
+    return (input_path, itertools.count())
+
+@benchmark('image/load', setup=prepare_load)
+def image_load(context, state):
+    """oci image load of a saved seeded image, under a new name each time"""
+    (input_path, counter) = state
+    context.run_cli('image', 'load', '-i', str(input_path), 'loaded:%d' % next(counter))
+    return {'bytes': input_path.stat().st_size}
@@ -0,0 +1,33 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-process fake of the oci_api surface used by the CLI, for benchmarks.
+
+Images, layers and containers live in memory, shared by every
+Distribution, Driver and Runtime instance of the process. Layer contents
+are real directories under the configured root so the paths that read or
+write files (build, import, save, load, exec) do real work.
+"""
+
+import os
+import tempfile
+
+class OCIError(Exception):
+    pass
+
+oci_config = {
+    'global': {
+        'path': os.environ.get('OCI_ROOT', os.path.join(tempfile.gettempdir(), 'oci-benchmarks'))
+    }
+}
@@ -0,0 +1,112 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import gzip
+import shutil
+import hashlib
+import tarfile
+from oci_api import store
+from oci_api.util.file import add_tree
+
+class Filesystem:
+    def __init__(self, path):
+        self.path = path
+
+class HashingWriter:
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.hasher = hashlib.sha256()
+
+    def write(self, data):
+        self.hasher.update(data)
+        return self.fileobj.write(data)
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def digest(self):
+        return 'sha256:' + self.hasher.hexdigest()
+
+def write_blob(path, blob_path):
+    """Write path as a tar+gzip blob, returns (digest, diff digest)"""
+    with blob_path.open('wb') as blob_file:
+        blob_writer = HashingWriter(blob_file)
+        with gzip.GzipFile(fileobj=blob_writer, mode='wb', mtime=0) as compressed_file:
+            diff_writer = HashingWriter(compressed_file)
+            with tarfile.open(fileobj=diff_writer, mode='w|') as archive:
+                add_tree(archive, path)
+    return (blob_writer.digest(), diff_writer.digest())
+
+def get_tree_size(path):
+    size = 0
+    for (dir_path, _, file_names) in os.walk(str(path)):
+        for file_name in file_names:
+            size += os.lstat(os.path.join(dir_path, file_name)).st_size
+    return size
+
+class Layer:
+    def __init__(self, layer_id, digest, diff_digest, size, path=None, seed=None,
+            files=0, file_size=0):
+        self.id = layer_id
+        self.small_id = layer_id[:12]
+        self.digest = digest
+        self.diff_digest = diff_digest
+        self.content_size = size
+        self.path = path
+        self.seed = seed
+        self.files = files
+        self.file_size = file_size
+
+    def size(self):
+        return self.content_size
+
+    def get_path(self):
+        """Directory with the layer contents, seeded layers write them on first use"""
+        if self.path is None:
+            path = store.get_path('layers').joinpath(self.id)
+            if not path.is_dir():
+                path.mkdir()
+                store.write_contents(path, self.seed, self.files, self.file_size)
+            self.path = path
+        return self.path
+
+    def get_blob_path(self):
+        blob_path = store.get_path('blobs').joinpath(self.id + '.tar.gz')
+        if not blob_path.is_file():
+            (self.digest, self.diff_digest) = write_blob(self.get_path(), blob_path)
+        return blob_path
+
+class Driver:
+    def create_filesystem(self, layer=None):
+        # Real drivers clone the parent, the fake only ever sees the diff
+        return Filesystem(store.get_path('filesystems', store.new_id()))
+
+    def create_layer(self, filesystem):
+        layer_id = store.new_id()
+        blob_path = store.get_path('blobs').joinpath(layer_id + '.tar.gz')
+        (digest, diff_digest) = write_blob(filesystem.path, blob_path)
+        layer = Layer(layer_id, digest, diff_digest, get_tree_size(filesystem.path),
+            path=filesystem.path)
+        store.layers[layer_id] = layer
+        return layer
+
+    def remove_layer(self, layer):
+        store.layers.pop(layer.id, None)
+        if layer.path is not None:
+            shutil.rmtree(str(layer.path), ignore_errors=True)
+        try:
+            store.get_path('blobs').joinpath(layer.id + '.tar.gz').unlink()
+        except FileNotFoundError:
+            pass
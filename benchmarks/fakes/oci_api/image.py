@@ -0,0 +1,209 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import shutil
+import hashlib
+import pathlib
+from datetime import datetime, timezone
+from oci_api import OCIError, store
+from oci_api.graph import Driver
+from oci_api.util import split_image_name
+from oci_api.util.file import untar
+from oci_spec.image.v1 import ImageConfig
+
+MANIFEST_MEDIA_TYPE = 'application/vnd.oci.image.manifest.v1+json'
+CONFIG_MEDIA_TYPE = 'application/vnd.oci.image.config.v1+json'
+LAYER_MEDIA_TYPE = 'application/vnd.oci.image.layer.v1.tar+gzip'
+REF_NAME_ANNOTATION = 'org.opencontainers.image.ref.name'
+
+class ImageUnknownException(OCIError):
+    pass
+
+class ImageExistsException(OCIError):
+    pass
+
+class ImageInUseException(OCIError):
+    pass
+
+def create_config():
+    return ImageConfig({
+        'Created': datetime.now(tz=timezone.utc),
+        'Architecture': 'amd64',
+        'Os': 'linux',
+        'Config': {},
+        'RootFS': {
+            'Type': 'layers',
+            'DiffIds': []
+        },
+        'History': []
+    })
+
+def config_set_command(config, command, created_by):
+    config.setdefault('Config', {})['Cmd'] = command
+    config.setdefault('History', []).append({
+        'Created': datetime.now(tz=timezone.utc),
+        'CreatedBy': created_by,
+        'EmptyLayer': True
+    })
+
+def config_add_diff(config, diff_digest, created_by):
+    config.setdefault('RootFS', {'Type': 'layers'}).setdefault('DiffIds', []).append(diff_digest)
+    config.setdefault('History', []).append({
+        'Created': datetime.now(tz=timezone.utc),
+        'CreatedBy': created_by
+    })
+
+def normalize_tag(tag):
+    return '%s:%s' % split_image_name(tag)
+
+class Image:
+    def __init__(self, image_id, config, layers, tags=None):
+        self.id = image_id
+        self.small_id = image_id[:12]
+        self.config = config
+        self.layers = layers
+        self.tags = tags or []
+        self.digest = 'sha256:' + hashlib.sha256(' '.join([image_id] +
+            [layer.digest for layer in layers]).encode()).hexdigest()
+
+    def size(self):
+        return sum(layer.size() for layer in self.layers)
+
+    def top_layer(self):
+        if len(self.layers) == 0:
+            return None
+        return self.layers[-1]
+
+    def set_command(self, command):
+        self.config.setdefault('Config', {})['Cmd'] = command
+
+    def set_environment(self, environment):
+        self.config.setdefault('Config', {})['Env'] = environment
+
+    def set_working_dir(self, working_dir):
+        self.config.setdefault('Config', {})['WorkingDir'] = working_dir
+
+class Distribution:
+    def __init__(self):
+        self.images = store.images
+
+    def get_image(self, reference):
+        if reference.startswith('sha256:'):
+            reference = reference[7:]
+        image = self.images.get(reference)
+        if image is not None:
+            return image
+        tag = normalize_tag(reference)
+        for image in self.images.values():
+            if tag in image.tags or image.digest == 'sha256:' + reference:
+                return image
+        raise ImageUnknownException('Image (%s) does not exist' % reference)
+
+    def get_repositories(self, image):
+        return sorted(set(split_image_name(tag)[0] for tag in image.tags))
+
+    def add_tag(self, image, tag):
+        tag = normalize_tag(tag)
+        for other_image in self.images.values():
+            if tag in other_image.tags:
+                other_image.tags.remove(tag)
+        image.tags.append(tag)
+
+    def create_image(self, config=None, layers=None, layer=None, history=None):
+        if layer is not None:
+            config = create_config()
+            config_add_diff(config, layer.diff_digest, history)
+            layers = [layer]
+        image_id = hashlib.sha256(config.to_json().encode()).hexdigest()
+        image = self.images.get(image_id)
+        if image is None:
+            image = Image(image_id, config, list(layers))
+            self.images[image_id] = image
+        return image
+
+    def remove_image(self, image, force=False):
+        from oci_api.runtime import Runtime
+        if not force and len(Runtime().get_containers_using_image(image.id)) != 0:
+            raise ImageInUseException('Image (%s) is being used by a container' % image.small_id)
+        self.images.pop(image.id, None)
+
+    def save_image(self, image_name, path):
+        """Add image_name to the OCI image layout in path"""
+        image = self.get_image(image_name)
+        path = pathlib.Path(path)
+        blobs_path = path.joinpath('blobs', 'sha256')
+        blobs_path.mkdir(parents=True, exist_ok=True)
+        layer_descriptors = []
+        for layer in image.layers:
+            blob_path = layer.get_blob_path()
+            shutil.copyfile(str(blob_path), str(blobs_path.joinpath(layer.digest[7:])))
+            layer_descriptors.append({
+                'mediaType': LAYER_MEDIA_TYPE,
+                'digest': layer.digest,
+                'size': blob_path.stat().st_size
+            })
+        config = image.config.to_dict()
+        config['rootfs']['diff_ids'] = [layer.diff_digest for layer in image.layers]
+        manifest = {
+            'schemaVersion': 2,
+            'config': write_json_blob(blobs_path, config, CONFIG_MEDIA_TYPE),
+            'layers': layer_descriptors
+        }
+        manifest_descriptor = write_json_blob(blobs_path, manifest, MANIFEST_MEDIA_TYPE)
+        manifest_descriptor['annotations'] = {REF_NAME_ANNOTATION: normalize_tag(image_name)}
+        index_path = path.joinpath('index.json')
+        index = {'schemaVersion': 2, 'manifests': []}
+        if index_path.is_file():
+            index = json.loads(index_path.read_text())
+        index['manifests'].append(manifest_descriptor)
+        index_path.write_text(json.dumps(index))
+        path.joinpath('oci-layout').write_text(json.dumps({'imageLayoutVersion': '1.0.0'}))
+
+    def load_image(self, image_name, path):
+        """Create image_name from the first image of the OCI image layout in path"""
+        tag = normalize_tag(image_name)
+        if any(tag in image.tags for image in self.images.values()):
+            raise ImageExistsException('Image (%s) already exists' % image_name)
+        path = pathlib.Path(path)
+        index = json.loads(path.joinpath('index.json').read_text())
+        manifest = read_json_blob(path, index['manifests'][0]['digest'])
+        config = ImageConfig.from_dict(read_json_blob(path, manifest['config']['digest']))
+        driver = Driver()
+        layers = []
+        for layer_descriptor in manifest['layers']:
+            filesystem = driver.create_filesystem(layers[-1] if len(layers) != 0 else None)
+            untar(filesystem.path, tar_file_path=get_blob_path(path, layer_descriptor['digest']))
+            layers.append(driver.create_layer(filesystem))
+        config['RootFS']['DiffIds'] = [layer.diff_digest for layer in layers]
+        image = self.create_image(config, layers)
+        self.add_tag(image, tag)
+        return image
+
+def get_blob_path(path, digest):
+    (algorithm, _, hexdigest) = digest.partition(':')
+    return path.joinpath('blobs', algorithm, hexdigest)
+
+def read_json_blob(path, digest):
+    return json.loads(get_blob_path(path, digest).read_bytes())
+
+def write_json_blob(blobs_path, data, media_type):
+    content = json.dumps(data, separators=(',', ':')).encode()
+    digest = hashlib.sha256(content).hexdigest()
+    blobs_path.joinpath(digest).write_bytes(content)
+    return {
+        'mediaType': media_type,
+        'digest': 'sha256:' + digest,
+        'size': len(content)
+    }
@@ -0,0 +1,88 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from datetime import datetime, timezone
+from oci_api import OCIError, store
+from oci_api.graph import Driver
+from oci_spec.runtime.v1 import Spec
+
+class ContainerUnknownException(OCIError):
+    pass
+
+class Container:
+    def __init__(self, container_id, image, name, config, filesystem):
+        self.id = container_id
+        self.small_id = container_id[:12]
+        self.image = image
+        self.name = name
+        self.config = config
+        self.filesystem = filesystem
+        self.create_time = datetime.now(tz=timezone.utc)
+        self.state_change_time = None
+        self.status = 'created'
+        self.pid = None
+
+    def state(self):
+        state = {'Status': self.status}
+        if self.pid is not None:
+            state['Pid'] = self.pid
+        return state
+
+    def set_running(self, pid):
+        self.status = 'running'
+        self.pid = pid
+        self.state_change_time = datetime.now(tz=timezone.utc)
+
+    def start(self):
+        # There is no process to run, the container exits right away
+        self.status = 'stopped'
+        self.state_change_time = datetime.now(tz=timezone.utc)
+
+class Runtime:
+    def __init__(self):
+        self.containers = store.containers
+
+    def create_container(self, image, name=None, command=None, workdir=None):
+        image_config = image.config.get('Config') or {}
+        config = Spec({
+            'Process': {
+                'Args': command or image_config.get('Cmd') or ['/bin/sh'],
+                'Env': list(image_config.get('Env') or []),
+                'Cwd': workdir or image_config.get('WorkingDir') or '/'
+            },
+            'Root': {
+                'Path': 'rootfs'
+            }
+        })
+        container_id = store.new_id()
+        if name is None:
+            name = 'container_%s' % container_id[:8]
+        filesystem = Driver().create_filesystem(image.top_layer())
+        container = Container(container_id, image, name, config, filesystem)
+        self.containers[container_id] = container
+        return container
+
+    def get_container(self, reference):
+        for container in self.containers.values():
+            if reference in (container.id, container.name) or \
+                    container.id.startswith(reference):
+                return container
+        raise ContainerUnknownException('Container (%s) does not exist' % reference)
+
+    def remove_container(self, container_id):
+        self.containers.pop(container_id, None)
+
+    def get_containers_using_image(self, image_id):
+        return [container for container in self.containers.values()
+            if container.image.id == image_id]
@@ -0,0 +1,81 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Populate the fake store without going through the CLI.
+
+Seeded layers have fake digests and write their contents only when
+something reads them, so seeding thousands of images is cheap.
+"""
+
+from datetime import datetime, timedelta, timezone
+from oci_api import store
+from oci_api.graph import Layer
+from oci_api.image import Distribution, create_config
+from oci_api.runtime import Runtime
+
+def seed_layer(name, files, file_size):
+    layer_id = store.fake_digest('layer', name)[7:]
+    layer = Layer(layer_id, store.fake_digest('blob', name), store.fake_digest('diff', name),
+        files * file_size, seed=name, files=files, file_size=file_size)
+    store.layers[layer_id] = layer
+    return layer
+
+def seed_image(name, layers, tags=(), files=16, file_size=4096, base_layer=None, created=None):
+    """Create an image of layers layers, the first one is base_layer when given"""
+    created = created or datetime.now(tz=timezone.utc)
+    config = create_config()
+    config['Created'] = created
+    config['Config'] = {
+        'Env': ['PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin'],
+        'Cmd': ['/bin/sh'],
+        'WorkingDir': '/'
+    }
+    image_layers = []
+    for index in range(layers):
+        if index == 0 and base_layer is not None:
+            layer = base_layer
+        else:
+            layer = seed_layer('%s-%d' % (name, index), files, file_size)
+        image_layers.append(layer)
+        config['RootFS']['DiffIds'].append(layer.diff_digest)
+        config['History'].append({
+            'Created': created,
+            'CreatedBy': '/bin/sh -c #(nop) ADD file:%s-%d in / ' % (name, index)
+        })
+    config['History'].append({
+        'Created': created,
+        'CreatedBy': '/bin/sh -c #(nop)  CMD ["/bin/sh"]',
+        'EmptyLayer': True
+    })
+    distribution = Distribution()
+    image = distribution.create_image(config, image_layers)
+    for tag in tags:
+        distribution.add_tag(image, tag)
+    return image
+
+def seed(images=100, layers=5, tags=1, containers=0, files=16, file_size=4096):
+    """Create images sharing a base layer, tagged repository<n>:tag<m>,
+    and containers spread over them. Returns the list of images."""
+    base_layer = seed_layer('base', files, file_size)
+    now = datetime.now(tz=timezone.utc)
+    seeded_images = []
+    for index in range(images):
+        seeded_images.append(seed_image('image%d' % index, layers,
+            ['repository%d:tag%d' % (index, tag_index) for tag_index in range(tags)],
+            files, file_size, base_layer, now - timedelta(minutes=images - index)))
+    runtime = Runtime()
+    for index in range(containers):
+        runtime.create_container(seeded_images[index % len(seeded_images)],
+            name='container%d' % index)
+    return seeded_images
@@ -0,0 +1,51 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Process wide state shared by the fake Distribution, Driver and Runtime"""
+
+import uuid
+import pathlib
+import hashlib
+from oci_api import oci_config
+
+images = {}
+layers = {}
+containers = {}
+
+def get_path(*names):
+    path = pathlib.Path(oci_config['global']['path'], 'fake', *names)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+def new_id():
+    return hashlib.sha256(uuid.uuid4().bytes).hexdigest()
+
+def fake_digest(*names):
+    return 'sha256:' + hashlib.sha256(':'.join(names).encode()).hexdigest()
+
+def reset():
+    images.clear()
+    layers.clear()
+    containers.clear()
+
+def write_contents(path, seed, files, file_size):
+    """Fill path with files of deterministic content, half of each file
+    compresses like text and half like binaries"""
+    for index in range(files):
+        file_path = path.joinpath('dir%d' % (index % 8), 'file-%s-%d' % (seed, index))
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        half = file_size // 2
+        binary = hashlib.shake_256(('%s:%d' % (seed, index)).encode()).digest(half)
+        text = (b'line %d of %s\n' % (index, seed.encode())) * (file_size // 16 + 1)
+        file_path.write_bytes(binary + text[:file_size - half])
@@ -0,0 +1,20 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+def split_image_name(image_name):
+    """Return (repository, tag) of image_name, the tag defaults to latest"""
+    (repository, separator, tag) = image_name.rpartition(':')
+    if separator == '' or '/' in tag:
+        return (image_name, 'latest')
+    return (repository, tag)
@@ -0,0 +1,55 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import shutil
+import pathlib
+import tarfile
+
+def untar(path, tar_file=None, tar_file_path=None):
+    """Extract a tar stream from the tar_file object or the tar_file_path file"""
+    pathlib.Path(path).mkdir(parents=True, exist_ok=True)
+    if tar_file_path is not None:
+        with tarfile.open(str(tar_file_path), 'r:*') as archive:
+            archive.extractall(str(path), numeric_owner=True)
+        return
+    with tarfile.open(fileobj=tar_file, mode='r|') as archive:
+        archive.extractall(str(path), numeric_owner=True)
+
+def add_tree(archive, path):
+    for (dir_path, dir_names, file_names) in os.walk(str(path)):
+        dir_names.sort()
+        for name in dir_names + sorted(file_names):
+            file_path = os.path.join(dir_path, name)
+            archive.add(file_path, os.path.relpath(file_path, str(path)), recursive=False)
+
+def tar(path, tar_file_path=None, tar_file=None):
+    """Write the contents of path as a tar stream to tar_file_path, or STDOUT"""
+    if tar_file_path is not None:
+        with tarfile.open(str(tar_file_path), 'w') as archive:
+            add_tree(archive, path)
+        return
+    if tar_file is None:
+        tar_file = sys.stdout.buffer
+    with tarfile.open(fileobj=tar_file, mode='w|') as archive:
+        add_tree(archive, path)
+
+def cp(source_path, target_path):
+    source_path = pathlib.Path(source_path)
+    target_path = pathlib.Path(target_path)
+    if target_path.is_dir() or str(target_path).endswith('/'):
+        target_path = target_path.joinpath(source_path.name)
+    target_path.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copy2(str(source_path), str(target_path))
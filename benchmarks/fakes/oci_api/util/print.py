@@ -0,0 +1,26 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+def print_table(rows):
+    if len(rows) == 0:
+        return
+    columns = list(rows[0].keys())
+    widths = {column: len(column) for column in columns}
+    for row in rows:
+        for column in columns:
+            widths[column] = max(widths[column], len(str(row.get(column, ''))))
+    print('   '.join(column.upper().ljust(widths[column]) for column in columns).rstrip())
+    for row in rows:
+        print('   '.join(str(row.get(column, '')).ljust(widths[column])
+            for column in columns).rstrip())
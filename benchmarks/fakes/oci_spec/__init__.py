@@ -0,0 +1,75 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-memory stand-in for the oci_spec objects the CLI uses.
+
+Objects are dicts keyed by the real (capitalized) field names, as the CLI
+reads them, and converted from and to the JSON names of the specs.
+"""
+
+import copy
+import json
+from datetime import datetime
+
+# Fields whose JSON name is not the real name with a lowercase first letter
+JSON_NAMES = {
+    'RootFS': 'rootfs',
+    'DiffIds': 'diff_ids',
+    'CreatedBy': 'created_by',
+    'EmptyLayer': 'empty_layer'
+}
+
+REAL_NAMES = {value: key for (key, value) in JSON_NAMES.items()}
+
+# Subtrees already keyed by real names in the JSON documents
+VERBATIM = ('Config', 'Annotations', 'Labels')
+
+def to_json_name(name):
+    return JSON_NAMES.get(name, name[:1].lower() + name[1:])
+
+def to_real_name(name):
+    return REAL_NAMES.get(name, name[:1].upper() + name[1:])
+
+def convert(value, rename, verbatim=False):
+    if isinstance(value, dict):
+        if verbatim:
+            return {key: convert(item, rename, True) for (key, item) in value.items()}
+        return {rename(key): convert(item, rename, to_real_name(key) in VERBATIM)
+            for (key, item) in value.items()}
+    if isinstance(value, list):
+        return [convert(item, rename, verbatim) for item in value]
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+class SpecObject(dict):
+    def copy(self):
+        return copy.deepcopy(self)
+
+    def to_dict(self, use_real_name=False):
+        if use_real_name:
+            return copy.deepcopy(dict(self))
+        return convert(dict(self), to_json_name)
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), separators=(',', ':'), sort_keys=True)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(convert(data, to_real_name))
+
+    @classmethod
+    def from_file(cls, file_path):
+        with open(str(file_path)) as spec_file:
+            return cls.from_dict(json.load(spec_file))
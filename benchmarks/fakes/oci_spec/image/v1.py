@@ -0,0 +1,27 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from datetime import datetime
+from oci_spec import SpecObject
+
+class ImageConfig(SpecObject):
+    @classmethod
+    def from_dict(cls, data):
+        config = super().from_dict(data)
+        if isinstance(config.get('Created'), str):
+            config['Created'] = datetime.fromisoformat(config['Created'])
+        for history_item in config.get('History') or []:
+            if isinstance(history_item.get('Created'), str):
+                history_item['Created'] = datetime.fromisoformat(history_item['Created'])
+        return config
@@ -0,0 +1,142 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Registry and timing of the benchmarks.
+
+A benchmark is a function taking the context and the value returned by its
+setup, it may return a dict of metrics: 'bytes' adds a throughput and
+'operations' a time per operation, both computed from the median.
+"""
+
+import os
+import sys
+import time
+import shutil
+import pathlib
+import tempfile
+import statistics
+import contextlib
+
+BENCHMARKS = {}
+
+class SkipBenchmark(Exception):
+    pass
+
+class BenchmarkException(Exception):
+    pass
+
+class Benchmark:
+    def __init__(self, name, function, setup=None, teardown=None, repeat=None):
+        self.name = name
+        self.function = function
+        self.setup = setup
+        self.teardown = teardown
+        self.repeat = repeat
+        self.description = (function.__doc__ or '').strip().split('\n')[0]
+
+def benchmark(name, setup=None, teardown=None, repeat=None):
+    def register(function):
+        BENCHMARKS[name] = Benchmark(name, function, setup, teardown, repeat)
+        return function
+    return register
+
+class Context:
+    def __init__(self, root, options):
+        self.root = pathlib.Path(root)
+        self.options = options
+        self.data = {}
+
+    def get_path(self, *names):
+        path = self.root.joinpath('benchmarks', *names)
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def once(self, key, function):
+        """Value of function() computed the first time key is asked for"""
+        if key not in self.data:
+            self.data[key] = function()
+        return self.data[key]
+
+    def run_cli(self, *args):
+        """Run oci with args in this process, its output is discarded"""
+        from oci_cli.cli import CLI
+        argv = sys.argv
+        sys.argv = ['oci', '--log-level', 'error', '--root', str(self.root)] + list(args)
+        try:
+            with open(os.devnull, 'w') as null_file, contextlib.redirect_stdout(null_file):
+                CLI()
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                raise BenchmarkException('oci %s exited with %s' % (' '.join(args), e.code))
+        finally:
+            sys.argv = argv
+
+def measure(benchmark, context, repeat):
+    state = None
+    if benchmark.setup is not None:
+        state = benchmark.setup(context)
+    try:
+        times = []
+        metrics = None
+        for _ in range(benchmark.repeat or repeat):
+            start = time.perf_counter()
+            metrics = benchmark.function(context, state)
+            times.append(time.perf_counter() - start)
+    finally:
+        if benchmark.teardown is not None:
+            benchmark.teardown(context, state)
+    median = statistics.median(times)
+    result = {
+        'name': benchmark.name,
+        'description': benchmark.description,
+        'repeat': len(times),
+        'min': min(times),
+        'median': median,
+        'mean': statistics.mean(times),
+        'max': max(times),
+        'times': times
+    }
+    if metrics:
+        metrics = dict(metrics)
+        if 'bytes' in metrics and median > 0:
+            metrics['throughput'] = metrics['bytes'] / median
+        if 'operations' in metrics:
+            metrics['per_operation'] = median / metrics['operations']
+        result['metrics'] = metrics
+    return result
+
+def run(benchmarks, context, repeat, report=None):
+    results = []
+    for benchmark in benchmarks:
+        try:
+            result = measure(benchmark, context, repeat)
+        except SkipBenchmark as e:
+            result = {
+                'name': benchmark.name,
+                'description': benchmark.description,
+                'skipped': str(e)
+            }
+        results.append(result)
+        if report is not None:
+            report(result)
+    return results
+
+@contextlib.contextmanager
+def temporary_root(keep=False):
+    root = tempfile.mkdtemp(prefix='oci-benchmarks-')
+    try:
+        yield root
+    finally:
+        if not keep:
+            shutil.rmtree(root, ignore_errors=True)
@@ -0,0 +1,224 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run the benchmarks against the in-process fake oci_api backends.
+
+    python benchmarks/run.py [options] [PATTERN ...]
+
+Results are written as JSON, with the commit they were measured on, so
+runs over a series of commits can be compared with --compare.
+"""
+
+import os
+import sys
+import json
+import fnmatch
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_PATH = os.path.dirname(BENCHMARKS_PATH)
+# The fakes shadow an installed oci_api, the CLI is always the checkout's
+sys.path[:0] = [os.path.join(BENCHMARKS_PATH, 'fakes'), REPOSITORY_PATH]
+
+from oci_api import oci_config, store
+from oci_api.seed import seed, seed_image
+import harness
+
+BENCHMARK_MODULES = ('bench_cli', 'bench_image', 'bench_container', 'bench_exec',
+    'bench_compression', 'bench_archive')
+
+def get_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPOSITORY_PATH,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout.decode().strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+            cwd=REPOSITORY_PATH, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return (None, None)
+    return (commit, status != '')
+
+def format_time(seconds):
+    if seconds < 1e-3:
+        return '%.1fus' % (seconds * 1e6)
+    if seconds < 1:
+        return '%.2fms' % (seconds * 1e3)
+    return '%.3fs' % seconds
+
+def format_result(result):
+    if 'skipped' in result:
+        return '%-40s skipped: %s' % (result['name'], result['skipped'])
+    line = '%-40s median %10s  min %10s' % (result['name'],
+        format_time(result['median']), format_time(result['min']))
+    metrics = result.get('metrics') or {}
+    if 'throughput' in metrics:
+        line += '  %8.1f MB/s' % (metrics['throughput'] / 1e6)
+    if 'per_operation' in metrics:
+        line += '  %10s/op' % format_time(metrics['per_operation'])
+    if 'peak_rss' in metrics:
+        line += '  %8.1f MB RSS' % (metrics['peak_rss'] / 1e6)
+    if 'ratio' in metrics:
+        line += '  ratio %.3f' % metrics['ratio']
+    return line
+
+def compare(previous_path, results):
+    with open(previous_path) as previous_file:
+        previous = json.load(previous_file)
+    previous_results = {result['name']: result for result in previous['results']}
+    print('\nCompared with %s (%s)' % (previous_path, (previous.get('commit') or 'unknown')[:12]))
+    for result in results:
+        previous_result = previous_results.get(result['name'])
+        if previous_result is None or 'median' not in result or 'median' not in previous_result:
+            continue
+        change = result['median'] / previous_result['median'] - 1
+        print('%-40s %10s -> %10s  %+7.1f%%' % (result['name'],
+            format_time(previous_result['median']), format_time(result['median']), change * 100))
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Benchmark the CLI against in-process fake oci_api backends')
+    parser.add_argument('--images',
+        help='Number of seeded images',
+        type=int,
+        default=100,
+        metavar='int')
+    parser.add_argument('--layers',
+        help='Number of layers of each seeded image, the first one shared by all',
+        type=int,
+        default=5,
+        metavar='int')
+    parser.add_argument('--tags',
+        help='Number of tags of each seeded image',
+        type=int,
+        default=1,
+        metavar='int')
+    parser.add_argument('--containers',
+        help='Number of seeded containers',
+        type=int,
+        default=100,
+        metavar='int')
+    parser.add_argument('--inspect-images',
+        help='Number of images inspected in one call by image/inspect-many, '
+            'seeded when there are not as many',
+        type=int,
+        default=1000,
+        metavar='int')
+    parser.add_argument('--history-layers',
+        help='Number of layers of the image "deep" used by the history benchmarks',
+        type=int,
+        default=200,
+        metavar='int')
+    parser.add_argument('--files',
+        help='Number of files of the generated layers, tars and seeded layer contents',
+        type=int,
+        default=500,
+        metavar='int')
+    parser.add_argument('--file-size',
+        help='Size of the generated files',
+        type=int,
+        default=4096,
+        metavar='int')
+    parser.add_argument('--instructions',
+        help='Number of instructions of the generated Dockerfile',
+        type=int,
+        default=2000,
+        metavar='int')
+    parser.add_argument('--execs',
+        help='Number of sequential execs of the exec benchmarks',
+        type=int,
+        default=100,
+        metavar='int')
+    parser.add_argument('--creates',
+        help='Number of containers created in each run of the create benchmarks',
+        type=int,
+        default=20,
+        metavar='int')
+    parser.add_argument('--compression-size',
+        help='Size in MB of the layer of the compression benchmarks',
+        type=int,
+        default=8,
+        metavar='int')
+    parser.add_argument('--extract-files',
+        help='Number of members of the tar of the extraction benchmarks',
+        type=int,
+        default=100000,
+        metavar='int')
+    parser.add_argument('-r', '--repeat',
+        help='Number of timed runs of each benchmark',
+        type=int,
+        default=5,
+        metavar='int')
+    parser.add_argument('-o', '--output',
+        help='Write the results as JSON to this file',
+        metavar='string')
+    parser.add_argument('--compare',
+        help='Compare the medians with the results in this JSON file',
+        metavar='string')
+    parser.add_argument('--keep',
+        help='Keep the temporary root directory',
+        action='store_true')
+    parser.add_argument('-l', '--list',
+        help='List the benchmarks and exit',
+        action='store_true')
+    parser.add_argument('pattern',
+        nargs='*',
+        metavar='PATTERN',
+        help='Only run the benchmarks whose name matches one of these shell patterns')
+    options = parser.parse_args()
+
+    for module_name in BENCHMARK_MODULES:
+        __import__(module_name)
+    benchmarks = [benchmark for benchmark in harness.BENCHMARKS.values()
+        if len(options.pattern) == 0 or
+            any(fnmatch.fnmatchcase(benchmark.name, pattern) for pattern in options.pattern)]
+    if options.list:
+        for benchmark in benchmarks:
+            print('%-40s %s' % (benchmark.name, benchmark.description))
+        return
+
+    with harness.temporary_root(options.keep) as root:
+        oci_config['global']['path'] = root
+        store.reset()
+        seed(options.images, options.layers, options.tags, options.containers,
+            max(options.files // options.layers, 1), options.file_size)
+        seed_image('deep', options.history_layers, ['deep:latest'], 1, options.file_size)
+        context = harness.Context(root, options)
+        results = harness.run(benchmarks, context, options.repeat,
+            report=lambda result: print(format_result(result), flush=True))
+        if options.keep:
+            print('Kept root (%s)' % root)
+
+    (commit, dirty) = get_commit()
+    document = {
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': datetime.now(tz=timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {name: value for (name, value) in vars(options).items()
+            if name not in ('output', 'compare', 'keep', 'list', 'pattern')},
+        'results': results
+    }
+    if options.output is not None:
+        with open(options.output, 'w') as output_file:
+            json.dump(document, output_file, indent=4)
+    if options.compare is not None:
+        compare(options.compare, results)
+
+if __name__ == '__main__':
+    main()
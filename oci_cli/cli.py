@@ -18,9 +18,12 @@ import importlib
 import logging
 from oci_api import oci_config
 from .version import __version__
+from .completion import Completion
 from .container import Container
+from .events import Events
 from .volume import Volume
 from .image import Image
+from .util.resolver import Resolver
 
 log = logging.getLogger(__name__)
 
@@ -40,10 +43,33 @@ class CLI:
     commands = {
         'container': Container,
         'volume': Volume,
-        'image': Image
+        'image': Image,
+        'events': Events,
+        'completion': Completion
     }
 
     def __init__(self):
+        parser = CLI.get_parser()
+        options = parser.parse_args()
+
+        logging.basicConfig(level=log_levels[options.log_level])
+        # The storage of the api follows --root, so peers can use other roots
+        oci_config['global']['path'] = options.root
+
+        if options.debug:
+            import ptvsd
+            ptvsd.enable_attach()
+            log.info("Waiting for IDE to attach...")
+            ptvsd.wait_for_attach()
+
+        command = CLI.commands[options.command]
+        try:
+            command(options)
+        finally:
+            Resolver.refresh_invalidated()
+
+    @staticmethod
+    def get_parser():
         parser = argparse.ArgumentParser(
             formatter_class=CustomFormatter,
             description='A self-sufficient runtime for containers')
@@ -77,19 +103,8 @@ class CLI:
 
         for command in CLI.commands.values():
             command.init_parser(oci_subparsers)
- 
-        options = parser.parse_args()
-
-        logging.basicConfig(level=log_levels[options.log_level])
 
-        if options.debug:
-            import ptvsd
-            ptvsd.enable_attach()
-            log.info("Waiting for IDE to attach...")
-            ptvsd.wait_for_attach()
-
-        command = CLI.commands[options.command]
-        command(options)
+        return parser
 
 def main():
     CLI()
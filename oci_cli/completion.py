@@ -0,0 +1,448 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Shell completion scripts for bash, zsh and fish.
+
+The command tree, options and choices are taken from the argparse parser
+when the script is generated and written into it. Image and container
+names come from the plain word lists kept under <root>/cache/completion by
+the reference resolver, so completing never starts python nor reads the
+store.
+"""
+
+import shlex
+import argparse
+import logging
+from oci_cli.util.resolver import ContainerResolver, ImageResolver, Resolver
+
+log = logging.getLogger(__name__)
+
+# Positional arguments completed from the word lists, by destination
+POSITIONAL_KINDS = {
+    'container': 'containers',
+    'image': 'images',
+    'other_image': 'images'
+}
+
+class CommandSpec:
+    def __init__(self, path):
+        self.path = path
+        self.commands = []
+        self.options = []
+        self.value_options = []
+        self.choices = {}
+        self.positionals = []
+
+def get_positional_kind(action):
+    if action.nargs == argparse.REMAINDER:
+        return 'rest'
+    if action.choices is not None:
+        kind = 'choices'
+    else:
+        kind = POSITIONAL_KINDS.get(action.dest, 'files')
+    if action.nargs in (argparse.ZERO_OR_MORE, argparse.ONE_OR_MORE):
+        # The last one repeats
+        kind += '+'
+    return kind
+
+def get_specs(parser, path=''):
+    """CommandSpec of parser and of its subcommands, in depth first order"""
+    spec = CommandSpec(path)
+    specs = [spec]
+    for action in parser._actions:
+        if isinstance(action, argparse._SubParsersAction):
+            for (name, subparser) in action.choices.items():
+                spec.commands.append(name)
+                specs.extend(get_specs(subparser, (path + ' ' + name).strip()))
+        elif action.help == argparse.SUPPRESS:
+            continue
+        elif len(action.option_strings) != 0:
+            spec.options.extend(action.option_strings)
+            if action.nargs != 0:
+                spec.value_options.extend(action.option_strings)
+                if action.choices is not None:
+                    for option in action.option_strings:
+                        spec.choices[option] = [str(choice) for choice in action.choices]
+        else:
+            if action.choices is not None:
+                # Keyed by position, completed like option values
+                spec.choices[str(len(spec.positionals))] = [str(choice) for choice in action.choices]
+            spec.positionals.append(get_positional_kind(action))
+    return specs
+
+BASH_SCRIPT = '''# oci completion for bash, load with: source <(oci completion bash)
+
+_oci_spec() {
+    subcommands= flags= values= positionals=
+    case "$1" in
+%(specs)s
+    esac
+}
+
+_oci_choices() {
+    choices=
+    case "$1" in
+%(choices)s
+    esac
+}
+
+_oci_kind() {
+    local -a kinds=($positionals)
+    kind=
+    if (( $1 < ${#kinds[@]} )); then
+        kind=${kinds[$1]}
+    elif (( ${#kinds[@]} > 0 )) && [[ ${kinds[${#kinds[@]}-1]} == *+ ]]; then
+        kind=${kinds[${#kinds[@]}-1]}
+    fi
+    kind=${kind%%+}
+}
+
+_oci() {
+    local line=${COMP_LINE:0:COMP_POINT} cur= word command_path= root=%(root)s expect= index=0
+    local subcommands flags values positionals choices kind prefix
+    local -a words
+    COMPREPLY=()
+    # Split the line again, COMP_WORDS breaks references at the colon
+    read -ra words <<< "$line"
+    if [[ -n $line && $line != *[[:space:]] ]]; then
+        cur=${words[${#words[@]}-1]}
+        unset 'words[${#words[@]}-1]'
+    fi
+    _oci_spec ''
+    for word in "${words[@]:1}"; do
+        if [[ -n $expect ]]; then
+            [[ $expect == --root ]] && root=$word
+            expect=
+            continue
+        fi
+        case $word in
+        --root=*) root=${word#--root=} ;;
+        --*=*) ;;
+        -*) [[ " $values " == *" $word "* ]] && expect=$word ;;
+        *)
+            if [[ " $subcommands " == *" $word "* ]]; then
+                command_path=${command_path:+$command_path }$word
+                index=0
+                _oci_spec "$command_path"
+            else
+                _oci_kind $index
+                # The rest of the line belongs to the command in the container
+                [[ $kind == rest ]] && return
+                index=$((index + 1))
+            fi
+            ;;
+        esac
+    done
+    if [[ -n $expect ]]; then
+        _oci_choices "$command_path:$expect"
+        [[ -n $choices ]] && COMPREPLY=($(compgen -W "$choices" -- "$cur"))
+        return
+    fi
+    if [[ $cur == -* ]]; then
+        COMPREPLY=($(compgen -W "$flags" -- "$cur"))
+    elif [[ -n $subcommands ]]; then
+        COMPREPLY=($(compgen -W "$subcommands" -- "$cur"))
+    else
+        _oci_kind $index
+        if [[ $kind == choices ]]; then
+            _oci_choices "$command_path:$index"
+            COMPREPLY=($(compgen -W "$choices" -- "$cur"))
+        elif [[ ($kind == images || $kind == containers) && -r $root/cache/completion/$kind ]]; then
+            COMPREPLY=($(compgen -W "$(< "$root/cache/completion/$kind")" -- "$cur"))
+        fi
+    fi
+    if [[ $cur == *:* && $COMP_WORDBREAKS == *:* ]]; then
+        prefix=${cur%%"${cur##*:}"}
+        COMPREPLY=("${COMPREPLY[@]#"$prefix"}")
+    fi
+}
+
+complete -o default -F _oci oci
+'''
+
+ZSH_SCRIPT = '''#compdef oci
+# oci completion for zsh, load with: source <(oci completion zsh)
+
+_oci_spec() {
+    subcommands= flags= values= positionals=
+    case "$1" in
+%(specs)s
+    esac
+}
+
+_oci_choices() {
+    choices=
+    case "$1" in
+%(choices)s
+    esac
+}
+
+_oci_kind() {
+    local -a kinds
+    kinds=(${=positionals})
+    kind=
+    if (( $1 < ${#kinds} )); then
+        kind=${kinds[$1 + 1]}
+    elif (( ${#kinds} > 0 )) && [[ ${kinds[-1]} == *+ ]]; then
+        kind=${kinds[-1]}
+    fi
+    kind=${kind%%+}
+}
+
+_oci() {
+    local word command_path= root=%(root)s expect= index=0
+    local subcommands flags values positionals choices kind
+    local -a candidates
+    _oci_spec ''
+    for word in "${(@)words[2,CURRENT-1]}"; do
+        if [[ -n $expect ]]; then
+            [[ $expect == --root ]] && root=$word
+            expect=
+            continue
+        fi
+        case $word in
+        --root=*) root=${word#--root=} ;;
+        --*=*) ;;
+        -*) [[ " $values " == *" $word "* ]] && expect=$word ;;
+        *)
+            if [[ " $subcommands " == *" $word "* ]]; then
+                command_path=${command_path:+$command_path }$word
+                index=0
+                _oci_spec "$command_path"
+            else
+                _oci_kind $index
+                if [[ $kind == rest ]]; then
+                    _files
+                    return
+                fi
+                index=$((index + 1))
+            fi
+            ;;
+        esac
+    done
+    if [[ -n $expect ]]; then
+        _oci_choices "$command_path:$expect"
+        if [[ -n $choices ]]; then
+            candidates=(${=choices})
+            compadd -a candidates
+        else
+            _files
+        fi
+        return
+    fi
+    if [[ ${words[CURRENT]} == -* ]]; then
+        candidates=(${=flags})
+        compadd -a candidates
+    elif [[ -n $subcommands ]]; then
+        candidates=(${=subcommands})
+        compadd -a candidates
+    else
+        _oci_kind $index
+        if [[ $kind == choices ]]; then
+            _oci_choices "$command_path:$index"
+            candidates=(${=choices})
+            compadd -a candidates
+        elif [[ $kind == images || $kind == containers ]]; then
+            [[ -r $root/cache/completion/$kind ]] || return
+            candidates=(${(f)"$(< $root/cache/completion/$kind)"})
+            compadd -a candidates
+        else
+            _files
+        fi
+    fi
+}
+
+if [[ $funcstack[1] == _oci ]]; then
+    _oci "$@"
+else
+    compdef _oci oci
+fi
+'''
+
+FISH_SCRIPT = '''# oci completion for fish, load with: oci completion fish | source
+
+function __oci_spec -a path
+    set -g __oci_commands
+    set -g __oci_options
+    set -g __oci_values
+    set -g __oci_positionals
+    switch "$path"
+%(specs)s
+    end
+end
+
+function __oci_choices -a key
+    switch "$key"
+%(choices)s
+    end
+end
+
+function __oci_kind -a index
+    set -g __oci_kind ''
+    if test $index -lt (count $__oci_positionals)
+        set __oci_kind $__oci_positionals[(math $index + 1)]
+    else if test (count $__oci_positionals) -gt 0; and string match -q -- '*+' $__oci_positionals[-1]
+        set __oci_kind $__oci_positionals[-1]
+    end
+    set __oci_kind (string replace -- '+' '' "$__oci_kind")
+end
+
+function __oci_complete
+    set -l tokens (commandline -opc)
+    set -l cur (commandline -ct)
+    set -l path ''
+    set -l root %(root)s
+    set -l expect ''
+    set -l index 0
+    set -e tokens[1]
+    __oci_spec ''
+    for word in $tokens
+        if test -n "$expect"
+            test "$expect" = --root; and set root $word
+            set expect ''
+            continue
+        end
+        switch $word
+            case '--root=*'
+                set root (string replace -- '--root=' '' $word)
+            case '--*=*'
+            case '-*'
+                contains -- $word $__oci_values; and set expect $word
+            case '*'
+                if contains -- $word $__oci_commands
+                    set path (string trim -- "$path $word")
+                    set index 0
+                    __oci_spec $path
+                else
+                    __oci_kind $index
+                    if test "$__oci_kind" = rest
+                        __fish_complete_path $cur
+                        return
+                    end
+                    set index (math $index + 1)
+                end
+        end
+    end
+    if test -n "$expect"
+        set -l choices (__oci_choices "$path:$expect")
+        if test (count $choices) -gt 0
+            printf '%%s\\n' $choices
+        else
+            __fish_complete_path $cur
+        end
+        return
+    end
+    if string match -q -- '-*' $cur
+        printf '%%s\\n' $__oci_options
+    else if test (count $__oci_commands) -gt 0
+        printf '%%s\\n' $__oci_commands
+    else
+        __oci_kind $index
+        switch "$__oci_kind"
+            case choices
+                __oci_choices "$path:$index"
+            case images containers
+                test -r $root/cache/completion/$__oci_kind; and cat $root/cache/completion/$__oci_kind
+            case '*'
+                __fish_complete_path $cur
+        end
+    end
+end
+
+complete -c oci -f -a '(__oci_complete)'
+'''
+
+def fish_quote(value):
+    return "'%s'" % value.replace('\\', '\\\\').replace("'", "\\'")
+
+def get_sh_case(key, assignments):
+    return '    %s)\n%s\n        ;;' % (shlex.quote(key),
+        '\n'.join('        %s=%s' % (name, shlex.quote(' '.join(words)))
+        for (name, words) in assignments))
+
+def get_fish_case(key, lines):
+    return '        case %s\n%s' % (fish_quote(key),
+        '\n'.join('            ' + line for line in lines))
+
+def generate_sh(template, specs, root):
+    cases = []
+    choices = []
+    for spec in specs:
+        cases.append(get_sh_case(spec.path, [
+            ('subcommands', spec.commands),
+            ('flags', spec.options),
+            ('values', spec.value_options),
+            ('positionals', spec.positionals)
+        ]))
+        for (option, values) in spec.choices.items():
+            choices.append(get_sh_case('%s:%s' % (spec.path, option), [('choices', values)]))
+    return template % {
+        'specs': '\n'.join(cases),
+        'choices': '\n'.join(choices),
+        'root': shlex.quote(root)
+    }
+
+def generate_fish(specs, root):
+    cases = []
+    choices = []
+    for spec in specs:
+        lines = []
+        for (name, words) in (('commands', spec.commands), ('options', spec.options),
+                ('values', spec.value_options), ('positionals', spec.positionals)):
+            if len(words) != 0:
+                lines.append('set __oci_%s %s' % (name, ' '.join(fish_quote(word) for word in words)))
+        cases.append(get_fish_case(spec.path, lines or ['true']))
+        for (option, values) in spec.choices.items():
+            choices.append(get_fish_case('%s:%s' % (spec.path, option),
+                ["printf '%%s\\n' %s" % ' '.join(fish_quote(value) for value in values)]))
+    return FISH_SCRIPT % {
+        'specs': '\n'.join(cases),
+        'choices': '\n'.join(choices) or "        case ''",
+        'root': fish_quote(root)
+    }
+
+def generate_script(shell, parser, root):
+    specs = get_specs(parser)
+    if shell == 'bash':
+        return generate_sh(BASH_SCRIPT, specs, root)
+    if shell == 'zsh':
+        return generate_sh(ZSH_SCRIPT, specs, root)
+    return generate_fish(specs, root)
+
+class Completion:
+    @staticmethod
+    def init_parser(oci_subparsers):
+        parser = oci_subparsers.add_parser('completion',
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+            description='Generate the shell completion script, image and container '
+                'names are completed for the --root it is generated for unless '
+                'another one is given on the command line',
+            help='Generate the shell completion script')
+        parser.add_argument('shell',
+            help='Shell to generate the script for ("bash"|"zsh"|"fish")',
+            choices=[
+                'bash',
+                'zsh',
+                'fish'
+            ],
+            metavar='SHELL')
+
+    def __init__(self, options):
+        # Imported here, the command tables import this module
+        from .cli import CLI
+        # Names can be completed right away
+        for resolver_class in (ImageResolver, ContainerResolver):
+            if not Resolver.get_words_path(options.root, resolver_class.kind).exists():
+                resolver_class.invalidate(options.root)
+        print(generate_script(options.shell, CLI.get_parser(), options.root), end='')
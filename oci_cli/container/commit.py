@@ -0,0 +1,122 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import logging
+from oci_api import OCIError
+from oci_api.image import Distribution, config_add_diff
+from oci_api.runtime import ContainerUnknownException
+from oci_cli.image.dockerfile import DockerfileParseException, Expander, parse
+from oci_cli.image.layers import LayerMetadata, create_layer
+from oci_cli.util import journal
+from oci_cli.util.lock import StoreLock, TAGS, image_lock_name, layer_lock_name
+from oci_cli.util.resolver import ContainerResolver, ImageResolver
+
+log = logging.getLogger(__name__)
+
+CHANGE_INSTRUCTIONS = ('CMD', 'ENV', 'WORKDIR')
+
+class Commit:
+    @staticmethod
+    def init_parser(container_subparsers, parent_parser):
+        parser = container_subparsers.add_parser('commit',
+            parents=[parent_parser],
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+            description='Create a new image from a container\'s changes',
+            help='Create a new image from a container\'s changes')
+        parser.add_argument('-c', '--change',
+            action='append',
+            help='Apply Dockerfile instruction to the created image (CMD, ENV, WORKDIR)',
+            metavar='list')
+        parser.add_argument('-m', '--message', 
+            help='Commit message',
+            metavar='string')
+        parser.add_argument('container',
+            metavar='CONTAINER',
+            help='Name, hash or id of the container')
+        parser.add_argument('tag',
+            metavar='REPOSITORY[:TAG]',
+            nargs='?',
+            help='Name of the repository to commit to')
+
+    def __init__(self, options):
+        try:
+            changes = self.parse_changes(options.change)
+            container = ContainerResolver(options.root).resolve(options.container)
+            base_image = container.image
+            parent = base_image.layers[-1] if len(base_image.layers) != 0 else None
+            with StoreLock(options.root, image_lock_name(base_image), shared=True):
+                # The driver diffs the container filesystem against its parent
+                # snapshot, so only changed paths end up in the layer
+                with StoreLock(options.root, layer_lock_name(parent)):
+                    layer = create_layer(container.filesystem, parent,
+                        metadata=LayerMetadata(options.root))
+                config = base_image.config.copy()
+                config_add_diff(config, layer.diff_digest,
+                    options.message or 'oci container commit %s' % container.small_id)
+                with StoreLock(options.root, TAGS):
+                    distribution = Distribution()
+                    image = distribution.create_image(config, base_image.layers + [layer])
+                    self.apply_changes(image, config, changes)
+                    if options.tag is not None:
+                        distribution.add_tag(image, options.tag)
+                    ImageResolver.invalidate(options.root)
+                    journal.record(options.root, 'container', 'commit', container.id,
+                        name=container.name)
+                    journal.record(options.root, 'image', 'commit', image.id,
+                        name=options.tag or '')
+        except ContainerUnknownException:
+            log.error('Container (%s) does not exist' % options.container)
+            exit(-1)
+        except OCIError as e:
+            log.error(e.args[0])
+            exit(-1)
+        print(image.id)
+
+    def parse_changes(self, changes):
+        instructions = []
+        for change in changes or []:
+            for instruction in parse(change):
+                if instruction.command not in CHANGE_INSTRUCTIONS:
+                    raise DockerfileParseException('%s is not supported in --change, use one of %s' %
+                        (instruction.command, ', '.join(CHANGE_INSTRUCTIONS)))
+                instructions.append(instruction)
+        return instructions
+
+    def apply_changes(self, image, config, instructions):
+        image_config = config.get('Config') or {}
+        environment = {}
+        for variable in image_config.get('Env') or []:
+            (name, _, value) = variable.partition('=')
+            environment[name] = value
+        expander = Expander(environment)
+        environment_changed = False
+        for instruction in instructions:
+            if instruction.command == 'CMD':
+                command = instruction.arguments
+                if not instruction.json:
+                    command = ['/bin/sh', '-c'] + command
+                image.set_command(command)
+            elif instruction.command == 'ENV':
+                for (name, value) in instruction.arguments:
+                    environment[name] = expander.expand(value)
+                environment_changed = True
+            elif instruction.command == 'WORKDIR':
+                arguments = expander.expand_words(instruction.arguments)
+                if len(arguments) != 1:
+                    raise DockerfileParseException('Use WORKDIR <path> instead of WORKDIR %s' %
+                        ' '.join(instruction.arguments))
+                image.set_working_dir(arguments[0])
+        if environment_changed:
+            image.set_environment(['%s=%s' % item for item in environment.items()])
@@ -16,21 +16,41 @@ import subprocess
 import argparse
 import pathlib
 
+from .commit import Commit
+from .copy import Copy
 from .create import Create
+from .diff import Diff
+from .exec import Exec
+from .export import Export
 from .inspect import Inspect
+from .kill import Kill
 from .list import List
+from .logs import Logs
 from .remove import Remove
+from .restart import Restart
 from .run import Run
 from .start import Start
+from .stats import Stats
+from .stop import Stop
 
 class Container:
     commands = {
+        'commit': Commit,
+        'cp': Copy,
         'create': Create,
+        'diff': Diff,
+        'exec': Exec,
+        'export': Export,
         'inspect': Inspect,
+        'kill': Kill,
+        'logs': Logs,
         'ls': List,
+        'restart': Restart,
         'rm': Remove,
         'run': Run,
-        'start': Start
+        'start': Start,
+        'stats': Stats,
+        'stop': Stop
     }
 
     @staticmethod
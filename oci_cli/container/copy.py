@@ -0,0 +1,164 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import stat
+import argparse
+import logging
+from oci_api import OCIError
+from oci_api.runtime import ContainerUnknownException
+from oci_cli.util import journal
+from oci_cli.util.archive import TarExtractor, iterate_tree, write_members
+from oci_cli.util.resolver import ContainerResolver
+
+log = logging.getLogger(__name__)
+
+MAX_SYMLINKS = 40
+
+class CopyException(OCIError):
+    pass
+
+def resolve_in_root(root_path, path, follow_last=False):
+    """Host path of path inside the tree at root_path, following symbolic
+    links as if root_path was /, so they never lead out of it"""
+    root_path = os.path.realpath(root_path)
+    parts = [part for part in path.split('/') if part not in ('', '.')]
+    resolved = []
+    links = 0
+    while len(parts) != 0:
+        part = parts.pop(0)
+        if part == '..':
+            if len(resolved) != 0:
+                resolved.pop()
+            continue
+        host_path = os.path.join(root_path, *(resolved + [part]))
+        if os.path.islink(host_path) and (len(parts) != 0 or follow_last):
+            links += 1
+            if links > MAX_SYMLINKS:
+                raise CopyException('Too many levels of symbolic links in (%s)' % path)
+            target = os.readlink(host_path)
+            if target.startswith('/'):
+                resolved = []
+            parts = [part for part in target.split('/') if part not in ('', '.')] + parts
+            continue
+        resolved.append(part)
+    return os.path.join(root_path, *resolved)
+
+def split_location(location):
+    """(container reference, path) of CONTAINER:PATH, (None, path) for local
+    paths, which need a / or . in front when they hold a colon"""
+    if location == '-' or location.startswith(('/', '.')):
+        return (None, location)
+    (container_ref, colon, path) = location.partition(':')
+    if colon == '':
+        return (None, location)
+    return (container_ref, path)
+
+class Copy:
+    @staticmethod
+    def init_parser(container_subparsers, parent_parser):
+        parser = container_subparsers.add_parser('cp',
+            parents=[parent_parser],
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+            description='Copy files between a container and the local filesystem, '
+                'use - to read or write a tar archive on STDIN or STDOUT',
+            help='Copy files between a container and the local filesystem')
+        parser.add_argument('-L', '--follow-link',
+            help='Follow a symbolic link given as the source',
+            action='store_true')
+        parser.add_argument('source',
+            metavar='SRC_PATH|CONTAINER:SRC_PATH|-',
+            help='Path to copy from')
+        parser.add_argument('destination',
+            metavar='DEST_PATH|CONTAINER:DEST_PATH|-',
+            help='Path to copy to')
+
+    def __init__(self, options):
+        (source_container, source) = split_location(options.source)
+        (destination_container, destination) = split_location(options.destination)
+        if (source_container is None) == (destination_container is None):
+            log.error('Copy from or to a container, use CONTAINER:PATH on one side only')
+            exit(-1)
+        if source == '-' and destination == '-':
+            log.error('Only one side can be STDIN or STDOUT')
+            exit(-1)
+        container_ref = source_container or destination_container
+        try:
+            container = ContainerResolver(options.root).resolve(container_ref)
+            rootfs_path = str(container.filesystem.path)
+            if source_container is not None:
+                source_path = resolve_in_root(rootfs_path, source, options.follow_link)
+                self.copy(source_path, source, destination, options.follow_link)
+            else:
+                destination_path = resolve_in_root(rootfs_path, destination, True)
+                # A trailing / means the destination must be a directory
+                if destination.endswith('/'):
+                    destination_path = os.path.join(destination_path, '')
+                # Within the container, absolute links are resolved in the
+                # rootfs, members can not be written through them
+                self.copy(source, source, destination_path, options.follow_link,
+                    rootfs_path)
+                journal.record(options.root, 'container', 'copy', container.id,
+                    name=container.name, path=destination)
+        except ContainerUnknownException:
+            log.error('Container (%s) does not exist' % container_ref)
+            exit(-1)
+        except BrokenPipeError:
+            exit(-1)
+        except (OCIError, OSError) as e:
+            log.error('Could not copy (%s) to (%s): %s' % (options.source, options.destination,
+                e.args[0] if isinstance(e, OCIError) else e.strerror or e))
+            exit(-1)
+
+    def copy(self, source_path, source, destination_path, follow_link, rootfs_path=None):
+        """Stream source_path to destination_path, either of them can be -"""
+        if source_path == '-':
+            if not os.path.isdir(destination_path):
+                raise CopyException('Destination (%s) must be a directory' % destination_path)
+            TarExtractor(destination_path).extract(sys.stdin.buffer)
+            return
+        if follow_link:
+            source_path = os.path.realpath(source_path) if rootfs_path is None else source_path
+        if not os.path.lexists(source_path):
+            raise CopyException('Source (%s) does not exist' % source)
+        source_is_directory = os.path.isdir(source_path) and not os.path.islink(source_path)
+        # A source ending in /. copies the contents of the directory
+        contents_only = source_is_directory and (source.endswith('/.') or source == '.')
+        name = os.path.basename(os.path.normpath(source_path))
+        if destination_path == '-':
+            if sys.stdout.isatty():
+                raise CopyException('Refusing to write the archive to a terminal, redirect STDOUT')
+            write_members(iterate_tree(source_path, '' if contents_only else name),
+                sys.stdout.buffer)
+            sys.stdout.buffer.flush()
+            return
+        if os.path.isdir(destination_path):
+            target_path = destination_path
+            arcname = '' if contents_only else name
+        elif destination_path.endswith('/'):
+            raise CopyException('Destination directory (%s) does not exist' % destination_path)
+        elif os.path.lexists(destination_path) and source_is_directory:
+            raise CopyException('Can not copy a directory over the file (%s)' % destination_path)
+        else:
+            target_path = os.path.dirname(destination_path)
+            arcname = os.path.basename(destination_path)
+            if not os.path.isdir(target_path):
+                raise CopyException('Destination directory (%s) does not exist' % target_path)
+            if contents_only:
+                os.mkdir(destination_path, stat.S_IMODE(os.stat(source_path).st_mode))
+                (target_path, arcname) = (destination_path, '')
+        # Both ends are local, members go straight from one to the other and
+        # file data is copied by the kernel
+        TarExtractor(target_path).extract_members(iterate_tree(source_path, arcname))
@@ -15,7 +15,10 @@
 import argparse
 import logging
 from oci_api.runtime import Runtime
-from oci_api.image import Distribution
+from oci_cli.util import journal
+from oci_cli.util.lock import StoreLock, CONTAINERS, image_lock_name
+from oci_cli.util.resolver import ImageResolver, ContainerResolver
+from .logdriver import parse_log_options, save_log_config
 
 log = logging.getLogger(__name__)
 
@@ -27,6 +30,10 @@ class Create:
             formatter_class=argparse.ArgumentDefaultsHelpFormatter,
             description='Create a new container',
             help='Create a new container')
+        parser.add_argument('--log-opt',
+            action='append',
+            help='Log driver options (max-size=10m, max-file=3)',
+            metavar='list')
         parser.add_argument('--name', 
             help='Assign a name to the container',
             metavar='string')
@@ -46,13 +53,20 @@ class Create:
 
     def __init__(self, options):
         try:
-            image = Distribution().get_image(options.image)
+            log_config = parse_log_options(options.log_opt)
+            image = ImageResolver(options.root).resolve(options.image)
             runtime = Runtime()
-            container =  Runtime().create_container(
-                image,
-                name=options.name, 
-                command=options.cmd,
-                workdir=options.workdir)
+            with StoreLock(options.root, image_lock_name(image), shared=True), \
+                    StoreLock(options.root, CONTAINERS):
+                container = runtime.create_container(
+                    image,
+                    name=options.name, 
+                    command=options.cmd,
+                    workdir=options.workdir)
+                ContainerResolver.invalidate(options.root)
+                journal.record(options.root, 'container', 'create', container.id,
+                    name=container.name)
+                save_log_config(options.root, container, log_config)
         except Exception as e:
             raise e
             log.error(e.args[0])
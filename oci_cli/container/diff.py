@@ -0,0 +1,50 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import logging
+from oci_api import OCIError
+from oci_api.image import Distribution
+from oci_api.runtime import ContainerUnknownException
+from oci_cli.image.files import diff_indexes, get_image_index, index_tree
+from oci_cli.util.resolver import ContainerResolver
+
+log = logging.getLogger(__name__)
+
+class Diff:
+    @staticmethod
+    def init_parser(container_subparsers, parent_parser):
+        parser = container_subparsers.add_parser('diff',
+            parents=[parent_parser],
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+            description='Show the files added (A), changed (C) and deleted (D) in a container\'s filesystem',
+            help='Show the changes of files in a container\'s filesystem')
+        parser.add_argument('container',
+            metavar='CONTAINER',
+            help='Name, hash or id of the container')
+
+    def __init__(self, options):
+        try:
+            container = ContainerResolver(options.root).resolve(options.container)
+            image_index = get_image_index(options.root, Distribution(), container.image)
+            # Only the files whose size or time changed since the image are read
+            container_index = index_tree(container.filesystem.path, image_index)
+        except ContainerUnknownException:
+            log.error('Container (%s) does not exist' % options.container)
+            exit(-1)
+        except OCIError as e:
+            log.error(e.args[0])
+            exit(-1)
+        for (change, path) in diff_indexes(image_index, container_index):
+            print('%s %s' % (change, path))
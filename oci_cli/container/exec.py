@@ -0,0 +1,117 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import argparse
+import logging
+from oci_api import OCIError
+from oci_api.runtime import ContainerUnknownException
+from oci_cli.util import journal
+from oci_cli.util.resolver import ContainerResolver
+from .execution import ExecException, ExecHelper, Terminal, connect_helper, \
+    get_process_config, run_process, run_with_helper
+from .process import get_pid
+
+log = logging.getLogger(__name__)
+
+class Exec:
+    @staticmethod
+    def init_parser(container_subparsers, parent_parser):
+        parser = container_subparsers.add_parser('exec',
+            parents=[parent_parser],
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+            description='Run a command in a running container',
+            help='Run a command in a running container')
+        parser.add_argument('-i', '--interactive',
+            help='Keep STDIN open', 
+            action='store_true')
+        parser.add_argument('-t', '--tty',
+            help='Allocate a pseudo-TTY', 
+            action='store_true')
+        parser.add_argument('-e', '--env',
+            action='append',
+            help='Set environment variables',
+            metavar='list')
+        parser.add_argument('-w', '--workdir', 
+            help='Working directory inside the container',
+            metavar='string')
+        parser.add_argument('--helper',
+            help='Keep an exec helper in the container so later execs start faster', 
+            action='store_true')
+        parser.add_argument('container',
+            metavar='CONTAINER',
+            help='Name, hash or id of the container')
+        parser.add_argument('cmd',
+            nargs=argparse.REMAINDER,
+            metavar='COMMAND [ARG [ARG ...]]',
+            help='Command to run')
+
+    def __init__(self, options):
+        if len(options.cmd) == 0:
+            log.error('No command specified')
+            exit(-1)
+        try:
+            exit_code = self.exec_command(options)
+        except ContainerUnknownException:
+            log.error('Container (%s) does not exist' % options.container)
+            exit(-1)
+        except OCIError as e:
+            log.error(e.args[0])
+            exit(-1)
+        exit(exit_code)
+
+    def exec_command(self, options):
+        resolver = ContainerResolver(options.root)
+        helper = None
+        if options.helper:
+            # A running helper needs only the id, not the runtime
+            container_id = resolver.resolve_id(options.container)
+            helper = connect_helper(options.root, container_id)
+        if helper is None:
+            container = resolver.resolve(options.container)
+            container_id = container.id
+            pid = get_pid(container)
+            if pid is None:
+                raise ExecException('Container (%s) is not running' % options.container)
+            process_config = get_process_config(container)
+            if options.helper:
+                ExecHelper(options.root, container_id, pid, process_config).start()
+                helper = connect_helper(options.root, container_id)
+                if helper is None:
+                    raise ExecException('Could not connect to the exec helper of container (%s)' %
+                        options.container)
+
+        def execute(fds, terminal):
+            if helper is not None:
+                return run_with_helper(helper, options.cmd, options.env, options.workdir,
+                    fds, terminal)
+            return run_process(pid, process_config, options.cmd, options.env, options.workdir,
+                fds, terminal)
+
+        journal.record(options.root, 'container', 'exec_start', container_id,
+            command=' '.join(options.cmd))
+        if options.tty:
+            with Terminal(options.interactive) as terminal:
+                exit_code = execute(terminal.get_fds(), True)
+        elif options.interactive:
+            exit_code = execute((0, 1, 2), False)
+        else:
+            null_fd = os.open(os.devnull, os.O_RDONLY)
+            try:
+                exit_code = execute((null_fd, 1, 2), False)
+            finally:
+                os.close(null_fd)
+        journal.record(options.root, 'container', 'exec_die', container_id,
+            exitCode=exit_code)
+        return exit_code
@@ -0,0 +1,406 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Execution of additional processes in running containers.
+
+A process is run in a container by forking, moving into the namespaces of
+the container init process, where the platform has them, and into its root
+directory, then executing the command. Doing that for every exec means
+loading the runtime and the container state each time, so a container may
+instead keep an exec helper: a small process that has already entered the
+container and listens on <root>/exec/<container id>.sock. Clients send it
+the command together with their stdio file descriptors and it replies with
+the exit status of the forked process. The helper exits when the container
+process does.
+"""
+
+import os
+import sys
+import array
+import json
+import errno
+import fcntl
+import select
+import signal
+import socket
+import struct
+import pathlib
+import logging
+import threading
+import termios
+import tty
+from oci_api import OCIError
+
+log = logging.getLogger(__name__)
+
+NAMESPACES = ['ipc', 'uts', 'net', 'pid', 'mnt']
+MAX_REQUEST_SIZE = 64 * 1024
+ALIVE_INTERVAL = 1.0
+READ_SIZE = 64 * 1024
+
+class ExecException(OCIError):
+    pass
+
+def get_helper_path(root, container_id):
+    return pathlib.Path(root, 'exec', container_id + '.sock')
+
+def setns(fd):
+    if hasattr(os, 'setns'):
+        os.setns(fd, 0)
+        return
+    import ctypes
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.setns(fd, 0) != 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error))
+
+def enter_container(pid):
+    """Move the calling process into the container of process pid.
+
+    Namespaces only apply to processes forked afterwards for pid, the caller
+    must fork before executing anything.
+    """
+    proc_path = pathlib.Path('/proc', str(pid))
+    try:
+        root_fd = os.open(proc_path.joinpath('root'), os.O_RDONLY)
+    except OSError as e:
+        raise ExecException('Could not enter container process (%d): %s' % (pid, e.strerror))
+    namespace_fds = []
+    try:
+        for namespace in NAMESPACES:
+            namespace_path = proc_path.joinpath('ns', namespace)
+            try:
+                if os.stat(namespace_path).st_ino == os.stat('/proc/self/ns/' + namespace).st_ino:
+                    continue
+                namespace_fds.append(os.open(namespace_path, os.O_RDONLY))
+            except FileNotFoundError:
+                # No namespaces on this platform, the root directory is enough
+                continue
+        for fd in namespace_fds:
+            setns(fd)
+        os.fchdir(root_fd)
+        os.chroot('.')
+    except OSError as e:
+        raise ExecException('Could not enter container process (%d): %s' % (pid, e.strerror))
+    finally:
+        for fd in namespace_fds + [root_fd]:
+            os.close(fd)
+
+def get_process_config(container):
+    process = container.config.get('Process') or {}
+    environment = {}
+    for variable in process.get('Env') or []:
+        (name, _, value) = variable.partition('=')
+        environment[name] = value
+    return {
+        'Env': environment,
+        'Cwd': process.get('Cwd') or '/'
+    }
+
+def exec_child(args, environment, cwd, fds, terminal=False):
+    """In a forked child, replace it with args, never returns"""
+    try:
+        for (index, fd) in enumerate(fds):
+            os.dup2(fd, index)
+        if terminal:
+            os.setsid()
+            fcntl.ioctl(0, termios.TIOCSCTTY, 0)
+        os.closerange(3, os.sysconf('SC_OPEN_MAX'))
+        signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+        os.chdir(cwd)
+        os.execvpe(args[0], args, environment)
+    except OSError as e:
+        os.write(2, ('exec %s: %s\n' % (args[0], e.strerror)).encode())
+        os._exit(126 if e.errno != errno.ENOENT else 127)
+    except BaseException:
+        os._exit(126)
+
+def get_exit_code(status):
+    if os.WIFSIGNALED(status):
+        return 128 + os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+def send_fds(connection, data, fds):
+    connection.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))])
+
+def recv_fds(connection, size, max_fds):
+    fds = array.array('i')
+    (data, ancillary_data, _, _) = connection.recvmsg(size,
+        socket.CMSG_LEN(max_fds * fds.itemsize))
+    for (level, message_type, message_data) in ancillary_data:
+        if level == socket.SOL_SOCKET and message_type == socket.SCM_RIGHTS:
+            fds.frombytes(message_data[:len(message_data) - len(message_data) % fds.itemsize])
+    return (data, list(fds))
+
+def merge_environment(base, overrides):
+    environment = dict(base)
+    for variable in overrides or []:
+        (name, _, value) = variable.partition('=')
+        environment[name] = value
+    return environment
+
+def run_process(pid, process_config, args, env=None, workdir=None, fds=(0, 1, 2), terminal=False):
+    """Run args in the container of process pid without a helper"""
+    environment = merge_environment(process_config['Env'], env)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    (ready_read, ready_write) = os.pipe()
+    child_pid = os.fork()
+    if child_pid == 0:
+        os.close(ready_read)
+        try:
+            enter_container(pid)
+        except ExecException as e:
+            os.write(ready_write, e.args[0].encode())
+            os._exit(126)
+        os.close(ready_write)
+        # The pid namespace applies from the next fork on
+        grandchild_pid = os.fork()
+        if grandchild_pid == 0:
+            exec_child(args, environment, workdir or process_config['Cwd'], fds, terminal)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        (_, status) = os.waitpid(grandchild_pid, 0)
+        os._exit(get_exit_code(status))
+    os.close(ready_write)
+    # Without a terminal the process shares our process group and gets ^C itself
+    handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        with os.fdopen(ready_read, 'rb') as ready_file:
+            error = ready_file.read()
+        (_, status) = os.waitpid(child_pid, 0)
+    finally:
+        signal.signal(signal.SIGINT, handler)
+    if len(error) != 0:
+        raise ExecException(error.decode())
+    return get_exit_code(status)
+
+class ExecHelper:
+    def __init__(self, root, container_id, pid, process_config):
+        self.helper_path = get_helper_path(root, container_id)
+        self.pid = pid
+        self.process_config = process_config
+        self.server = None
+
+    def start(self):
+        """Fork the helper in a new session, returns once it is serving"""
+        self.helper_path.parent.mkdir(parents=True, exist_ok=True)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        (ready_read, ready_write) = os.pipe()
+        child_pid = os.fork()
+        if child_pid == 0:
+            os.close(ready_read)
+            os.setsid()
+            if os.fork() != 0:
+                os._exit(0)
+            null_fd = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(null_fd, fd)
+            try:
+                self.listen()
+                enter_container(self.pid)
+            except (OSError, ExecException) as e:
+                message = e.args[0] if isinstance(e, ExecException) else str(e)
+                os.write(ready_write, message.encode())
+                self.close()
+                os._exit(1)
+            os.close(ready_write)
+            try:
+                self.serve()
+            finally:
+                self.close()
+                os._exit(0)
+        os.close(ready_write)
+        with os.fdopen(ready_read, 'rb') as ready_file:
+            error = ready_file.read()
+        os.waitpid(child_pid, 0)
+        if len(error) != 0:
+            raise ExecException('Could not start exec helper: %s' % error.decode())
+
+    def listen(self):
+        try:
+            self.helper_path.unlink()
+        except FileNotFoundError:
+            pass
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Bound before entering the container, the path is outside of it
+        self.server.bind(str(self.helper_path))
+        self.server.listen(64)
+        self.server.settimeout(ALIVE_INTERVAL)
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        try:
+            os.unlink(self.helper_path)
+        except OSError:
+            pass
+
+    def serve(self):
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        while is_alive(self.pid):
+            try:
+                (connection, _) = self.server.accept()
+            except socket.timeout:
+                continue
+            connection.settimeout(None)
+            thread = threading.Thread(target=self.handle, args=(connection,), daemon=True)
+            thread.start()
+
+    def handle(self, connection):
+        with connection:
+            try:
+                (data, fds) = recv_fds(connection, MAX_REQUEST_SIZE, 4)
+                request = json.loads(data)
+            except (OSError, ValueError):
+                return
+            try:
+                environment = merge_environment(self.process_config['Env'], request.get('Env'))
+                cwd = request.get('WorkingDir') or self.process_config['Cwd']
+                child_pid = os.fork()
+                if child_pid == 0:
+                    exec_child(request['Args'], environment, cwd, fds, request.get('Tty'))
+            finally:
+                for fd in fds:
+                    os.close(fd)
+            connection.sendall(json.dumps({'Pid': child_pid}).encode() + b'\n')
+            (_, status) = os.waitpid(child_pid, 0)
+            try:
+                connection.sendall(json.dumps({'ExitCode': get_exit_code(status)}).encode() + b'\n')
+            except OSError:
+                pass
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def connect_helper(root, container_id):
+    """Connect to the exec helper of a container, None if it is not running"""
+    helper_path = get_helper_path(root, container_id)
+    helper = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        helper.connect(str(helper_path))
+    except (FileNotFoundError, ConnectionRefusedError):
+        helper.close()
+        return None
+    return helper
+
+def run_with_helper(helper, args, env=None, workdir=None, fds=(0, 1, 2), terminal=False):
+    """Run args through a connected exec helper, returns the exit code"""
+    with helper:
+        request = {
+            'Args': args,
+            'Env': env or [],
+            'WorkingDir': workdir,
+            'Tty': terminal
+        }
+        send_fds(helper, json.dumps(request).encode(), list(fds))
+        with helper.makefile('rb') as replies:
+            started = replies.readline()
+            if len(started) == 0:
+                raise ExecException('Exec helper closed the connection')
+            # Forward signals the way a parent would to its child
+            child_pid = json.loads(started)['Pid']
+            handlers = forward_signals(child_pid)
+            try:
+                finished = replies.readline()
+            finally:
+                for (sig, handler) in handlers.items():
+                    signal.signal(sig, handler)
+        if len(finished) == 0:
+            raise ExecException('Exec helper exited before the process')
+        return json.loads(finished)['ExitCode']
+
+def forward_signals(child_pid):
+    def forward(sig, frame):
+        try:
+            os.kill(child_pid, sig)
+        except ProcessLookupError:
+            pass
+    handlers = {}
+    for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+        handlers[sig] = signal.signal(sig, forward)
+    return handlers
+
+class Terminal:
+    """Pseudo terminal for exec -t, copied to and from the user's stdio"""
+    def __init__(self, interactive):
+        (self.master_fd, self.slave_fd) = os.openpty()
+        self.interactive = interactive
+        self.saved_mode = None
+        self.relay = None
+        (self.stop_read, self.stop_write) = os.pipe()
+
+    def __enter__(self):
+        self.resize()
+        if self.interactive and os.isatty(0):
+            self.saved_mode = termios.tcgetattr(0)
+            tty.setraw(0)
+        signal.signal(signal.SIGWINCH, lambda sig, frame: self.resize())
+        self.relay = threading.Thread(target=self.copy, daemon=True)
+        self.relay.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        os.close(self.slave_fd)
+        os.write(self.stop_write, b'x')
+        self.relay.join()
+        if self.saved_mode is not None:
+            termios.tcsetattr(0, termios.TCSAFLUSH, self.saved_mode)
+        for fd in (self.master_fd, self.stop_read, self.stop_write):
+            os.close(fd)
+
+    def get_fds(self):
+        return (self.slave_fd, self.slave_fd, self.slave_fd)
+
+    def resize(self):
+        if not os.isatty(1):
+            return
+        size = fcntl.ioctl(1, termios.TIOCGWINSZ, struct.pack('HHHH', 0, 0, 0, 0))
+        fcntl.ioctl(self.master_fd, termios.TIOCSWINSZ, size)
+
+    def copy(self):
+        inputs = [self.master_fd, self.stop_read]
+        if self.interactive:
+            inputs.append(0)
+        stopping = False
+        while True:
+            timeout = 0 if stopping else None
+            (readable, _, _) = select.select(inputs, [], [], timeout)
+            if len(readable) == 0:
+                return
+            if self.stop_read in readable:
+                inputs.remove(self.stop_read)
+                stopping = True
+            if self.master_fd in readable:
+                try:
+                    data = os.read(self.master_fd, READ_SIZE)
+                except OSError:
+                    # EIO once every slave end is closed
+                    return
+                if len(data) == 0:
+                    return
+                os.write(1, data)
+            if 0 in readable:
+                data = os.read(0, READ_SIZE)
+                if len(data) == 0:
+                    inputs.remove(0)
+                else:
+                    os.write(self.master_fd, data)
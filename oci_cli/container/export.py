@@ -0,0 +1,69 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import argparse
+import logging
+from oci_api import OCIError
+from oci_api.runtime import ContainerUnknownException
+from oci_cli.util.archive import write_tar
+from oci_cli.util.compression import add_compression_arguments, open_compressed
+from oci_cli.util.resolver import ContainerResolver
+
+log = logging.getLogger(__name__)
+
+class Export:
+    @staticmethod
+    def init_parser(container_subparsers, parent_parser):
+        parser = container_subparsers.add_parser('export',
+            parents=[parent_parser],
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+            description='Export a container\'s filesystem as a tar archive (streamed to STDOUT by default)',
+            help='Export a container\'s filesystem as a tar archive')
+        parser.add_argument('-o', '--output', 
+            help='Write to a file',
+            default='STDOUT',
+            metavar='string')
+        add_compression_arguments(parser)
+        parser.add_argument('container',
+            metavar='CONTAINER',
+            help='Name, hash or id of the container')
+
+    def __init__(self, options):
+        if options.output == 'STDOUT' and sys.stdout.isatty():
+            log.error('Refusing to write the archive to a terminal, use -o or redirect STDOUT')
+            exit(-1)
+        try:
+            container = ContainerResolver(options.root).resolve(options.container)
+            log.debug('Start exporting container (%s) to %s' % (container.small_id, options.output))
+            if options.output == 'STDOUT':
+                self.export(container, sys.stdout.buffer, options)
+            else:
+                with open(options.output, 'wb') as output_file:
+                    self.export(container, output_file, options)
+            log.debug('Finish exporting container (%s)' % container.small_id)
+        except ContainerUnknownException:
+            log.error('Container (%s) does not exist' % options.container)
+            exit(-1)
+        except BrokenPipeError:
+            exit(-1)
+        except OCIError as e:
+            log.error(e.args[0])
+            exit(-1)
+
+    def export(self, container, output_file, options):
+        with open_compressed(output_file, options.compression,
+                options.compression_level) as compressed_file:
+            write_tar(container.filesystem.path, compressed_file)
+        output_file.flush()
@@ -13,10 +13,12 @@
 # limitations under the License.
 
 
-import json
 import argparse
 import logging
-from oci_api.runtime import Runtime, ContainerUnknownException
+from oci_api import OCIError
+from oci_api.runtime import ContainerUnknownException
+from oci_cli.util import fastjson
+from oci_cli.util.resolver import ContainerResolver
 
 log = logging.getLogger(__name__)
 
@@ -34,12 +36,15 @@ class Inspect:
             help='Name of the container to inspect')
  
     def __init__(self, options):
-        runtime = Runtime()
+        resolver = ContainerResolver(options.root)
         for container_ref in options.container:
             try:
-                container = runtime.get_container(container_ref)
+                container = resolver.resolve(container_ref)
                 container_json = container.config.to_dict(use_real_name=True)
-                print(json.dumps(container_json, indent=4, default=str))
+                print(fastjson.dumps(container_json, indent=True, default=str))
             except ContainerUnknownException:
                 log.error('Container (%s) does not exist' % container_ref)
                 exit(-1)
+            except OCIError as e:
+                log.error(e.args[0])
+                exit(-1)
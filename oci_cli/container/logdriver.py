@@ -0,0 +1,403 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Container log driver.
+
+While a container runs, a driver process reads its stdout and stderr from
+pipes and appends one record per line to <root>/logs/<container id>:
+
+    <epoch seconds> <stdout|stderr> <line>
+
+Files rotate at a maximum size. Every INDEX_INTERVAL bytes the time and
+offset of a record go into a binary index next to the file, so --since finds
+its starting point with a binary search and --tail reads backwards from the
+end. Followers connect to a unix socket served by the driver, which first
+sends the current file offset and then every new record.
+"""
+
+import os
+import sys
+import json
+import time
+import select
+import socket
+import struct
+import bisect
+import shutil
+import pathlib
+import logging
+from oci_api import OCIError
+from oci_cli.util.lock import close_inherited_locks
+
+log = logging.getLogger(__name__)
+
+LOG_FILE_NAME = 'container.log'
+INDEX_SUFFIX = '.idx'
+SOCKET_NAME = 'follow.sock'
+CONFIG_FILE_NAME = 'config.json'
+INDEX_RECORD = struct.Struct('<dQ')
+INDEX_INTERVAL = 64 * 1024
+MAX_LINE_SIZE = 16 * 1024
+READ_SIZE = 64 * 1024
+DEFAULT_MAX_SIZE = 10 * 1024 * 1024
+DEFAULT_MAX_FILES = 3
+
+def get_log_path(root, container):
+    return pathlib.Path(root, 'logs', container.id)
+
+def remove_file(file_path):
+    try:
+        file_path.unlink()
+    except FileNotFoundError:
+        pass
+
+def remove_logs(root, container):
+    shutil.rmtree(get_log_path(root, container), ignore_errors=True)
+
+def parse_size(value):
+    units = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+    value = value.strip().lower().rstrip('b')
+    if len(value) != 0 and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+def parse_log_options(log_options):
+    config = {
+        'max-size': DEFAULT_MAX_SIZE,
+        'max-file': DEFAULT_MAX_FILES
+    }
+    for log_option in log_options or []:
+        (name, _, value) = log_option.partition('=')
+        try:
+            if name == 'max-size':
+                config[name] = parse_size(value)
+            elif name == 'max-file':
+                config[name] = int(value)
+            else:
+                raise OCIError('Unknown log option (%s)' % name)
+        except ValueError:
+            raise OCIError('Invalid value for log option (%s)' % log_option)
+    return config
+
+def save_log_config(root, container, config):
+    log_path = get_log_path(root, container)
+    log_path.mkdir(parents=True, exist_ok=True)
+    with log_path.joinpath(CONFIG_FILE_NAME).open('w') as config_file:
+        json.dump(config, config_file)
+
+def load_log_config(log_path):
+    try:
+        with log_path.joinpath(CONFIG_FILE_NAME).open() as config_file:
+            return json.load(config_file)
+    except (OSError, ValueError):
+        return {'max-size': DEFAULT_MAX_SIZE, 'max-file': DEFAULT_MAX_FILES}
+
+class LogWriter:
+    def __init__(self, log_path, max_size=DEFAULT_MAX_SIZE, max_files=DEFAULT_MAX_FILES):
+        self.log_path = log_path
+        self.max_size = max_size
+        self.max_files = max(max_files, 1)
+        self.file_path = log_path.joinpath(LOG_FILE_NAME)
+        self.index_path = log_path.joinpath(LOG_FILE_NAME + INDEX_SUFFIX)
+        self.log_file = None
+        self.index_file = None
+        self.offset = 0
+        self.indexed_offset = 0
+        self.followers = []
+        self.server = None
+
+    def open(self):
+        self.log_path.mkdir(parents=True, exist_ok=True)
+        self.log_file = self.file_path.open('ab', buffering=0)
+        self.index_file = self.index_path.open('ab', buffering=0)
+        self.offset = self.log_file.tell()
+        self.indexed_offset = self.offset - INDEX_INTERVAL if self.offset != 0 else -INDEX_INTERVAL
+
+    def close(self):
+        for follower in self.followers:
+            follower.close()
+        if self.server is not None:
+            self.server.close()
+            remove_file(self.log_path.joinpath(SOCKET_NAME))
+        if self.log_file is not None:
+            self.log_file.close()
+            self.index_file.close()
+
+    def listen(self):
+        socket_path = self.log_path.joinpath(SOCKET_NAME)
+        remove_file(socket_path)
+        try:
+            self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.server.bind(str(socket_path))
+            self.server.listen(16)
+        except OSError as e:
+            log.debug('Log followers not available (%s)' % e)
+            self.server = None
+
+    def rotate(self):
+        self.log_file.close()
+        self.index_file.close()
+        for index in range(self.max_files - 1, 0, -1):
+            source = LOG_FILE_NAME if index == 1 else '%s.%d' % (LOG_FILE_NAME, index - 1)
+            target = '%s.%d' % (LOG_FILE_NAME, index)
+            for suffix in ('', INDEX_SUFFIX):
+                source_path = self.log_path.joinpath(source + suffix)
+                if source_path.exists():
+                    source_path.replace(self.log_path.joinpath(target + suffix))
+        if self.max_files == 1:
+            remove_file(self.file_path)
+            remove_file(self.index_path)
+        self.log_file = self.file_path.open('wb', buffering=0)
+        self.index_file = self.index_path.open('wb', buffering=0)
+        self.offset = 0
+        self.indexed_offset = -INDEX_INTERVAL
+
+    def write(self, stream, line):
+        now = time.time()
+        record = b'%.6f %s %s' % (now, stream, line)
+        if not record.endswith(b'\n'):
+            record += b'\n'
+        if self.offset != 0 and self.offset + len(record) > self.max_size:
+            self.rotate()
+        if self.offset - self.indexed_offset >= INDEX_INTERVAL:
+            self.index_file.write(INDEX_RECORD.pack(now, self.offset))
+            self.indexed_offset = self.offset
+        self.log_file.write(record)
+        self.offset += len(record)
+        for follower in self.followers[:]:
+            try:
+                follower.sendall(record)
+            except OSError:
+                self.followers.remove(follower)
+                follower.close()
+
+    def accept(self):
+        (follower, _) = self.server.accept()
+        try:
+            follower.sendall(b'%d\n' % self.offset)
+            self.followers.append(follower)
+        except OSError:
+            follower.close()
+
+    def run(self, streams):
+        """streams maps a readable fd to (stream name, fd to copy output to or None)"""
+        self.open()
+        self.listen()
+        buffers = {fd: b'' for fd in streams}
+        try:
+            while len(buffers) != 0:
+                fds = list(buffers)
+                if self.server is not None:
+                    fds.append(self.server.fileno())
+                (readable, _, _) = select.select(fds, [], [])
+                for fd in readable:
+                    if self.server is not None and fd == self.server.fileno():
+                        self.accept()
+                        continue
+                    (stream, tee_fd) = streams[fd]
+                    data = os.read(fd, READ_SIZE)
+                    if len(data) == 0:
+                        if len(buffers[fd]) != 0:
+                            self.write(stream, buffers[fd])
+                        del buffers[fd]
+                        continue
+                    if tee_fd is not None:
+                        os.write(tee_fd, data)
+                    buffers[fd] = self.write_lines(stream, buffers[fd] + data)
+        finally:
+            self.close()
+
+    def write_lines(self, stream, data):
+        start = 0
+        while True:
+            end = data.find(b'\n', start)
+            if end == -1:
+                break
+            self.write(stream, data[start:end + 1])
+            start = end + 1
+        rest = data[start:]
+        while len(rest) >= MAX_LINE_SIZE:
+            self.write(stream, rest[:MAX_LINE_SIZE])
+            rest = rest[MAX_LINE_SIZE:]
+        return rest
+
+def start_logged(root, container, start, detach=False):
+    """Call start() with stdout and stderr going through the log driver.
+
+    When detached, start() runs in a new session and this returns at once.
+    """
+    log_path = get_log_path(root, container)
+    config = load_log_config(log_path)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    if detach:
+        if os.fork() != 0:
+            return
+        close_inherited_locks()
+        os.setsid()
+        null_fd = os.open(os.devnull, os.O_RDWR)
+        os.dup2(null_fd, 0)
+        tee = (None, None)
+    else:
+        tee = (os.dup(1), os.dup(2))
+    (out_read, out_write) = os.pipe()
+    (err_read, err_write) = os.pipe()
+    driver_pid = os.fork()
+    if driver_pid == 0:
+        close_inherited_locks()
+        os.close(out_write)
+        os.close(err_write)
+        writer = LogWriter(log_path, config['max-size'], config['max-file'])
+        try:
+            writer.run({
+                out_read: (b'stdout', tee[0]),
+                err_read: (b'stderr', tee[1])
+            })
+        finally:
+            os._exit(0)
+    os.close(out_read)
+    os.close(err_read)
+    saved_fds = (os.dup(1), os.dup(2))
+    os.dup2(out_write, 1)
+    os.dup2(err_write, 2)
+    os.close(out_write)
+    os.close(err_write)
+    try:
+        start()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved_fds[0], 1)
+        os.dup2(saved_fds[1], 2)
+        for fd in saved_fds:
+            os.close(fd)
+        for fd in tee:
+            if fd is not None:
+                os.close(fd)
+        os.waitpid(driver_pid, 0)
+        if detach:
+            os._exit(0)
+
+class LogReader:
+    def __init__(self, log_path):
+        self.log_path = log_path
+
+    def get_files(self):
+        """Log files from oldest to newest"""
+        files = []
+        index = 1
+        while True:
+            file_path = self.log_path.joinpath('%s.%d' % (LOG_FILE_NAME, index))
+            if not file_path.is_file():
+                break
+            files.append(file_path)
+            index += 1
+        files.reverse()
+        file_path = self.log_path.joinpath(LOG_FILE_NAME)
+        if file_path.is_file():
+            files.append(file_path)
+        return files
+
+    def read_index(self, file_path):
+        try:
+            data = file_path.with_name(file_path.name + INDEX_SUFFIX).read_bytes()
+        except OSError:
+            return []
+        count = len(data) // INDEX_RECORD.size
+        return [INDEX_RECORD.unpack_from(data, i * INDEX_RECORD.size) for i in range(count)]
+
+    def since_offset(self, file_path, since):
+        """Offset of an indexed record at or before the first one after since"""
+        index = self.read_index(file_path)
+        position = bisect.bisect_left([entry[0] for entry in index], since)
+        if position == 0:
+            return 0
+        return index[position - 1][1]
+
+    def records(self, since=None, until_offset=None):
+        files = self.get_files()
+        for (file_index, file_path) in enumerate(files):
+            is_last = file_index == len(files) - 1
+            with file_path.open('rb') as log_file:
+                if since is not None:
+                    log_file.seek(self.since_offset(file_path, since))
+                limit = until_offset if is_last and until_offset is not None else None
+                for line in log_file:
+                    if limit is not None:
+                        if log_file.tell() > limit:
+                            break
+                    record = parse_record(line)
+                    if record is None or (since is not None and record[0] < since):
+                        continue
+                    yield record
+
+    def tail(self, count, since=None, until_offset=None):
+        """Last count records, reading the files backwards from the end"""
+        lines = []
+        files = self.get_files()
+        for (file_index, file_path) in reversed(list(enumerate(files))):
+            is_last = file_index == len(files) - 1
+            with file_path.open('rb') as log_file:
+                end = log_file.seek(0, os.SEEK_END)
+                if is_last and until_offset is not None:
+                    end = min(end, until_offset)
+                lines = self.read_backwards(log_file, end, count - len(lines)) + lines
+            if len(lines) >= count:
+                break
+        records = [parse_record(line) for line in lines[-count:] if len(line) != 0]
+        return [record for record in records
+            if record is not None and (since is None or record[0] >= since)]
+
+    def read_backwards(self, log_file, end, count):
+        data = b''
+        position = end
+        while position > 0 and data.count(b'\n') <= count:
+            size = min(READ_SIZE, position)
+            position -= size
+            log_file.seek(position)
+            data = log_file.read(size) + data
+        lines = data.split(b'\n')
+        if lines[-1] == b'':
+            lines.pop()
+        if position > 0:
+            # The first line may have been cut
+            lines = lines[1:]
+        return [line + b'\n' for line in lines[-count:]]
+
+    def follow(self):
+        """Connect to the log driver, returns (socket, offset) or None if not running"""
+        follower = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            follower.connect(str(self.log_path.joinpath(SOCKET_NAME)))
+        except OSError:
+            follower.close()
+            return None
+        header = b''
+        while not header.endswith(b'\n'):
+            data = follower.recv(1)
+            if len(data) == 0:
+                follower.close()
+                return None
+            header += data
+        return (follower, int(header))
+
+def parse_record(line):
+    records = line.split(b' ', 2)
+    if len(records) != 3:
+        return None
+    try:
+        timestamp = float(records[0])
+    except ValueError:
+        return None
+    return (timestamp, records[1].decode('ascii', 'replace'), records[2])
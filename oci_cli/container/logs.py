@@ -0,0 +1,102 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import select
+import argparse
+import logging
+from datetime import datetime, timezone
+from oci_api import OCIError
+from oci_api.runtime import ContainerUnknownException
+from oci_cli.util import parse_since
+from oci_cli.util.resolver import ContainerResolver
+from .logdriver import LogReader, get_log_path, parse_record
+
+log = logging.getLogger(__name__)
+
+class Logs:
+    @staticmethod
+    def init_parser(container_subparsers, parent_parser):
+        parser = container_subparsers.add_parser('logs',
+            parents=[parent_parser],
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+            description='Fetch the logs of a container',
+            help='Fetch the logs of a container')
+        parser.add_argument('-f', '--follow',
+            help='Follow log output', 
+            action='store_true')
+        parser.add_argument('--since',
+            help='Show logs since timestamp (e.g. 2020-05-25T10:00:00) or relative (e.g. 42m for 42 minutes)',
+            type=parse_since,
+            metavar='string')
+        parser.add_argument('-n', '--tail',
+            help='Number of lines to show from the end of the logs',
+            default='all',
+            metavar='string')
+        parser.add_argument('-t', '--timestamps',
+            help='Show timestamps', 
+            action='store_true')
+        parser.add_argument('container',
+            metavar='CONTAINER',
+            help='Name, hash or id of the container')
+
+    def __init__(self, options):
+        try:
+            container = ContainerResolver(options.root).resolve(options.container)
+        except ContainerUnknownException:
+            log.error('Container (%s) does not exist' % options.container)
+            exit(-1)
+        except OCIError as e:
+            log.error(e.args[0])
+            exit(-1)
+        self.timestamps = options.timestamps
+        reader = LogReader(get_log_path(options.root, container))
+        following = None
+        until_offset = None
+        if options.follow:
+            following = reader.follow()
+            if following is not None:
+                until_offset = following[1]
+        if options.tail == 'all':
+            records = reader.records(options.since, until_offset)
+        else:
+            records = reader.tail(int(options.tail), options.since, until_offset)
+        for record in records:
+            self.print_record(record)
+        if following is not None:
+            self.follow(following[0])
+
+    def follow(self, follower):
+        data = b''
+        with follower:
+            while True:
+                select.select([follower], [], [])
+                chunk = follower.recv(65536)
+                if len(chunk) == 0:
+                    break
+                lines = (data + chunk).split(b'\n')
+                data = lines.pop()
+                for line in lines:
+                    record = parse_record(line + b'\n')
+                    if record is not None:
+                        self.print_record(record)
+
+    def print_record(self, record):
+        (timestamp, stream, line) = record
+        output = sys.stderr.buffer if stream == 'stderr' else sys.stdout.buffer
+        if self.timestamps:
+            created = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+            output.write(created.strftime('%Y-%m-%dT%H:%M:%S.%fZ ').encode('ascii'))
+        output.write(line)
+        output.flush()
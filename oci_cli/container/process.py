@@ -0,0 +1,225 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Signalling of container processes, shared by stop, kill and restart.
+
+States are queried concurrently, signals are sent to the pid from the OCI
+state of each running container, and exits are waited for all together
+until a shared deadline, using pidfds where the platform has them.
+"""
+
+import os
+import time
+import select
+import signal
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from oci_api import OCIError
+from oci_cli.util import journal
+from oci_cli.util.resolver import ContainerResolver
+
+log = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.05
+KILL_TIMEOUT = 10
+MAX_WORKERS = 32
+
+class SignalResult:
+    def __init__(self, container, status, elapsed=0.0):
+        self.container = container
+        self.status = status
+        self.elapsed = elapsed
+
+    def to_dict(self, no_trunc=False):
+        return {
+            'container id': self.container.id if no_trunc else self.container.small_id,
+            'names': self.container.name or '',
+            'result': self.status,
+            'time': '%.2fs' % self.elapsed
+        }
+
+def parse_signal(value):
+    value = value.upper()
+    if value.isdigit():
+        try:
+            return signal.Signals(int(value))
+        except ValueError:
+            raise OCIError('Invalid signal (%s)' % value)
+    if not value.startswith('SIG'):
+        value = 'SIG' + value
+    try:
+        return signal.Signals[value]
+    except KeyError:
+        raise OCIError('Invalid signal (%s)' % value)
+
+def get_pid(container):
+    state = container.state()
+    if state.get('Status') != 'running':
+        return None
+    return state.get('Pid')
+
+def get_pids(containers):
+    if len(containers) == 0:
+        return []
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(containers))) as executor:
+        return list(executor.map(get_pid, containers))
+
+def send_signal(pid, sig):
+    try:
+        os.kill(pid, sig)
+        return True
+    except ProcessLookupError:
+        return False
+
+def wait_for_exit(pids, deadline):
+    """Wait until the processes in pids ({key: pid}) exit or the deadline.
+
+    Returns ({key: exit time}, {key: pid} of the ones still running).
+    """
+    exited = {}
+    pidfds = {}
+    polled = {}
+    for (key, pid) in pids.items():
+        try:
+            pidfds[os.pidfd_open(pid)] = key
+        except ProcessLookupError:
+            exited[key] = time.monotonic()
+        except (AttributeError, OSError):
+            polled[key] = pid
+    try:
+        while (len(pidfds) != 0 or len(polled) != 0):
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            timeout = deadline - now
+            if len(polled) != 0:
+                timeout = min(timeout, POLL_INTERVAL)
+            if len(pidfds) != 0:
+                (readable, _, _) = select.select(list(pidfds), [], [], timeout)
+            else:
+                time.sleep(timeout)
+                readable = []
+            now = time.monotonic()
+            for fd in readable:
+                exited[pidfds.pop(fd)] = now
+                os.close(fd)
+            for (key, pid) in list(polled.items()):
+                if not is_alive(pid):
+                    exited[key] = now
+                    del polled[key]
+    finally:
+        remaining = {key: pids[key] for key in list(pidfds.values()) + list(polled)}
+        for fd in pidfds:
+            os.close(fd)
+    return (exited, remaining)
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+def signal_containers(containers, sig, timeout=None):
+    """Signal all containers at once, with a timeout wait for all of them to
+    exit and send SIGKILL to the ones still running at the deadline."""
+    start = time.monotonic()
+    results = {}
+    running = {}
+    for (container, pid) in zip(containers, get_pids(containers)):
+        if pid is None:
+            results[container.id] = SignalResult(container, 'not running')
+        elif send_signal(pid, sig):
+            running[container.id] = pid
+        else:
+            results[container.id] = SignalResult(container, 'exited')
+    containers_by_id = {container.id: container for container in containers}
+    if timeout is None:
+        for container_id in running:
+            results[container_id] = SignalResult(containers_by_id[container_id],
+                sig.name, time.monotonic() - start)
+    else:
+        (exited, remaining) = wait_for_exit(running, start + timeout)
+        for (container_id, exit_time) in exited.items():
+            results[container_id] = SignalResult(containers_by_id[container_id],
+                'stopped', exit_time - start)
+        if len(remaining) != 0:
+            log.warning('Killing %d containers that did not stop in %ds' % (len(remaining), timeout))
+            for pid in remaining.values():
+                send_signal(pid, signal.SIGKILL)
+            (exited, remaining) = wait_for_exit(remaining, time.monotonic() + KILL_TIMEOUT)
+            for (container_id, exit_time) in exited.items():
+                results[container_id] = SignalResult(containers_by_id[container_id],
+                    'killed', exit_time - start)
+            for container_id in remaining:
+                results[container_id] = SignalResult(containers_by_id[container_id],
+                    'failed', time.monotonic() - start)
+    return [results[container.id] for container in containers]
+
+def record_results(root, results):
+    for result in results:
+        container = result.container
+        if result.status == 'stopped':
+            journal.record(root, 'container', 'stop', container.id, name=container.name)
+        elif result.status == 'killed':
+            journal.record(root, 'container', 'kill', container.id, name=container.name,
+                signal='SIGKILL')
+        elif result.status.startswith('SIG'):
+            journal.record(root, 'container', 'kill', container.id, name=container.name,
+                signal=result.status)
+
+def add_selection_arguments(parser):
+    parser.add_argument('-a', '--all',
+        help='Select all running containers', 
+        action='store_true')
+    parser.add_argument('--filter',
+        action='append',
+        help='Select containers matching conditions (id=, name=, status=)',
+        metavar='list')
+    parser.add_argument('container',
+        nargs='*',
+        metavar='CONTAINER',
+        help='Name, hash or id of the container')
+
+def select_containers(options):
+    resolver = ContainerResolver(options.root)
+    containers = []
+    if options.all or options.filter:
+        containers = list(resolver.get_objects())
+        filters = []
+        for container_filter in options.filter or []:
+            (name, _, value) = container_filter.partition('=')
+            if name not in ('id', 'name', 'status'):
+                raise OCIError('Invalid filter (%s)' % name)
+            filters.append((name, value))
+        containers = [container for container in containers
+            if match_filters(container, filters)]
+    for container_ref in options.container:
+        containers.append(resolver.resolve(container_ref))
+    unique_containers = {}
+    for container in containers:
+        unique_containers.setdefault(container.id, container)
+    return list(unique_containers.values())
+
+def match_filters(container, filters):
+    for (name, value) in filters:
+        if name == 'id' and not container.id.startswith(value):
+            return False
+        if name == 'name' and value not in (container.name or ''):
+            return False
+        if name == 'status' and container.state().get('Status') != value:
+            return False
+    return True
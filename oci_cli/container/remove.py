@@ -17,6 +17,10 @@ import argparse
 import logging
 from oci_api import OCIError
 from oci_api.runtime import Runtime, ContainerUnknownException
+from oci_cli.util import journal
+from oci_cli.util.lock import StoreLock, CONTAINERS, container_lock_name
+from oci_cli.util.resolver import AmbiguousReferenceException, ContainerResolver
+from .logdriver import remove_logs
 
 log = logging.getLogger(__name__)
 
@@ -35,12 +39,28 @@ class Remove:
             help='Name of the container to remove')
  
     def __init__(self, options):
+        runtime = Runtime()
+        resolver = ContainerResolver(options.root, runtime)
         for container_ref in options.container:
             try:
-                Runtime().remove_container(container_ref)
+                container = resolver.resolve(container_ref)
+                with StoreLock(options.root, container_lock_name(container)), \
+                        StoreLock(options.root, CONTAINERS):
+                    if container.state().get('Status') == 'running':
+                        log.error('Container (%s) is running, stop it before removing it' %
+                            container_ref)
+                        exit(-1)
+                    runtime.remove_container(container.id)
+                    remove_logs(options.root, container)
+                    ContainerResolver.invalidate(options.root)
+                    journal.record(options.root, 'container', 'destroy', container.id,
+                        name=container.name)
             except ContainerUnknownException:
                 log.error('Container (%s) does not exist' % container_ref)
                 exit(-1)
+            except AmbiguousReferenceException as e:
+                log.error(e.args[0])
+                exit(-1)
             except OCIError as e:
                 raise e
                 log.error('Could not remove container (%s)' % container_ref)
@@ -14,6 +14,11 @@
 
 import argparse
 from oci_api.runtime import Runtime
+from oci_cli.util import journal
+from oci_cli.util.lock import StoreLock, CONTAINERS, image_lock_name
+from oci_cli.util.resolver import ImageResolver, ContainerResolver
+from .logdriver import parse_log_options, remove_logs, save_log_config
+from .start import start_container
 
 class Run:
     @staticmethod
@@ -23,6 +28,13 @@ class Run:
             formatter_class=argparse.ArgumentDefaultsHelpFormatter,
             description='Run a command in a new container',
             help='Run a command in a new container')
+        parser.add_argument('-d', '--detach',
+            help='Run container in background and print container ID', 
+            action='store_true')
+        parser.add_argument('--log-opt',
+            action='append',
+            help='Log driver options (max-size=10m, max-file=3)',
+            metavar='list')
         parser.add_argument('--name', 
             help='Assign a name to the container',
             metavar='string')
@@ -42,11 +54,29 @@ class Run:
 
     def __init__(self, options):
         runtime = Runtime()
-        container = runtime.create_container(
-            options.image,
-            name=options.name, 
-            command=options.cmd,
-            workdir=options.workdir)
-        container.start()
-        if options.rm:
-            runtime.remove_container(container.id)
\ No newline at end of file
+        log_config = parse_log_options(options.log_opt)
+        image = ImageResolver(options.root).resolve(options.image)
+        with StoreLock(options.root, image_lock_name(image), shared=True), \
+                StoreLock(options.root, CONTAINERS):
+            container = runtime.create_container(
+                image,
+                name=options.name, 
+                command=options.cmd,
+                workdir=options.workdir)
+            ContainerResolver.invalidate(options.root)
+            journal.record(options.root, 'container', 'create', container.id,
+                name=container.name)
+            save_log_config(options.root, container, log_config)
+
+        def remove_container():
+            with StoreLock(options.root, CONTAINERS):
+                runtime.remove_container(container.id)
+                remove_logs(options.root, container)
+                ContainerResolver.invalidate(options.root)
+                journal.record(options.root, 'container', 'destroy', container.id,
+                    name=container.name)
+
+        start_container(options.root, container, options.detach,
+            on_exit=remove_container if options.rm else None)
+        if options.detach:
+            print(container.id)
@@ -15,10 +15,32 @@
 import argparse
 import logging
 from oci_api import OCIError
-from oci_api.runtime import Runtime, ContainerUnknownException
+from oci_api.runtime import ContainerUnknownException
+from oci_cli.util import journal
+from oci_cli.util.lock import StoreLock, container_lock_name
+from oci_cli.util.resolver import AmbiguousReferenceException, ContainerResolver
+from .logdriver import start_logged
 
 log = logging.getLogger(__name__)
 
+def start_container(root, container, detach=False, on_exit=None):
+    # The lock covers the change of state only, it is not held while the
+    # container runs or rm would wait for it to exit
+    with StoreLock(root, container_lock_name(container)):
+        if container.state().get('Status') == 'running':
+            raise OCIError('Container (%s) is already running' % container.small_id)
+        journal.record(root, 'container', 'start', container.id, name=container.name)
+
+    def start():
+        try:
+            container.start()
+        finally:
+            journal.record(root, 'container', 'die', container.id, name=container.name)
+        if on_exit is not None:
+            on_exit()
+
+    start_logged(root, container, start, detach)
+
 class Start:
     @staticmethod
     def init_parser(container_subparsers, parent_parser):
@@ -27,20 +49,26 @@ class Start:
             formatter_class=argparse.ArgumentDefaultsHelpFormatter,
             description='Start one or more stopped containers',
             help='Start one or more stopped containers')
+        parser.add_argument('-d', '--detach',
+            help='Start in background and do not attach STDOUT/STDERR', 
+            action='store_true')
         parser.add_argument('container',
             nargs='*',
             metavar='CONTAINER',
             help='Name, hash or id of the container to start')
 
     def __init__(self, options):
-        runtime = Runtime()
+        resolver = ContainerResolver(options.root)
         for container_ref in options.container:
             try:
-                container = runtime.get_container(container_ref)
-                container.start()
+                container = resolver.resolve(container_ref)
+                start_container(options.root, container, options.detach)
             except ContainerUnknownException:
                 log.error('Container (%s) does not exist' % container_ref)
                 exit(-1)
+            except AmbiguousReferenceException as e:
+                log.error(e.args[0])
+                exit(-1)
             except OCIError as e:
                 raise e
                 log.error('Could not start container (%s)' % container_ref)
@@ -0,0 +1,240 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+import argparse
+import humanize
+import logging
+from oci_api import OCIError
+from oci_api.util.print import print_table
+from oci_cli.util.format import Template
+from .process import get_pids, select_containers
+
+log = logging.getLogger(__name__)
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+READ_SIZE = 4096
+
+class ContainerSampler:
+    """Reads the counters of one container through file descriptors opened
+    once and read again with pread on every sample."""
+    def __init__(self, container, pid):
+        self.container = container
+        self.pid = pid
+        self.fds = {}
+        self.last_cpu = None
+        self.last_time = None
+        cgroup_path = self.get_cgroup_path(pid)
+        if cgroup_path is not None:
+            for name in ('cpu.stat', 'memory.current', 'memory.max', 'io.stat', 'pids.current'):
+                self.open(name, os.path.join(cgroup_path, name))
+        if 'cpu.stat' not in self.fds:
+            # No cgroup v2, the counters of the container process itself
+            self.open('stat', '/proc/%d/stat' % pid)
+            self.open('statm', '/proc/%d/statm' % pid)
+            self.open('io', '/proc/%d/io' % pid)
+
+    def open(self, name, path):
+        try:
+            self.fds[name] = os.open(path, os.O_RDONLY)
+        except OSError:
+            pass
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds = {}
+
+    @staticmethod
+    def get_cgroup_path(pid):
+        try:
+            with open('/proc/%d/cgroup' % pid) as cgroup_file:
+                for line in cgroup_file:
+                    if line.startswith('0::'):
+                        return CGROUP_ROOT + line[3:].strip()
+        except OSError:
+            pass
+        return None
+
+    def read(self, name):
+        fd = self.fds.get(name)
+        if fd is None:
+            return None
+        return os.pread(fd, READ_SIZE, 0).decode('ascii', 'replace')
+
+    def sample(self):
+        """Returns the counters, raises OSError when the container is gone"""
+        now = time.monotonic()
+        if 'cpu.stat' in self.fds:
+            cpu = int(self.read('cpu.stat').split('\n', 1)[0].split()[1]) / 1e6
+            # Missing without the memory or io controllers and in the root cgroup
+            memory = self.read('memory.current')
+            memory = int(memory) if memory is not None else None
+            limit = self.read('memory.max')
+            limit = None if limit is None or limit.startswith('max') else int(limit)
+            (read_bytes, write_bytes) = self.parse_io_stat(self.read('io.stat'))
+            pids = self.read('pids.current')
+            pids = int(pids) if pids is not None else None
+        else:
+            stat = self.read('stat')
+            fields = stat[stat.rindex(')') + 2:].split()
+            cpu = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+            memory = int(self.read('statm').split()[1]) * PAGE_SIZE
+            limit = None
+            (read_bytes, write_bytes) = self.parse_proc_io(self.read('io'))
+            pids = int(fields[17])
+        cpu_percent = None
+        if self.last_cpu is not None and now > self.last_time:
+            cpu_percent = (cpu - self.last_cpu) / (now - self.last_time) * 100
+        self.last_cpu = cpu
+        self.last_time = now
+        return {
+            'ID': self.container.id,
+            'Name': self.container.name or '',
+            'CPUPerc': cpu_percent,
+            'MemUsage': memory,
+            'MemLimit': limit,
+            'MemPerc': memory * 100 / limit if memory is not None and limit else None,
+            'BlockRead': read_bytes,
+            'BlockWrite': write_bytes,
+            'PIDs': pids
+        }
+
+    @staticmethod
+    def parse_io_stat(data):
+        if data is None:
+            return (None, None)
+        read_bytes = 0
+        write_bytes = 0
+        for line in data.splitlines():
+            for field in line.split()[1:]:
+                if field.startswith('rbytes='):
+                    read_bytes += int(field[7:])
+                elif field.startswith('wbytes='):
+                    write_bytes += int(field[7:])
+        return (read_bytes, write_bytes)
+
+    @staticmethod
+    def parse_proc_io(data):
+        values = {}
+        for line in (data or '').splitlines():
+            (name, _, value) = line.partition(':')
+            values[name] = value.strip()
+        return (int(values.get('read_bytes', 0)), int(values.get('write_bytes', 0)))
+
+class Stats:
+    @staticmethod
+    def init_parser(container_subparsers, parent_parser):
+        parser = container_subparsers.add_parser('stats',
+            parents=[parent_parser],
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+            description='Display a live stream of container resource usage statistics',
+            help='Display container resource usage statistics')
+        parser.add_argument('--format',
+            help='Format each sample using a Go template, "{{json .}}" prints NDJSON',
+            metavar='string')
+        parser.add_argument('-i', '--interval',
+            help='Seconds between samples',
+            type=float,
+            default=1.0,
+            metavar='float')
+        parser.add_argument('--no-stream',
+            help='Disable streaming stats and only pull the first result', 
+            action='store_true')
+        parser.add_argument('--no-trunc',
+            help='Don\'t truncate output', 
+            action='store_true')
+        parser.add_argument('container',
+            nargs='*',
+            metavar='CONTAINER',
+            help='Name, hash or id of the container, all running containers by default')
+
+    def __init__(self, options):
+        options.all = len(options.container) == 0
+        options.filter = None
+        try:
+            containers = select_containers(options)
+        except OCIError as e:
+            log.error(e.args[0])
+            exit(-1)
+        self.template = None
+        if options.format is not None:
+            self.template = Template(options.format)
+        self.no_trunc = options.no_trunc
+        samplers = [ContainerSampler(container, pid)
+            for (container, pid) in zip(containers, get_pids(containers)) if pid is not None]
+        # CPU usage needs two samples
+        self.sample(samplers)
+        next_time = time.monotonic() + min(options.interval, 0.5 if options.no_stream else options.interval)
+        try:
+            while len(samplers) != 0:
+                time.sleep(max(next_time - time.monotonic(), 0))
+                next_time += options.interval
+                self.print_samples(self.sample(samplers))
+                if options.no_stream:
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for sampler in samplers:
+                sampler.close()
+
+    def sample(self, samplers):
+        samples = []
+        for sampler in samplers[:]:
+            try:
+                samples.append(sampler.sample())
+            except (OSError, ValueError, IndexError):
+                # The container stopped
+                sampler.close()
+                samplers.remove(sampler)
+        return samples
+
+    def print_samples(self, samples):
+        if self.template is not None:
+            lines = [self.template.render(sample) for sample in samples]
+            sys.stdout.write('\n'.join(lines) + '\n')
+            sys.stdout.flush()
+            return
+        rows = []
+        for sample in samples:
+            rows.append({
+                'container id': sample['ID'] if self.no_trunc else sample['ID'][:12],
+                'name': sample['Name'],
+                'cpu %': format_percent(sample['CPUPerc']),
+                'mem usage / limit': '%s / %s' % (format_size(sample['MemUsage']),
+                    format_size(sample['MemLimit'] or None)),
+                'mem %': format_percent(sample['MemPerc']),
+                'block i/o': '%s / %s' % (format_size(sample['BlockRead']),
+                    format_size(sample['BlockWrite'])),
+                'pids': sample['PIDs'] if sample['PIDs'] is not None else '--'
+            })
+        if sys.stdout.isatty():
+            sys.stdout.write('\x1b[2J\x1b[H')
+        print_table(rows)
+        sys.stdout.flush()
+
+def format_size(value):
+    if value is None:
+        return '--'
+    return humanize.naturalsize(value)
+
+def format_percent(value):
+    if value is None:
+        return '--'
+    return '%.2f%%' % value
@@ -0,0 +1,56 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import logging
+from oci_api import OCIError
+from oci_api.util.print import print_table
+from .process import add_selection_arguments, parse_signal, record_results, \
+    select_containers, signal_containers
+
+log = logging.getLogger(__name__)
+
+class Stop:
+    @staticmethod
+    def init_parser(container_subparsers, parent_parser):
+        parser = container_subparsers.add_parser('stop',
+            parents=[parent_parser],
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+            description='Stop one or more running containers',
+            help='Stop one or more running containers')
+        parser.add_argument('-s', '--signal',
+            help='Signal to send to the containers',
+            default='SIGTERM',
+            metavar='string')
+        parser.add_argument('-t', '--time',
+            help='Seconds to wait for all containers to stop before killing them',
+            type=int,
+            default=10,
+            metavar='int')
+        parser.add_argument('--no-trunc',
+            help='Don\'t truncate output', 
+            action='store_true')
+        add_selection_arguments(parser)
+
+    def __init__(self, options):
+        try:
+            containers = select_containers(options)
+            results = signal_containers(containers, parse_signal(options.signal), options.time)
+            record_results(options.root, results)
+        except OCIError as e:
+            log.error(e.args[0])
+            exit(-1)
+        print_table([result.to_dict(options.no_trunc) for result in results])
+        if any(result.status == 'failed' for result in results):
+            exit(-1)
@@ -0,0 +1,103 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import logging
+from datetime import datetime, timezone
+from oci_cli.util import parse_since
+from oci_cli.util.format import Template
+from oci_cli.util.journal import JournalReader
+
+log = logging.getLogger(__name__)
+
+class Events:
+    @staticmethod
+    def init_parser(oci_subparsers):
+        parser = oci_subparsers.add_parser('events',
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+            description='Get real time events from the server',
+            help='Get real time events')
+        parser.add_argument('-f', '--filter',
+            action='append',
+            help='Filter output based on conditions provided (type=, event=, id=, name=)',
+            metavar='list')
+        parser.add_argument('--format',
+            help='Format the output using the given Go template',
+            metavar='string')
+        parser.add_argument('--since',
+            help='Show all events created since timestamp',
+            type=parse_since,
+            metavar='string')
+        parser.add_argument('--until',
+            help='Stream events until this timestamp',
+            type=parse_since,
+            metavar='string')
+
+    def __init__(self, options):
+        filters = []
+        for event_filter in options.filter or []:
+            (name, _, value) = event_filter.partition('=')
+            if name not in ('type', 'event', 'id', 'name'):
+                log.error('Invalid filter (%s)' % name)
+                exit(-1)
+            filters.append((name, value))
+        self.filters = filters
+        self.template = None
+        if options.format is not None:
+            self.template = Template(options.format)
+        reader = JournalReader(options.root)
+        position = reader.snapshot()
+        try:
+            for event in reader.read(options.since, options.until, position):
+                self.print_event(event)
+            if options.until is not None and options.until <= datetime.now(tz=timezone.utc).timestamp():
+                return
+            for event in reader.follow(position):
+                if options.until is not None and event['time'] > options.until:
+                    break
+                self.print_event(event)
+        except KeyboardInterrupt:
+            pass
+
+    def match(self, event):
+        for (name, value) in self.filters:
+            if name == 'type' and event['type'] != value:
+                return False
+            if name == 'event' and event['action'] != value:
+                return False
+            if name == 'id' and not event['id'].startswith(value):
+                return False
+            if name == 'name' and (event.get('attributes') or {}).get('name') != value:
+                return False
+        return True
+
+    def print_event(self, event):
+        if not self.match(event):
+            return
+        if self.template is not None:
+            print(self.template.render({
+                'Time': event['time'],
+                'Type': event['type'],
+                'Action': event['action'],
+                'ID': event['id'],
+                'Attributes': event.get('attributes') or {}
+            }), flush=True)
+            return
+        created = datetime.fromtimestamp(event['time'], tz=timezone.utc)
+        attributes = event.get('attributes') or {}
+        line = '%s %s %s %s' % (created.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            event['type'], event['action'], event['id'])
+        if len(attributes) != 0:
+            line += ' (%s)' % ', '.join('%s=%s' % item for item in sorted(attributes.items()))
+        print(line, flush=True)
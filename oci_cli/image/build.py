@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import argparse
+import json
 import pathlib
 import tempfile
 import logging
@@ -21,11 +22,19 @@ from oci_api import OCIError
 from oci_api.image import ImageUnknownException, Distribution, create_config, config_set_command, \
     config_add_diff
 from oci_api.graph import Driver
-from oci_api.util.file import untar, cp
+from oci_api.util.file import cp
+from oci_cli.util import journal
+from oci_cli.util.archive import extract_tar, open_tar_archive
+from oci_cli.util.lock import StoreLock, TAGS, image_lock_name, layer_lock_name
+from oci_cli.util.resolver import ImageResolver
+from .layers import LayerIndex, LayerMetadata, create_layer
+from .squash import squash_image
+from .dockerfile import DockerfileParseException, Expander, EXPANDABLE, KEY_VALUE_FORM, \
+    parse_file
 
 log = logging.getLogger(__name__)
 
-class DockerfileParseException(OCIError):
+class UnsupportedInstructionException(OCIError):
     pass
 
 class Build:
@@ -36,6 +45,10 @@ class Build:
             formatter_class=argparse.ArgumentDefaultsHelpFormatter,
             description='Build an image from a Dockerfile',
             help='Build an image from a Dockerfile')
+        parser.add_argument('--build-arg',
+            action='append',
+            help='Set build-time variables',
+            metavar='list')
         parser.add_argument('-f', '--file', 
             help='Name of the Dockerfile (relative to PATH)',
             default='Dockerfile',
@@ -44,6 +57,9 @@ class Build:
             action='append',
             help='Name and optionally a tag in the "name:tag" format',
             metavar='list')
+        parser.add_argument('--squash',
+            help='Merge the layers created by the build into one layer',
+            action='store_true')
         parser.add_argument('path',
             metavar='PATH|URL|-',
             help='Path or URL of the context, or "-" for the standard input')
@@ -53,7 +69,7 @@ class Build:
             raise NotImplementedError()
         else:
             url = urlparse(options.path)
-            if url.scheme is not '':
+            if url.scheme != '':
                 raise NotImplementedError()
             self.context_path = pathlib.Path(options.path)
         dockerfile_path = pathlib.Path(options.file)
@@ -61,83 +77,237 @@ class Build:
             dockerfile_path = self.context_path.joinpath(dockerfile_path)
         if not dockerfile_path.is_file():
             log.error('Dockerfile (%s) does not exist' % dockerfile_path)
+            exit(-1)
         log.debug('Reading dockerfile (%s)' % dockerfile_path.resolve())
         self.layers = None
+        self.base_layer_count = 0
         self.config = None
-        with dockerfile_path.open() as dockerfile:
-            for line in dockerfile:
-                stripped_line = line.strip()
-                if len(stripped_line) == 0 or stripped_line.startswith('#'):
-                    continue
-                while stripped_line.endswith('\\'):
-                    stripped_line = stripped_line[:-1] + dockerfile.readline().strip()
-                records = stripped_line.split(' ', 1)
-                if len(records) != 2:
-                    raise DockerfileParseException('Malformed command (%s)' % line)
-                command = records[0]
-                self.do_command(command, records[1])
-        image = Distribution().create_image(self.config, self.layers)
-        if options.tag is not None:
-            for tag in options.tag:
-                Distribution().add_tag(image, tag)
+        self.build_args = {}
+        for build_arg in options.build_arg or []:
+            (name, _, value) = build_arg.partition('=')
+            self.build_args[name] = value
+        self.arguments = {}
+        self.global_arguments = {}
+        self.environment = {}
+        self.working_dir = None
+        self.shell = ['/bin/sh', '-c']
+        self.layer_index = None
+        self.layer_metadata = LayerMetadata(options.root)
+        self.root = options.root
+        self.base_image_lock = None
+        try:
+            cache_path = pathlib.Path(options.root, 'cache', 'dockerfile')
+            dockerfile = parse_file(dockerfile_path, cache_path)
+            self.expander = Expander({}, dockerfile.escape)
+            for instruction in dockerfile:
+                self.do_command(instruction)
+            if self.config is None:
+                raise DockerfileParseException('No FROM instruction found')
+            squash = options.squash and len(self.layers) - self.base_layer_count > 1
+            with StoreLock(options.root, TAGS):
+                distribution = Distribution()
+                image_ids = set(distribution.images.keys())
+                image = distribution.create_image(self.config, self.layers)
+                if len(self.environment) != 0:
+                    image.set_environment(['%s=%s' % item for item in self.environment.items()])
+                if self.working_dir is not None:
+                    image.set_working_dir(self.working_dir)
+            if squash:
+                image = self.squash(image, image.id not in image_ids)
+            with StoreLock(options.root, TAGS):
+                if options.tag is not None:
+                    for tag in options.tag:
+                        Distribution().add_tag(image, tag)
+                ImageResolver.invalidate(options.root)
+                journal.record(options.root, 'image', 'build', image.id,
+                    name=','.join(options.tag or []))
+        except OCIError as e:
+            log.error(e.args[0])
+            exit(-1)
+        finally:
+            if self.base_image_lock is not None:
+                self.base_image_lock.release()
         log.info('Created image (%s)' % image.id)
 
-    def do_command(self, command, line):
+    def squash(self, image, created):
+        """Replace image with one whose layers from the build are merged, then
+        remove image, when the build created it, and the layers no other
+        image uses"""
+        distribution = Distribution()
+        (config, layers) = squash_image(self.root, distribution, image, self.base_layer_count,
+            self.layer_metadata)
+        with StoreLock(self.root, TAGS):
+            squashed_image = distribution.create_image(config, layers)
+        if not created:
+            return squashed_image
+        with StoreLock(self.root, image_lock_name(image)), StoreLock(self.root, TAGS):
+            distribution.remove_image(image)
+        used_layers = set(layer.id for other_image in distribution.images.values()
+            for layer in other_image.layers)
+        driver = Driver()
+        # Top down, a layer is the parent of the ones above it
+        for index in reversed(range(self.base_layer_count, len(image.layers))):
+            layer = image.layers[index]
+            if layer.id in used_layers:
+                continue
+            parent = image.layers[index - 1] if index != 0 else None
+            with StoreLock(self.root, layer_lock_name(parent)):
+                driver.remove_layer(layer)
+            used_layers.add(layer.id)
+        log.debug('Merged %d layers into layer (%s)' %
+            (len(image.layers) - self.base_layer_count, layers[-1].small_id))
+        return squashed_image
+
+    def do_command(self, instruction):
         command_list = {
             'FROM': self.do_command_from,
             'ADD': self.do_command_add,
+            'ARG': self.do_command_arg,
             'CMD': self.do_command_cmd,
-            'RUN': self.do_command_run
+            'COPY': self.do_command_copy,
+            'ENV': self.do_command_env,
+            'RUN': self.do_command_run,
+            'SHELL': self.do_command_shell,
+            'WORKDIR': self.do_command_workdir
         }
-        if command in command_list:
-            command_list[command](line)
-        else:
-            raise DockerfileParseException('Unrecognized command (%s)' % command)
+        if instruction.command not in command_list:
+            raise UnsupportedInstructionException('Instruction (%s) on line %d is not supported' %
+                (instruction.command, instruction.line))
+        if self.config is None and instruction.command not in ('FROM', 'ARG'):
+            raise DockerfileParseException('%s on line %d must come after FROM' %
+                (instruction.command, instruction.line))
+        # Before FROM only the global ARGs are visible, after it ENV wins over ARG
+        environment = self.arguments.copy()
+        if self.config is not None:
+            environment.update(self.environment)
+        self.expander.environment = environment
+        arguments = instruction.arguments
+        if instruction.command in EXPANDABLE and instruction.command not in KEY_VALUE_FORM:
+            arguments = self.expander.expand_words(arguments)
+        command_list[instruction.command](instruction, arguments)
 
-    def do_command_from(self, line):
-        records = line.split(' ')
-        if len(records) != 1:
-            raise DockerfileParseException('Use FROM <image> instead of FROM %s' % line)
-        image_ref = records[0]
+    def do_command_from(self, instruction, arguments):
+        if len(arguments) not in (1, 3) or (len(arguments) == 3 and arguments[1].upper() != 'AS'):
+            raise DockerfileParseException('Use FROM <image> [AS <name>] instead of FROM %s' %
+                ' '.join(instruction.arguments))
+        image_ref = arguments[0]
         if self.config is not None:
             raise DockerfileParseException('FROM is allowed only once')
         if image_ref == 'scratch':
             self.layers = []
             self.config = create_config()
         else:
-            image = Distribution().get_image(image_ref)
+            image = ImageResolver(self.root).resolve(image_ref)
+            # Keep the base image from being removed while building on it
+            self.base_image_lock = StoreLock(self.root, image_lock_name(image), shared=True)
+            self.base_image_lock.acquire()
             self.layers = image.layers.copy()
+            self.base_layer_count = len(self.layers)
             self.config = image.config.copy()
+            image_config = self.config.get('Config')
+            if image_config is not None:
+                for variable in image_config.get('Env') or []:
+                    (name, _, value) = variable.partition('=')
+                    self.environment[name] = value
+                self.working_dir = image_config.get('WorkingDir') or None
+        # Global ARGs go out of scope after FROM unless declared again
+        self.global_arguments = self.arguments
+        self.arguments = {}
 
-    def do_command_add(self, line):
-        records = line.split(' ')
-        if len(records) != 2:
-            raise DockerfileParseException('Use ADD <file> <dir_or_file> instead of ADD %s' % line)
-        file_name = records[0]
-        dir_name = records[1]
-        file_path = self.context_path.joinpath(file_name)
-        target_path = pathlib.Path(dir_name)
-        if not file_path.is_file():
-            log.error('File (%s) not found' % file_path)
-            exit(-1)
+    def do_command_arg(self, instruction, arguments):
+        for (name, default) in arguments:
+            if name in self.build_args:
+                value = self.build_args[name]
+            elif default is not None:
+                value = self.expander.expand(default)
+            elif name in self.global_arguments:
+                value = self.global_arguments[name]
+            else:
+                value = ''
+            self.arguments[name] = value
+
+    def do_command_env(self, instruction, arguments):
+        for (name, value) in arguments:
+            value = self.expander.expand(value)
+            self.environment[name] = value
+            self.expander.environment[name] = value
+
+    def do_command_workdir(self, instruction, arguments):
+        if len(arguments) != 1:
+            raise DockerfileParseException('Use WORKDIR <path> instead of WORKDIR %s' %
+                ' '.join(instruction.arguments))
+        working_dir = pathlib.PurePosixPath(self.working_dir or '/', arguments[0])
+        self.working_dir = str(working_dir)
+
+    def do_command_add(self, instruction, arguments):
+        self.add_files(instruction, arguments, extract=True)
+
+    def do_command_copy(self, instruction, arguments):
+        self.add_files(instruction, arguments, extract=False)
+
+    def add_files(self, instruction, arguments, extract):
+        if instruction.json:
+            arguments = instruction.arguments
+        if len(instruction.flags) != 0:
+            raise UnsupportedInstructionException('%s flags (%s) are not supported' %
+                (instruction.command, ','.join(instruction.flags)))
+        if len(arguments) < 2:
+            raise DockerfileParseException('Use %s <file>... <dir_or_file> instead of %s %s' %
+                (instruction.command, instruction.command, ' '.join(instruction.arguments)))
+        file_names = arguments[:-1]
+        dir_name = arguments[-1]
+        target_path = pathlib.Path(self.working_dir or '/', dir_name)
+        heredocs = {heredoc.name: heredoc for heredoc in instruction.heredocs}
+        if len(file_names) > 1 and not dir_name.endswith('/'):
+            raise DockerfileParseException('When using %s with more than one source file, '
+                'the destination must be a directory and end with a /' % instruction.command)
         if len(self.layers) == 0:
             top_layer = None
         else:
             top_layer = self.layers[-1]
         filesystem = Driver().create_filesystem(top_layer)
         image_target_path = filesystem.path.joinpath(target_path.relative_to('/'))
-        if file_path.suffix == '.tar':
-            untar(image_target_path, tar_file_path=file_path)
-        else:
-            cp(file_path, image_target_path)
-        layer = Driver().create_layer(filesystem) 
-        config_add_diff(self.config, layer.diff_digest, 'ADD file:%s in /' % file_name) 
+        for file_name in file_names:
+            heredoc = heredocs.get(file_name.lstrip('<-').strip('"\''))
+            if file_name.startswith('<<') and heredoc is not None:
+                self.add_heredoc(heredoc, image_target_path, dir_name.endswith('/'))
+                continue
+            file_path = self.context_path.joinpath(file_name)
+            if not file_path.is_file():
+                log.error('File (%s) not found' % file_path)
+                exit(-1)
+            tar_file = open_tar_archive(file_path) if extract else None
+            if tar_file is not None:
+                with tar_file:
+                    extract_tar(tar_file, image_target_path)
+            else:
+                cp(file_path, image_target_path)
+        if self.layer_index is None:
+            self.layer_index = LayerIndex()
+        with StoreLock(self.root, layer_lock_name(top_layer)):
+            layer = create_layer(filesystem, top_layer, self.layer_index, self.layer_metadata)
+        config_add_diff(self.config, layer.diff_digest, '%s file:%s in %s' %
+            (instruction.command, ','.join(file_names), dir_name))
         self.layers.append(layer)
-        
-    def do_command_cmd(self, line):
-        command = line.split(' ')
-        config_set_command(self.config, command, 'CMD ["%s"]' % line) 
-        
-    def do_command_run(self, line):
-        raise NotImplementedError()
 
+    def add_heredoc(self, heredoc, target_path, is_dir):
+        if is_dir:
+            target_path = target_path.joinpath(heredoc.name)
+        content = heredoc.content
+        if heredoc.expand:
+            content = self.expander.expand_text(content)
+        target_path.parent.mkdir(parents=True, exist_ok=True)
+        target_path.write_text(content)
+
+    def do_command_cmd(self, instruction, arguments):
+        if instruction.json:
+            command = arguments
+        else:
+            command = self.shell + arguments
+        config_set_command(self.config, command, 'CMD %s' % json.dumps(command))
+
+    def do_command_shell(self, instruction, arguments):
+        self.shell = arguments
+
+    def do_command_run(self, instruction, arguments):
+        raise NotImplementedError()
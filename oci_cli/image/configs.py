@@ -0,0 +1,106 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Image configs in their inspect form, cached under the root by image id.
+
+The id of an image is the digest of its config, so cached configs never go
+stale. Each top-level field is kept as its indented JSON text, parsed only
+when read, so inspect can write it out without converting or encoding the
+config again. The size of the image is kept with it once it is asked for.
+"""
+
+import os
+import pathlib
+import logging
+from oci_cli.util import fastjson
+
+log = logging.getLogger(__name__)
+
+class ConfigDocument:
+    """Top-level fields of a config as JSON text, parsed on first access"""
+    def __init__(self, texts, size=None):
+        self.texts = texts
+        self.size = size
+        self.values = {}
+
+    def __getitem__(self, name):
+        if name not in self.values:
+            self.values[name] = fastjson.loads(self.texts[name])
+        return self.values[name]
+
+    def names(self):
+        return self.texts.keys()
+
+    def get_text(self, name):
+        return self.texts[name]
+
+    def to_dict(self):
+        return {
+            'Fields': self.texts,
+            'Size': self.size
+        }
+
+    @staticmethod
+    def from_dict(data):
+        return ConfigDocument(data['Fields'], data['Size'])
+
+    @staticmethod
+    def from_config(config):
+        texts = {}
+        for (name, value) in config.to_dict(use_real_name=True).items():
+            texts[name] = fastjson.dumps(value, indent=True, default=str)
+        return ConfigDocument(texts)
+
+class ConfigCache:
+    def __init__(self, root):
+        self.path = pathlib.Path(root, 'cache', 'configs')
+        self.documents = {}
+
+    def get(self, image):
+        document = self.documents.get(image.id)
+        if document is None:
+            document = self.load(image)
+            self.documents[image.id] = document
+        return document
+
+    def get_size(self, image):
+        """Size of image, computed the first time it is asked for"""
+        document = self.get(image)
+        if document.size is None:
+            document.size = image.size()
+            self.save(image, document)
+        return document.size
+
+    def get_document_path(self, image):
+        return self.path.joinpath(image.id + '.json')
+
+    def load(self, image):
+        try:
+            with self.get_document_path(image).open('rb') as document_file:
+                return ConfigDocument.from_dict(fastjson.load(document_file))
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        document = ConfigDocument.from_config(image.config)
+        self.save(image, document)
+        return document
+
+    def save(self, image, document):
+        document_path = self.get_document_path(image)
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            temp_path = document_path.with_name('%s.%d.tmp' % (document_path.name, os.getpid()))
+            temp_path.write_text(fastjson.dumps(document.to_dict()), encoding='utf-8')
+            temp_path.replace(document_path)
+        except OSError as e:
+            log.debug('Could not cache config of image (%s) (%s)' % (image.id, e))
@@ -0,0 +1,139 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import humanize
+import logging
+from oci_api import OCIError
+from oci_api.image import Distribution, ImageInUseException
+from oci_api.graph import Driver
+from oci_cli.util import journal
+from oci_cli.util.lock import StoreLock, TAGS, image_lock_name, layer_lock_name
+from oci_cli.util.resolver import ImageResolver
+
+log = logging.getLogger(__name__)
+
+class Dedupe:
+    @staticmethod
+    def init_parser(image_subparsers, parent_parser):
+        parser = image_subparsers.add_parser('dedupe',
+            parents=[parent_parser],
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+            description='Merge byte-identical layers shared by several images',
+            help='Merge duplicate layers')
+        parser.add_argument('--dry-run',
+            help='Only report the duplicate layers', 
+            action='store_true')
+
+    def __init__(self, options):
+        distribution = Distribution()
+        images = sorted(distribution.images.values(),
+            key=lambda image: image.config.get('Created'))
+        canonical_layers = {}
+        duplicates = []
+        for image in images:
+            layers = self.canonical_layers(image, canonical_layers)
+            if layers is not None:
+                duplicates.append((image, layers))
+        relinked = []
+        for (image, layers) in duplicates:
+            replaced = [layer for (index, layer) in enumerate(image.layers)
+                if layer.id != layers[index].id]
+            log.info('Image (%s) has %d duplicate layers' % (image.small_id, len(replaced)))
+            if options.dry_run:
+                relinked.append((image, layers))
+                continue
+            try:
+                with StoreLock(options.root, image_lock_name(image)), \
+                        StoreLock(options.root, TAGS):
+                    self.relink_image(distribution, image, layers)
+                    ImageResolver.invalidate(options.root)
+                    journal.record(options.root, 'image', 'dedupe', image.id,
+                        layers=len(replaced))
+                relinked.append((image, layers))
+            except ImageInUseException:
+                log.warning('Image (%s) is being used by containers, skipping' % image.small_id)
+            except OCIError as e:
+                log.error(e.args[0])
+                exit(-1)
+        if options.dry_run:
+            # The layers of the images as they would be once relinked
+            relinked_ids = set(image.id for (image, _) in relinked)
+            used_layers = set(layer.id for image in images if image.id not in relinked_ids
+                for layer in image.layers)
+            used_layers.update(layer.id for (_, layers) in relinked for layer in layers)
+        else:
+            used_layers = set(layer.id for image in Distribution().images.values()
+                for layer in image.layers)
+        try:
+            saved = self.remove_layers(options.root, relinked, used_layers, options.dry_run)
+        except OCIError as e:
+            log.error(e.args[0])
+            exit(-1)
+        log.info('%s %s' % ('Would reclaim' if options.dry_run else 'Reclaimed',
+            humanize.naturalsize(saved)))
+
+    def remove_layers(self, root, relinked, used_layers, dry_run):
+        """Remove the replaced layers no image uses any more, returns the
+        number of bytes removed"""
+        driver = Driver()
+        removed = set()
+        saved = 0
+        for (image, _) in relinked:
+            # Top down, a layer is the parent of the ones above it
+            for index in reversed(range(len(image.layers))):
+                layer = image.layers[index]
+                if layer.id in used_layers or layer.id in removed:
+                    continue
+                size = layer.size()
+                if not dry_run:
+                    parent = image.layers[index - 1] if index != 0 else None
+                    with StoreLock(root, layer_lock_name(parent)):
+                        driver.remove_layer(layer)
+                    log.debug('Removed duplicate layer (%s)' % layer.small_id)
+                removed.add(layer.id)
+                saved += size
+        return saved
+
+    def canonical_layers(self, image, canonical_layers):
+        """Map the image layers to the oldest identical layer chain.
+
+        Returns None when there is nothing to merge or the whole chain can
+        not be mapped, since a layer can not be moved onto another parent.
+        """
+        layers = []
+        parent_id = None
+        is_canonical = True
+        for layer in image.layers:
+            key = (parent_id, layer.diff_digest)
+            canonical_layer = canonical_layers.get(key)
+            if canonical_layer is None:
+                if not is_canonical:
+                    return None
+                canonical_layers[key] = canonical_layer = layer
+            is_canonical = canonical_layer.id == layer.id
+            layers.append(canonical_layer)
+            parent_id = canonical_layer.id
+        if all(layer.id == image.layers[index].id for (index, layer) in enumerate(layers)):
+            return None
+        return layers
+
+    def relink_image(self, distribution, image, layers):
+        tags = list(image.tags)
+        config = image.config.copy()
+        distribution.remove_image(image, False)
+        new_image = distribution.create_image(config, layers)
+        for tag in tags:
+            distribution.add_tag(new_image, tag)
+        log.debug('Relinked image (%s) to shared layers' % new_image.small_id)
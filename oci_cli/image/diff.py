@@ -0,0 +1,65 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import logging
+from oci_api import OCIError
+from oci_api.image import Distribution, ImageUnknownException
+from oci_cli.util.resolver import ImageResolver
+from .files import diff_indexes, get_image_index
+
+log = logging.getLogger(__name__)
+
+class Diff:
+    @staticmethod
+    def init_parser(image_subparsers, parent_parser):
+        parser = image_subparsers.add_parser('diff',
+            parents=[parent_parser],
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+            description='Show the files added (A), changed (C) and deleted (D) from one image to another',
+            help='Show the changes of files between two images')
+        parser.add_argument('image',
+            metavar='IMAGE',
+            help='Name of the image to compare from')
+        parser.add_argument('other_image',
+            metavar='OTHER_IMAGE',
+            help='Name of the image to compare to')
+
+    def __init__(self, options):
+        distribution = Distribution()
+        resolver = ImageResolver(options.root, distribution)
+        images = []
+        for image_name in (options.image, options.other_image):
+            try:
+                images.append(resolver.resolve(image_name))
+            except ImageUnknownException:
+                log.error('Image (%s) does not exist' % image_name)
+                exit(-1)
+            except OCIError as e:
+                log.error(e.args[0])
+                exit(-1)
+        (image, other_image) = images
+        # Layers are snapshots of their parents, same top layer means same files
+        if [layer.id for layer in image.layers] == [layer.id for layer in other_image.layers] or \
+                [layer.diff_digest for layer in image.layers] == \
+                [layer.diff_digest for layer in other_image.layers]:
+            return
+        try:
+            changes = diff_indexes(get_image_index(options.root, distribution, image),
+                get_image_index(options.root, distribution, other_image))
+        except OCIError as e:
+            log.error(e.args[0])
+            exit(-1)
+        for (change, path) in changes:
+            print('%s %s' % (change, path))
@@ -0,0 +1,527 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Dockerfile parser.
+
+Parsing produces a list of Instruction objects with their arguments left
+unexpanded, ARG/ENV substitution is done by Expander while the build walks
+the instructions, since the environment changes as the build goes on. Parsed
+files are cached by content digest.
+"""
+
+import os
+import json
+import hashlib
+import logging
+from oci_api import OCIError
+
+log = logging.getLogger(__name__)
+
+PARSER_VERSION = 1
+
+INSTRUCTIONS = (
+    'ADD', 'ARG', 'CMD', 'COPY', 'ENTRYPOINT', 'ENV', 'EXPOSE', 'FROM',
+    'HEALTHCHECK', 'LABEL', 'MAINTAINER', 'ONBUILD', 'RUN', 'SHELL',
+    'STOPSIGNAL', 'USER', 'VOLUME', 'WORKDIR'
+)
+
+# Instructions whose arguments go through ARG/ENV substitution
+EXPANDABLE = ('ADD', 'COPY', 'ENV', 'EXPOSE', 'FROM', 'LABEL', 'STOPSIGNAL',
+    'USER', 'VOLUME', 'WORKDIR')
+
+JSON_FORM = ('ADD', 'CMD', 'COPY', 'ENTRYPOINT', 'HEALTHCHECK', 'RUN', 'SHELL',
+    'VOLUME')
+
+KEY_VALUE_FORM = ('ARG', 'ENV', 'LABEL')
+
+HEREDOC_FORM = ('ADD', 'COPY', 'RUN')
+
+FLAG_FORM = ('ADD', 'COPY', 'FROM', 'HEALTHCHECK', 'RUN')
+
+DIRECTIVES = ('escape', 'syntax')
+
+class DockerfileParseException(OCIError):
+    pass
+
+class Heredoc:
+    __slots__ = ('name', 'content', 'expand')
+
+    def __init__(self, name, content, expand=True):
+        self.name = name
+        self.content = content
+        self.expand = expand
+
+    def to_dict(self):
+        return {
+            'Name': self.name,
+            'Content': self.content,
+            'Expand': self.expand
+        }
+
+    @staticmethod
+    def from_dict(data):
+        return Heredoc(data['Name'], data['Content'], data['Expand'])
+
+class Instruction:
+    __slots__ = ('command', 'arguments', 'flags', 'json', 'heredocs', 'line',
+        'original')
+
+    def __init__(self, command, arguments, flags=None, json=False,
+            heredocs=None, line=0, original=''):
+        self.command = command
+        self.arguments = arguments
+        self.flags = flags or {}
+        self.json = json
+        self.heredocs = heredocs or []
+        self.line = line
+        self.original = original
+
+    def __repr__(self):
+        return 'Instruction(%s, %r)' % (self.command, self.arguments)
+
+    def to_dict(self):
+        arguments = self.arguments
+        if self.command == 'ONBUILD':
+            arguments = [argument.to_dict() for argument in arguments]
+        return {
+            'Command': self.command,
+            'Arguments': arguments,
+            'Flags': self.flags,
+            'Json': self.json,
+            'Heredocs': [heredoc.to_dict() for heredoc in self.heredocs],
+            'Line': self.line,
+            'Original': self.original
+        }
+
+    @staticmethod
+    def from_dict(data):
+        arguments = data['Arguments']
+        if data['Command'] == 'ONBUILD':
+            arguments = [Instruction.from_dict(argument) for argument in arguments]
+        return Instruction(data['Command'], arguments,
+            flags=data['Flags'],
+            json=data['Json'],
+            heredocs=[Heredoc.from_dict(heredoc) for heredoc in data['Heredocs']],
+            line=data['Line'],
+            original=data['Original'])
+
+class Dockerfile:
+    def __init__(self, instructions, escape='\\', directives=None):
+        self.instructions = instructions
+        self.escape = escape
+        self.directives = directives or {}
+
+    def __iter__(self):
+        return iter(self.instructions)
+
+    def __len__(self):
+        return len(self.instructions)
+
+    def to_dict(self):
+        return {
+            'Version': PARSER_VERSION,
+            'Escape': self.escape,
+            'Directives': self.directives,
+            'Instructions': [instruction.to_dict() for instruction in self.instructions]
+        }
+
+    @staticmethod
+    def from_dict(data):
+        if data.get('Version') != PARSER_VERSION:
+            raise ValueError('Unsupported parse cache version')
+        instructions = [Instruction.from_dict(instruction)
+            for instruction in data['Instructions']]
+        return Dockerfile(instructions, data['Escape'], data['Directives'])
+
+_parse_cache = {}
+
+def parse_file(file_path, cache_path=None):
+    data = file_path.read_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+    dockerfile = _parse_cache.get(digest)
+    if dockerfile is not None:
+        return dockerfile
+    cache_file_path = None
+    if cache_path is not None:
+        cache_file_path = cache_path.joinpath(digest + '.json')
+        try:
+            with cache_file_path.open() as cache_file:
+                dockerfile = Dockerfile.from_dict(json.load(cache_file))
+            log.debug('Using cached parse of dockerfile (%s)' % digest)
+        except (OSError, ValueError, KeyError, TypeError):
+            dockerfile = None
+    if dockerfile is None:
+        dockerfile = parse(data.decode('utf-8'))
+        if cache_file_path is not None:
+            try:
+                cache_path.mkdir(parents=True, exist_ok=True)
+                temp_file_path = cache_path.joinpath('%s.%d.tmp' % (digest, os.getpid()))
+                with temp_file_path.open('w') as cache_file:
+                    json.dump(dockerfile.to_dict(), cache_file)
+                temp_file_path.replace(cache_file_path)
+            except OSError as e:
+                log.debug('Could not cache dockerfile parse (%s)' % e)
+    _parse_cache[digest] = dockerfile
+    return dockerfile
+
+def parse(text):
+    lines = text.splitlines()
+    escape = '\\'
+    directives = {}
+    index = 0
+    # Parser directives are only allowed before anything else
+    while index < len(lines):
+        directive = parse_directive(lines[index])
+        if directive is None:
+            break
+        name, value = directive
+        if name in directives:
+            raise DockerfileParseException('Only one %s parser directive can be used' % name)
+        directives[name] = value
+        index += 1
+    if 'escape' in directives:
+        escape = directives['escape']
+        if escape not in ('\\', '`'):
+            raise DockerfileParseException('Invalid escape token (%s), must be \\ or `' % escape)
+    instructions = []
+    count = len(lines)
+    while index < count:
+        line = lines[index].strip()
+        line_number = index + 1
+        index += 1
+        if len(line) == 0 or line.startswith('#'):
+            continue
+        original = [line]
+        while line.endswith(escape):
+            line = line[:-1]
+            while index < count:
+                next_line = lines[index].strip()
+                if len(next_line) != 0 and not next_line.startswith('#'):
+                    break
+                index += 1
+            if index == count:
+                break
+            next_line = lines[index].strip()
+            original.append(next_line)
+            line += next_line
+            index += 1
+        if len(line) == 0:
+            # A lone line continuation at the end of the file
+            continue
+        instruction = parse_instruction(line, escape, line_number)
+        if instruction.command in HEREDOC_FORM:
+            index = read_heredocs(instruction, lines, index)
+        instruction.original = '\n'.join(original)
+        instructions.append(instruction)
+    return Dockerfile(instructions, escape, directives)
+
+def parse_directive(line):
+    line = line.strip()
+    if not line.startswith('#'):
+        return None
+    records = line[1:].split('=', 1)
+    if len(records) != 2:
+        return None
+    name = records[0].strip().lower()
+    if name not in DIRECTIVES or ' ' in name:
+        return None
+    return (name, records[1].strip())
+
+def parse_instruction(line, escape, line_number):
+    records = line.split(None, 1)
+    command = records[0].upper()
+    if command not in INSTRUCTIONS:
+        raise DockerfileParseException('Unrecognized command (%s) on line %d' %
+            (records[0], line_number))
+    if len(records) != 2:
+        raise DockerfileParseException('%s requires at least one argument on line %d' %
+            (command, line_number))
+    rest = records[1].strip()
+    instruction = Instruction(command, None, line=line_number)
+    if command == 'ONBUILD':
+        nested = parse_instruction(rest, escape, line_number)
+        if nested.command in ('ONBUILD', 'FROM', 'MAINTAINER'):
+            raise DockerfileParseException('%s is not allowed as ONBUILD trigger on line %d' %
+                (nested.command, line_number))
+        instruction.arguments = [nested]
+        return instruction
+    if command in FLAG_FORM:
+        rest = parse_flags(instruction, rest, escape)
+    if command == 'HEALTHCHECK':
+        records = rest.split(None, 1)
+        kind = records[0].upper()
+        if kind == 'NONE':
+            instruction.arguments = ['NONE']
+            return instruction
+        if kind != 'CMD' or len(records) != 2:
+            raise DockerfileParseException('Use HEALTHCHECK [OPTIONS] CMD command on line %d' %
+                line_number)
+        rest = records[1].strip()
+    if command in JSON_FORM:
+        arguments = parse_json(rest)
+        if arguments is not None:
+            instruction.arguments = arguments
+            instruction.json = True
+            return instruction
+        if command == 'SHELL':
+            raise DockerfileParseException('SHELL requires the arguments to be in JSON form on line %d' %
+                line_number)
+    if command in KEY_VALUE_FORM:
+        instruction.arguments = parse_key_values(command, rest, escape, line_number)
+    elif command in ('RUN', 'CMD', 'ENTRYPOINT', 'HEALTHCHECK', 'MAINTAINER'):
+        instruction.arguments = [rest]
+    else:
+        instruction.arguments = split_words(rest, escape)
+    return instruction
+
+def parse_flags(instruction, rest, escape):
+    while rest.startswith('--'):
+        records = rest.split(None, 1)
+        flag = records[0][2:]
+        if len(flag) == 0:
+            # "--" ends the flag list
+            rest = records[1] if len(records) == 2 else ''
+            break
+        name, _, value = flag.partition('=')
+        instruction.flags[name] = value
+        rest = records[1] if len(records) == 2 else ''
+    if len(rest) == 0:
+        raise DockerfileParseException('%s requires at least one argument on line %d' %
+            (instruction.command, instruction.line))
+    return rest
+
+def parse_json(rest):
+    if not rest.startswith('['):
+        return None
+    try:
+        arguments = json.loads(rest)
+    except ValueError:
+        return None
+    if not isinstance(arguments, list):
+        return None
+    for argument in arguments:
+        if not isinstance(argument, str):
+            return None
+    return arguments
+
+def parse_key_values(command, rest, escape, line_number):
+    words = split_words(rest, escape)
+    if command != 'ARG' and '=' not in words[0]:
+        # Legacy "ENV key value" form, the value is the rest of the line
+        records = rest.split(None, 1)
+        if len(records) != 2:
+            raise DockerfileParseException('%s requires a value for %s on line %d' %
+                (command, records[0], line_number))
+        return [[records[0], records[1]]]
+    pairs = []
+    for word in words:
+        key, equals, value = word.partition('=')
+        if len(key) == 0:
+            raise DockerfileParseException('%s names can not be blank on line %d' %
+                (command, line_number))
+        if len(equals) == 0:
+            if command != 'ARG':
+                raise DockerfileParseException('%s requires a value for %s on line %d' %
+                    (command, key, line_number))
+            value = None
+        pairs.append([key, value])
+    return pairs
+
+def split_words(text, escape='\\'):
+    """Split on unquoted whitespace, keeping quotes and escapes for Expander"""
+    words = []
+    word = []
+    quote = None
+    in_word = False
+    index = 0
+    length = len(text)
+    while index < length:
+        char = text[index]
+        index += 1
+        if quote is None:
+            if char.isspace():
+                if in_word:
+                    words.append(''.join(word))
+                    word = []
+                    in_word = False
+                continue
+            if char == '"' or char == "'":
+                quote = char
+        elif char == quote:
+            quote = None
+        in_word = True
+        word.append(char)
+        if char == escape and quote != "'" and index < length:
+            word.append(text[index])
+            index += 1
+    if in_word:
+        words.append(''.join(word))
+    return words
+
+def read_heredocs(instruction, lines, index):
+    if instruction.json:
+        return index
+    words = instruction.arguments
+    if instruction.command == 'RUN':
+        words = split_words(words[0])
+    for word in words:
+        if not word.startswith('<<') or len(word) <= 2:
+            continue
+        name = word[2:]
+        chomp = name.startswith('-')
+        if chomp:
+            name = name[1:]
+        expand = True
+        if len(name) > 1 and name[0] in ('"', "'") and name[-1] == name[0]:
+            name = name[1:-1]
+            expand = False
+        if len(name) == 0 or not (name[0].isalpha() or name[0] == '_'):
+            continue
+        content = []
+        while True:
+            if index == len(lines):
+                raise DockerfileParseException('Unterminated heredoc (%s) on line %d' %
+                    (name, instruction.line))
+            line = lines[index]
+            index += 1
+            if chomp:
+                line = line.lstrip('\t')
+            if line == name:
+                break
+            content.append(line + '\n')
+        instruction.heredocs.append(Heredoc(name, ''.join(content), expand))
+    return index
+
+class Expander:
+    def __init__(self, environment, escape='\\'):
+        self.environment = environment
+        self.escape = escape
+
+    def expand_words(self, words):
+        return [self.expand(word) for word in words]
+
+    def expand(self, word):
+        if '$' not in word and self.escape not in word and \
+                '"' not in word and "'" not in word:
+            return word
+        result, _ = self.process(word, 0, None)
+        return result
+
+    def expand_text(self, text):
+        """Expand variables in heredoc content, quotes are kept as they are"""
+        if '$' not in text:
+            return text
+        result = []
+        index = 0
+        length = len(text)
+        while index < length:
+            char = text[index]
+            index += 1
+            if char == self.escape and index < length and text[index] in ('$', self.escape):
+                result.append(text[index])
+                index += 1
+            elif char == '$':
+                value, index = self.process_dollar(text, index)
+                result.append(value)
+            else:
+                result.append(char)
+        return ''.join(result)
+
+    def process(self, word, index, stop):
+        result = []
+        length = len(word)
+        while index < length:
+            char = word[index]
+            if stop is not None and char == stop:
+                break
+            index += 1
+            if char == self.escape:
+                if index < length:
+                    result.append(word[index])
+                    index += 1
+            elif char == "'":
+                end = word.find("'", index)
+                if end == -1:
+                    raise DockerfileParseException('Unmatched quote in (%s)' % word)
+                result.append(word[index:end])
+                index = end + 1
+            elif char == '"':
+                index = self.process_double_quote(word, index, result)
+            elif char == '$':
+                value, index = self.process_dollar(word, index)
+                result.append(value)
+            else:
+                result.append(char)
+        return ''.join(result), index
+
+    def process_double_quote(self, word, index, result):
+        length = len(word)
+        while index < length:
+            char = word[index]
+            index += 1
+            if char == '"':
+                return index
+            if char == self.escape and index < length and word[index] in ('"', '$', self.escape):
+                result.append(word[index])
+                index += 1
+            elif char == '$':
+                value, index = self.process_dollar(word, index)
+                result.append(value)
+            else:
+                result.append(char)
+        raise DockerfileParseException('Unmatched quote in (%s)' % word)
+
+    def process_dollar(self, word, index):
+        length = len(word)
+        if index == length:
+            return '$', index
+        if word[index] != '{':
+            start = index
+            while index < length and (word[index].isalnum() or word[index] == '_'):
+                index += 1
+            if index == start:
+                return '$', index
+            return self.environment.get(word[start:index], ''), index
+        index += 1
+        start = index
+        while index < length and (word[index].isalnum() or word[index] == '_'):
+            index += 1
+        name = word[start:index]
+        if len(name) == 0 or index == length:
+            raise DockerfileParseException('Bad substitution in (%s)' % word)
+        value = self.environment.get(name)
+        if word[index] == '}':
+            return value or '', index + 1
+        modifier = word[index]
+        index += 1
+        unset_only = modifier != ':'
+        if not unset_only:
+            if index == length:
+                raise DockerfileParseException('Bad substitution in (%s)' % word)
+            modifier = word[index]
+            index += 1
+        if modifier not in ('-', '+', '?'):
+            raise DockerfileParseException('Unsupported modifier (%s) in (%s)' % (modifier, word))
+        alternative, index = self.process(word, index, '}')
+        if index == length:
+            raise DockerfileParseException('Bad substitution in (%s)' % word)
+        index += 1
+        is_set = value is not None if unset_only else bool(value)
+        if modifier == '-':
+            return (value if is_set else alternative), index
+        if modifier == '+':
+            return (alternative if is_set else ''), index
+        if not is_set:
+            raise DockerfileParseException('%s: %s' % (name, alternative or 'is not allowed to be empty'))
+        return value, index
@@ -0,0 +1,248 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Indexes of the files of layers, recorded when layers are created.
+
+The index of a layer describes the whole tree of the layer, its parents
+included, as a path to (type, mode, uid, gid, size, mtime, content) map.
+Content is the digest of regular files, the target of symbolic links and
+the device numbers of devices. Comparing two indexes needs no file
+contents, and indexing a tree only hashes the files whose type, size or
+time differ from the index of the tree it was cloned from.
+
+Layers without an index, created before indexes existed or loaded by the
+api, are indexed from their blobs the first time they are needed.
+"""
+
+import os
+import gzip
+import json
+import stat
+import hashlib
+import pathlib
+import tempfile
+import posixpath
+import logging
+from oci_cli.util.archive import WHITEOUT_OPAQUE, WHITEOUT_PREFIX, iterate_members, \
+    normalize_name
+from oci_cli.util.compression import open_decompressed
+from oci_cli.util.lock import StoreLock, image_lock_name
+from .layout import ImageLayout
+
+log = logging.getLogger(__name__)
+
+BUFFER_SIZE = 1024 * 1024
+
+DIRECTORY = 'd'
+FILE = 'f'
+SYMLINK = 'l'
+DEVICE = 'c'
+FIFO = 'p'
+
+(TYPE, MODE, UID, GID, SIZE, MTIME, CONTENT) = range(7)
+
+def get_index_path(root, layer):
+    return pathlib.Path(root, 'cache', 'files', layer.id + '.json.gz')
+
+def load_index(root, layer):
+    """Index of layer, None when it has none"""
+    try:
+        with gzip.open(str(get_index_path(root, layer)), 'rt') as index_file:
+            return json.load(index_file)
+    except (OSError, EOFError, ValueError):
+        return None
+
+def save_index(root, layer, index):
+    index_path = get_index_path(root, layer)
+    try:
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = index_path.with_name('%s.%d.tmp' % (index_path.name, os.getpid()))
+        # Layers can have many files, the index is written as it is encoded
+        with gzip.open(str(temp_path), 'wt', compresslevel=1) as index_file:
+            json.dump(index, index_file, separators=(',', ':'))
+        temp_path.replace(index_path)
+    except OSError as e:
+        log.debug('Could not save file index of layer (%s): %s' % (layer.small_id, e))
+
+class HashingFile:
+    """Digest of the data read through it"""
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.hasher = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.hasher.update(data)
+        return data
+
+    def digest(self):
+        return 'sha256:' + self.hasher.hexdigest()
+
+def hash_file(path):
+    with open(path, 'rb') as input_file:
+        hashing_file = HashingFile(input_file)
+        while len(hashing_file.read(BUFFER_SIZE)) != 0:
+            pass
+    return hashing_file.digest()
+
+def index_entry(path, stat_result, cached=None):
+    mode = stat_result.st_mode
+    entry = [None, stat.S_IMODE(mode), stat_result.st_uid, stat_result.st_gid, 0,
+        stat_result.st_mtime_ns, None]
+    if stat.S_ISDIR(mode):
+        entry[TYPE] = DIRECTORY
+    elif stat.S_ISREG(mode):
+        entry[TYPE] = FILE
+        entry[SIZE] = stat_result.st_size
+        if cached is not None and cached[TYPE] == FILE and cached[SIZE] == entry[SIZE] and \
+                cached[MTIME] == entry[MTIME]:
+            entry[CONTENT] = cached[CONTENT]
+        else:
+            entry[CONTENT] = hash_file(path)
+    elif stat.S_ISLNK(mode):
+        entry[TYPE] = SYMLINK
+        entry[CONTENT] = os.readlink(path)
+    elif stat.S_ISCHR(mode) or stat.S_ISBLK(mode):
+        entry[TYPE] = DEVICE
+        entry[CONTENT] = '%d,%d' % (os.major(stat_result.st_rdev), os.minor(stat_result.st_rdev))
+    else:
+        entry[TYPE] = FIFO
+    return entry
+
+def index_tree(tree_path, cached_index=None):
+    """Index of the tree under tree_path, regular files whose type, size and
+    time match their entry in cached_index are not read"""
+    cached_index = cached_index or {}
+    index = {}
+    tree_path = str(tree_path)
+    for (dir_path, dir_names, file_names) in os.walk(tree_path):
+        relative_path = os.path.relpath(dir_path, tree_path)
+        prefix = '' if relative_path == '.' else relative_path + '/'
+        # Symbolic links to directories are listed in dir_names but not walked
+        for name in dir_names + file_names:
+            path = os.path.join(dir_path, name)
+            entry_name = prefix + name
+            index[entry_name] = index_entry(path, os.lstat(path), cached_index.get(entry_name))
+    return index
+
+def remove_tree(index, name):
+    index.pop(name, None)
+    prefix = name + '/' if name != '' else ''
+    for entry_name in [entry_name for entry_name in index if entry_name.startswith(prefix)]:
+        del index[entry_name]
+
+def apply_layer(index, fileobj):
+    """Apply the tar stream of a layer in fileobj to index"""
+    for (member, input_file) in iterate_members(fileobj):
+        name = normalize_name(member.name)
+        (parent, _, base) = name.rpartition('/')
+        if name == '':
+            continue
+        if base == WHITEOUT_OPAQUE:
+            remove_tree(index, parent)
+            continue
+        if base.startswith(WHITEOUT_PREFIX):
+            remove_tree(index, posixpath.join(parent, base[len(WHITEOUT_PREFIX):]))
+            continue
+        entry = [None, member.mode, member.uid, member.gid, 0, int(member.mtime) * 10 ** 9, None]
+        if member.isdir():
+            entry[TYPE] = DIRECTORY
+        elif member.isreg():
+            hashing_file = HashingFile(input_file)
+            while len(hashing_file.read(BUFFER_SIZE)) != 0:
+                pass
+            entry[TYPE] = FILE
+            entry[SIZE] = member.size
+            entry[CONTENT] = hashing_file.digest()
+        elif member.islnk():
+            target = index.get(normalize_name(member.linkname))
+            if target is None:
+                log.debug('Hard link target (%s) is not in the layer' % member.linkname)
+                continue
+            entry = list(target)
+        elif member.issym():
+            entry[TYPE] = SYMLINK
+            entry[CONTENT] = member.linkname
+        elif member.ischr() or member.isblk():
+            entry[TYPE] = DEVICE
+            entry[CONTENT] = '%d,%d' % (member.devmajor, member.devminor)
+        else:
+            entry[TYPE] = FIFO
+        if entry[TYPE] != DIRECTORY and index.get(name, [None])[TYPE] == DIRECTORY:
+            remove_tree(index, name)
+        index[name] = entry
+
+def record_layer_index(root, layer, tree_path, parent=None):
+    """Index the tree of a new layer, reusing the digests of the index of the
+    parent it was cloned from. Skipped when the parent has no index, it is
+    built from the blobs when needed."""
+    parent_index = {}
+    if parent is not None:
+        parent_index = load_index(root, parent)
+        if parent_index is None:
+            log.debug('Parent layer (%s) has no file index' % parent.small_id)
+            return
+    try:
+        index = index_tree(tree_path, parent_index)
+    except OSError as e:
+        log.debug('Could not index files of layer (%s): %s' % (layer.small_id, e))
+        return
+    save_index(root, layer, index)
+
+def get_image_index(root, distribution, image):
+    """Index of the top layer of image, indexing the layers from their blobs
+    when it has none"""
+    if len(image.layers) == 0:
+        return {}
+    index = load_index(root, image.layers[-1])
+    if index is not None:
+        return index
+    # Start from the topmost layer that has an index
+    start = len(image.layers) - 1
+    index = {}
+    while start > 0:
+        parent_index = load_index(root, image.layers[start - 1])
+        if parent_index is not None:
+            index = parent_index
+            break
+        start -= 1
+    log.info('Indexing files of %d layers of image (%s)' % (len(image.layers) - start,
+        image.small_id))
+    with tempfile.TemporaryDirectory() as temp_dir_name:
+        with StoreLock(root, image_lock_name(image), shared=True):
+            distribution.save_image(image.id, temp_dir_name)
+        layout = ImageLayout(temp_dir_name)
+        with layout.index_path.open() as index_file:
+            manifest = layout.read_json(json.load(index_file)['manifests'][0]['digest'])
+        for (layer, descriptor) in zip(image.layers[start:], manifest['layers'][start:]):
+            with layout.get_blob_path(descriptor['digest']).open('rb') as blob_file:
+                apply_layer(index, open_decompressed(blob_file))
+            save_index(root, layer, index)
+    return index
+
+def diff_indexes(old_index, new_index):
+    """Sorted (change, path) list, change is A for added, C for changed and D
+    for deleted paths. Times are not compared."""
+    changes = []
+    for (name, entry) in new_index.items():
+        old_entry = old_index.get(name)
+        if old_entry is None:
+            changes.append(('A', '/' + name))
+        elif old_entry[:MTIME] != entry[:MTIME] or old_entry[CONTENT] != entry[CONTENT]:
+            changes.append(('C', '/' + name))
+    for name in old_index:
+        if name not in new_index:
+            changes.append(('D', '/' + name))
+    changes.sort(key=lambda change: change[1])
+    return changes
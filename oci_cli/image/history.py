@@ -18,8 +18,13 @@ import argparse
 import humanize
 import logging
 from datetime import datetime, timezone
-from oci_api.image import Distribution, ImageUnknownException
+from oci_api import OCIError
+from oci_api.image import ImageUnknownException
 from oci_api.util.print import print_table
+from oci_cli.util import str_to_bool
+from oci_cli.util.format import Template
+from oci_cli.util.resolver import ImageResolver
+from .layers import LayerMetadata
 
 log = logging.getLogger(__name__)
 
@@ -31,9 +36,22 @@ class History:
             formatter_class=argparse.ArgumentDefaultsHelpFormatter,
             description='Show the history of an image',
             help='Show the history of an image')
+        parser.add_argument('--format',
+            help='Pretty-print history using a Go template',
+            metavar='string')
+        parser.add_argument('-H', '--human',
+            help='Print sizes and dates in human readable format',
+            type=str_to_bool,
+            nargs='?',
+            const=True,
+            default=True,
+            metavar='bool')
         parser.add_argument('--no-trunc',
             help='Don\'t truncate output', 
             action='store_true')
+        parser.add_argument('-q', '--quiet',
+            help='Only show layer IDs', 
+            action='store_true')
         parser.add_argument('image',
             metavar='IMAGE',
             help='Name of the image to show')
@@ -41,41 +59,77 @@ class History:
     def __init__(self, options):
         image_name = options.image
         try:
-            image = Distribution().get_image(options.image)
-            history_list = []
-            layer_index = 0
-            now = datetime.now(tz=timezone.utc)
-            for history_item in image.config.get('History'):
-                layer = '<empty>'
-                size = 0
-                if not history_item.get('EmptyLayer'):
-                    if options.no_trunc:
-                        layer = image.layers[layer_index].digest
-                    else:
-                        layer = image.layers[layer_index].small_id
-                    size = image.layers[layer_index].size()
-                    layer_index += 1
-                created_by = history_item.get('CreatedBy') or ''
-                comment = history_item.get('Comment') or ''
-                author = history_item.get('Author') or ''
-                if not options.no_trunc:                    
-                    if len(created_by) > 45:
-                        created_by = created_by[:44] + '…'
-                    if len(comment) > 45:
-                        comment = comment[:44] + '…'
-                    if len(author) > 45:
-                        author = author[:44] + '…'
-                history_json = {
-                    'layer': layer,
-                    'created': humanize.naturaltime(now - history_item.get('Created')),
-                    'created by': created_by,
-                    'size': humanize.naturalsize(size),
-                    'comment': comment,
-                    'author': author
-                }
-                history_list.append(history_json)
-            history_list.reverse()
-            print_table(history_list)
+            image = ImageResolver(options.root).resolve(options.image)
         except ImageUnknownException:
             log.error('Image (%s) does not exist' % image_name)
             exit(-1)
+        except OCIError as e:
+            log.error(e.args[0])
+            exit(-1)
+        template = None
+        if options.format is not None:
+            template = Template(options.format)
+        with_size = not options.quiet and (template is None or template.uses('Size'))
+        layer_metadata = LayerMetadata(options.root)
+        history_list = []
+        layer_index = 0
+        now = datetime.now(tz=timezone.utc)
+        for history_item in image.config.get('History'):
+            layer = '<empty>'
+            size = 0
+            if not history_item.get('EmptyLayer'):
+                if options.no_trunc:
+                    layer = image.layers[layer_index].digest
+                else:
+                    layer = image.layers[layer_index].small_id
+                if with_size:
+                    size = layer_metadata.size(image.layers[layer_index])
+                layer_index += 1
+            if options.quiet:
+                history_list.append(layer)
+                continue
+            created = history_item.get('Created')
+            created_by = history_item.get('CreatedBy') or ''
+            comment = history_item.get('Comment') or ''
+            author = history_item.get('Author') or ''
+            if template is not None:
+                history_list.append(template.render({
+                    'ID': layer,
+                    'CreatedSince': humanize.naturaltime(now - created) \
+                        if template.uses('CreatedSince') else None,
+                    'CreatedAt': created.isoformat(),
+                    'CreatedBy': created_by,
+                    'Size': humanize.naturalsize(size) if options.human else size,
+                    'Comment': comment,
+                    'Author': author
+                }))
+                continue
+            if not options.no_trunc:                    
+                if len(created_by) > 45:
+                    created_by = created_by[:44] + '…'
+                if len(comment) > 45:
+                    comment = comment[:44] + '…'
+                if len(author) > 45:
+                    author = author[:44] + '…'
+            if options.human:
+                created = humanize.naturaltime(now - created)
+                size = humanize.naturalsize(size)
+            else:
+                created = created.isoformat()
+            history_json = {
+                'layer': layer,
+                'created': created,
+                'created by': created_by,
+                'size': size,
+                'comment': comment,
+                'author': author
+            }
+            history_list.append(history_json)
+        # Sizes of layers created before the metadata existed were filled in
+        layer_metadata.save()
+        history_list.reverse()
+        if options.quiet or template is not None:
+            for line in history_list:
+                print(line)
+        else:
+            print_table(history_list)
@@ -17,6 +17,8 @@ import argparse
 import pathlib
 
 from .build import Build
+from .dedupe import Dedupe
+from .diff import Diff
 from .history import History
 from .import_ import Import
 from .inspect import Inspect
@@ -24,11 +26,16 @@ from .list import List
 from .load import Load
 from .remove import Remove
 from .save import Save
+from .squash import Squash
+from .sync import Sync
 from .tag import Tag
+from .verify import Verify
 
 class Image:
     commands = {
         'build': Build,
+        'dedupe': Dedupe,
+        'diff': Diff,
         'history': History,
         'import': Import,
         'inspect': Inspect,
@@ -36,7 +43,10 @@ class Image:
         'ls': List,
         'rm': Remove,
         'save': Save,
-        'tag': Tag
+        'squash': Squash,
+        'sync': Sync,
+        'tag': Tag,
+        'verify': Verify
     }
 
     @staticmethod
@@ -13,19 +13,28 @@
 # limitations under the License.
 
 import argparse
+import hashlib
 import pathlib
 import logging
 import sys
 import tempfile
 import shutil
 import os
-from urllib.request import urlopen
+from urllib.parse import urlparse
 from oci_spec.image.v1 import ImageConfig
 from oci_spec.runtime.v1 import Spec
 from oci_api import OCIError
-from oci_api.util.file import untar
 from oci_api.image import Distribution
 from oci_api.graph import Driver
+from oci_cli.util import journal
+from oci_cli.util.archive import extract_tar
+from oci_cli.util.compression import open_decompressed
+from oci_cli.util.fetch import Download, DownloadException, FileReader, HashingReader, \
+    RangeReader, file_digest, verify_digest
+from oci_cli.util.lock import StoreLock, TAGS, layer_lock_name
+from oci_cli.util.resolver import ImageResolver
+from oci_cli.util.seekable import NotSeekableException, SeekableReader
+from .layers import LayerMetadata, create_layer
 log = logging.getLogger(__name__)
 
 class Import:
@@ -41,6 +50,24 @@ class Import:
             metavar='string')
         parser.add_argument('-r', '--runc-config', 
             help='path to the runc spec file config.json')
+        parser.add_argument('--sha256', 
+            help='Verify the sha256 digest of the file',
+            metavar='string')
+        parser.add_argument('--timeout', 
+            help='Connection timeout in seconds for URLs',
+            type=int,
+            default=30,
+            metavar='int')
+        parser.add_argument('--parallel', 
+            help='Number of connections used to download URLs',
+            type=int,
+            default=4,
+            metavar='int')
+        parser.add_argument('--retries', 
+            help='Number of times a failed download is retried',
+            type=int,
+            default=5,
+            metavar='int')
         parser.add_argument('file',
             metavar='file|URL|-',
             help='Name of the file or URL to import, or "-" for the standard input')
@@ -52,49 +79,106 @@ class Import:
     def __init__(self, options):
         log.debug('Start importing (%s)' % options.file)
         layer = None
-        with tempfile.TemporaryDirectory() as temp_dir_name:
-            if options.file == '-':
-                input_file = os.fdopen(sys.stdin.fileno(), 'rb')
-            else:
-                try:
-                    input_file = urlopen(options.file)
-                except ValueError:
-                    input_file = open(options.file, 'rb')
-            rootfs_tar_path = pathlib.Path(temp_dir_name, 'rootfs.tar')
-            with rootfs_tar_path.open('wb') as output_file:
-                log.debug('Start copying (%s) to (%s)', options.file, str(rootfs_tar_path))
-                shutil.copyfileobj(input_file, output_file)
-                log.debug('Finish copying (%s) to (%s)', options.file, str(rootfs_tar_path))
-            if rootfs_tar_path.is_file():
-                filesystem = Driver().create_filesystem()
-                untar(filesystem.path, tar_file=input_file)
-                layer = Driver().create_layer(filesystem)
+        try:
+            with tempfile.TemporaryDirectory() as temp_dir_name:
+                reader = self.open_seekable(options)
+                if reader is not None:
+                    # Files are fetched and extracted in parallel straight from
+                    # the source, the whole blob is never downloaded first
+                    log.debug('Extracting seekable (%s) by its table of contents' % options.file)
+                    filesystem = Driver().create_filesystem()
+                    try:
+                        reader.extract(filesystem.path, options.parallel)
+                    finally:
+                        reader.close()
+                else:
+                    rootfs_tar_path = self.fetch(options, pathlib.Path(temp_dir_name))
+                    filesystem = Driver().create_filesystem()
+                    with rootfs_tar_path.open('rb') as input_file:
+                        extract_tar(open_decompressed(input_file), filesystem.path)
+                with StoreLock(options.root, layer_lock_name(None)):
+                    layer = create_layer(filesystem, metadata=LayerMetadata(options.root))
+        except OCIError as e:
+            log.error(e.args[0])
+            exit(-1)
         if layer is None:
             log.error('Could not create layer')        
             exit(-1)
         try:
-            distribution = Distribution()
-            history = '/bin/sh -c #(nop) IMPORTED file:%s in / ' % options.file
-            image = Distribution().create_image(layer=layer, history=history)
-            if options.runc_config is not None:
-                config_file_path = pathlib.Path(options.runc_config)
-                if not config_file_path.is_file():
-                    OCIError('Runc config file (%s) does not exist' % str(config_file_path))
-                spec = Spec.from_file(config_file_path)
-                process = spec.get('Process')
-                command = process.get('Args')
-                if command is not None:
-                    image.set_command(command)
-                environment = process.get('Env')
-                if environment is not None:
-                    image.set_environment(environment)
-                working_dir = process.get('Cwd')
-                if working_dir is not None:
-                    image.set_working_dir(working_dir)
-                    if options.tag is not None:
-                        for tag in options.tag:
-                            Distribution().add_tag(self.image, tag)
+            with StoreLock(options.root, TAGS):
+                distribution = Distribution()
+                history = '/bin/sh -c #(nop) IMPORTED file:%s in / ' % options.file
+                image = Distribution().create_image(layer=layer, history=history)
+                if options.runc_config is not None:
+                    config_file_path = pathlib.Path(options.runc_config)
+                    if not config_file_path.is_file():
+                        raise OCIError('Runc config file (%s) does not exist' % str(config_file_path))
+                    spec = Spec.from_file(config_file_path)
+                    process = spec.get('Process')
+                    command = process.get('Args')
+                    if command is not None:
+                        image.set_command(command)
+                    environment = process.get('Env')
+                    if environment is not None:
+                        image.set_environment(environment)
+                    working_dir = process.get('Cwd')
+                    if working_dir is not None:
+                        image.set_working_dir(working_dir)
+                if options.tag is not None:
+                    Distribution().add_tag(image, options.tag)
+                ImageResolver.invalidate(options.root)
+                journal.record(options.root, 'image', 'import', image.id,
+                    name=options.tag or '')
         except Exception as e:
             log.error(e.args[0])
             exit(-1)
         log.debug('Finish importing (%s)' % options.file)
+
+    def open_seekable(self, options):
+        """Return a SeekableReader when options.file is a seekable blob"""
+        # A digest to verify needs every byte, so it goes through fetch()
+        if options.file == '-' or options.sha256 is not None:
+            return None
+        if urlparse(options.file).scheme in ('http', 'https'):
+            source = RangeReader(options.file, options.timeout, options.retries)
+        elif pathlib.Path(options.file).is_file():
+            source = FileReader(options.file)
+        else:
+            return None
+        try:
+            return SeekableReader(source)
+        except (NotSeekableException, DownloadException):
+            source.close()
+            return None
+
+    def fetch(self, options, temp_dir_path):
+        """Return a local path with the verified contents of options.file"""
+        if options.file == '-':
+            rootfs_tar_path = temp_dir_path.joinpath('rootfs.tar')
+            input_file = HashingReader(os.fdopen(sys.stdin.fileno(), 'rb'))
+            with rootfs_tar_path.open('wb') as output_file:
+                log.debug('Start copying (%s) to (%s)', options.file, str(rootfs_tar_path))
+                shutil.copyfileobj(input_file, output_file)
+                log.debug('Finish copying (%s) to (%s)', options.file, str(rootfs_tar_path))
+            verify_digest(input_file.hexdigest(), options.sha256, options.file)
+            return rootfs_tar_path
+        if urlparse(options.file).scheme in ('http', 'https', 'ftp'):
+            # Partial downloads live under the root so they survive an interruption
+            download_dir_path = pathlib.Path(options.root, 'tmp', 'import')
+            download_dir_path.mkdir(parents=True, exist_ok=True)
+            url_digest = hashlib.sha256(options.file.encode('utf-8')).hexdigest()
+            rootfs_tar_path = download_dir_path.joinpath(url_digest)
+            download = Download(options.file, rootfs_tar_path,
+                sha256=options.sha256,
+                timeout=options.timeout,
+                connections=options.parallel,
+                retries=options.retries)
+            download.run()
+            # Moving it into the temporary directory removes it once imported
+            return pathlib.Path(shutil.move(str(rootfs_tar_path), str(temp_dir_path)))
+        rootfs_tar_path = pathlib.Path(options.file)
+        if not rootfs_tar_path.is_file():
+            raise OCIError('File (%s) does not exist' % options.file)
+        if options.sha256 is not None:
+            verify_digest(file_digest(rootfs_tar_path), options.sha256, options.file)
+        return rootfs_tar_path
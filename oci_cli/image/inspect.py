@@ -13,13 +13,70 @@
 # limitations under the License.
 
 
-import json
 import argparse
 import logging
 from oci_api.image import Distribution, ImageUnknownException
+from oci_cli.util import fastjson
+from oci_cli.util.format import Template
+from oci_cli.util.resolver import ImageResolver
+from .configs import ConfigCache
+from .layers import LayerMetadata
 
 log = logging.getLogger(__name__)
 
+class ImageDocument:
+    """Inspect output of an image, fields are computed when first accessed"""
+    def __init__(self, image, distribution, layer_metadata, config_cache):
+        self.image = image
+        self.distribution = distribution
+        self.layer_metadata = layer_metadata
+        self.config_cache = config_cache
+        self.config = None
+        self.fields = {
+            'Id': lambda: self.image.id,
+            'RepoTags': lambda: self.image.tags or None,
+            'RepoDigests': self.repo_digests,
+            'Size': lambda: self.config_cache.get_size(self.image),
+            'VirtualSize': self.virtual_size
+        }
+
+    def __getitem__(self, name):
+        if name in self.fields:
+            return self.fields[name]()
+        if name == 'History':
+            raise KeyError(name)
+        return self.get_config()[name]
+
+    def get_config(self):
+        if self.config is None:
+            self.config = self.config_cache.get(self.image)
+        return self.config
+
+    def repo_digests(self):
+        repositories = self.distribution.get_repositories(self.image)
+        if len(repositories) == 0:
+            return None
+        return [repository + '@' + self.image.digest for repository in repositories]
+
+    def virtual_size(self):
+        # Layers shared by the images in the batch are only measured once
+        return sum(self.layer_metadata.size(layer) for layer in self.image.layers)
+
+    def to_json(self):
+        """Indented JSON text, config fields are copied from the cache as
+        they are instead of being parsed and encoded again"""
+        fields = ['"Id": ' + fastjson.dumps(self.image.id)]
+        config = self.get_config()
+        for name in config.names():
+            if name != 'History':
+                fields.append(fastjson.dumps(name) + ': ' + config.get_text(name))
+        for name in ('Size', 'VirtualSize', 'RepoTags', 'RepoDigests'):
+            value = self[name]
+            if value is not None:
+                fields.append(fastjson.dumps(name) + ': ' +
+                    fastjson.dumps(value, indent=True, default=str))
+        return '{\n    ' + ',\n    '.join(field.replace('\n', '\n    ') for field in fields) + '\n}'
+
 class Inspect:
     @staticmethod
     def init_parser(image_subparsers, parent_parser):
@@ -28,6 +85,9 @@ class Inspect:
             formatter_class=argparse.ArgumentDefaultsHelpFormatter,
             description='Display detailed information on one or more images',
             help='Display detailed information on one or more images')
+        parser.add_argument('-f', '--format',
+            help='Format the output using the given Go template',
+            metavar='string')
         parser.add_argument('image',
             nargs='+', 
             metavar='IMAGE',
@@ -35,19 +95,33 @@ class Inspect:
  
     def __init__(self, options):
         distribution = Distribution()
-        for image_name in options.image:
-            try:
-                image = distribution.get_image(image_name)
-                image_json = image.config.to_dict(use_real_name=True)
-                image_json.pop('History')
-                image_json['Size'] = image.size()
-                image_json['VirtualSize'] = image.virtual_size()
-                if len(image.tags) > 0:
-                    image_json['RepoTags'] = image.tags
-                repositories = distribution.get_repositories(image)
-                if len(repositories) > 0:
-                    image_json['RepoDigests'] = [repository + '@' + image.digest for repository in repositories]
-                print(json.dumps(image_json, indent=4, default=str))
-            except ImageUnknownException:
+        layer_metadata = LayerMetadata(options.root)
+        config_cache = ConfigCache(options.root)
+        images = ImageResolver(options.root, distribution).resolve_all(options.image)
+        template = None
+        if options.format is not None:
+            template = Template(options.format)
+        else:
+            print('[')
+        first = True
+        for (image_name, image) in images:
+            if isinstance(image, ImageUnknownException):
                 log.error('Image (%s) does not exist' % image_name)
-                exit(-1)
+                continue
+            if isinstance(image, Exception):
+                log.error(image.args[0])
+                continue
+            document = ImageDocument(image, distribution, layer_metadata, config_cache)
+            if template is not None:
+                print(template.render(document), flush=True)
+                continue
+            image_json = document.to_json()
+            if not first:
+                print(',')
+            print('    ' + image_json.replace('\n', '\n    '), end='', flush=True)
+            first = False
+        if template is None:
+            print('\n]' if not first else ']')
+        layer_metadata.save()
+        if any(isinstance(image, Exception) for (_, image) in images):
+            exit(-1)
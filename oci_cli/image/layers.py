@@ -0,0 +1,123 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import pathlib
+import logging
+from oci_api.image import Distribution
+from oci_api.graph import Driver
+from oci_cli.util import fastjson
+from .files import record_layer_index
+
+log = logging.getLogger(__name__)
+
+class LayerIndex:
+    """Layers of all images keyed by (parent layer id, diff digest).
+
+    Driver layers are snapshots of their parent, so a layer can only stand in
+    for another one when both the diff and the parent match.
+    """
+    def __init__(self, distribution=None):
+        self.layers = {}
+        if distribution is None:
+            distribution = Distribution()
+        for image in distribution.images.values():
+            self.add_layers(image.layers)
+
+    def add_layers(self, layers):
+        parent_id = None
+        for layer in layers:
+            self.layers.setdefault((parent_id, layer.diff_digest), layer)
+            parent_id = layer.id
+
+    def find(self, parent, diff_digest):
+        parent_id = parent.id if parent is not None else None
+        return self.layers.get((parent_id, diff_digest))
+
+    def add(self, parent, layer):
+        parent_id = parent.id if parent is not None else None
+        self.layers.setdefault((parent_id, layer.diff_digest), layer)
+
+class LayerMetadata:
+    """Per layer facts recorded at creation time, stored under the root.
+
+    Layers are immutable once created, so entries never go stale; layers
+    created before the metadata existed are filled in on first use.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.path = pathlib.Path(root, 'cache', 'layers.json')
+        self.metadata = None
+        self.modified = False
+
+    def load(self):
+        if self.metadata is None:
+            try:
+                with self.path.open('rb') as metadata_file:
+                    self.metadata = fastjson.load(metadata_file)
+            except (OSError, ValueError):
+                self.metadata = {}
+        return self.metadata
+
+    def get(self, layer):
+        return self.load().get(layer.id)
+
+    def record(self, layer, **values):
+        metadata = self.load().setdefault(layer.id, {})
+        metadata.update(values)
+        self.modified = True
+
+    def size(self, layer):
+        metadata = self.get(layer)
+        if metadata is not None and 'Size' in metadata:
+            return metadata['Size']
+        size = layer.size()
+        self.record(layer, Size=size)
+        return size
+
+    def save(self):
+        if not self.modified:
+            return
+        # Merge with entries written by other processes since we loaded
+        metadata = self.metadata
+        self.metadata = None
+        current_metadata = self.load()
+        for (layer_id, values) in metadata.items():
+            current_metadata.setdefault(layer_id, {}).update(values)
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.path.with_name('%s.%d.tmp' % (self.path.name, os.getpid()))
+            temp_path.write_text(fastjson.dumps(current_metadata), encoding='utf-8')
+            temp_path.replace(self.path)
+            self.modified = False
+        except OSError as e:
+            log.debug('Could not save layer metadata (%s)' % e)
+
+def create_layer(filesystem, parent=None, index=None, metadata=None):
+    driver = Driver()
+    layer = driver.create_layer(filesystem)
+    if index is None:
+        index = LayerIndex()
+    existing_layer = index.find(parent, layer.diff_digest)
+    if existing_layer is None or existing_layer.id == layer.id:
+        index.add(parent, layer)
+        if metadata is not None:
+            metadata.record(layer, Size=layer.size())
+            metadata.save()
+            record_layer_index(metadata.root, layer, filesystem.path, parent)
+        return layer
+    log.info('Layer (%s) already exists as (%s), discarding it' %
+        (layer.small_id, existing_layer.small_id))
+    driver.remove_layer(layer)
+    return existing_layer
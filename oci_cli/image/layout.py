@@ -0,0 +1,247 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""OCI image layouts as written by Distribution.save_image() and read by
+Distribution.load_image().
+
+Layer blobs can be rewritten in place, for example into another format,
+and the configs, manifests and index that refer to them are updated to
+the new digests.
+"""
+
+import os
+import gzip
+import shutil
+import json
+import hashlib
+import tarfile
+import pathlib
+import tempfile
+import logging
+from oci_api import OCIError
+from oci_cli.util.compression import CompressionException, detect_codec, get_codec
+from oci_cli.util.fetch import FileReader
+from oci_cli.util.seekable import LANDMARK_NAMES, ORIGINAL_DIFF_ID_ANNOTATION, \
+    TOC_DIGEST_ANNOTATION, TOC_NAME, UNCOMPRESSED_SIZE_ANNOTATION, SeekableReader, \
+    convert_to_seekable, is_seekable, restore_tar
+
+log = logging.getLogger(__name__)
+
+BUFFER_SIZE = 1024 * 1024
+
+MANIFEST_MEDIA_TYPES = (
+    'application/vnd.oci.image.manifest.v1+json',
+    'application/vnd.docker.distribution.manifest.v2+json'
+)
+
+LAYER_MEDIA_TYPE = get_codec('gzip').media_type
+
+class HashingWriter:
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.hasher.update(data)
+        self.size += len(data)
+        return self.fileobj.write(data)
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def digest(self):
+        return 'sha256:' + self.hasher.hexdigest()
+
+class ImageLayout:
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.index_path = self.path.joinpath('index.json')
+        if not self.index_path.is_file():
+            raise OCIError('Directory (%s) is not an OCI image layout' % self.path)
+
+    def get_blob_path(self, digest):
+        (algorithm, _, hexdigest) = digest.partition(':')
+        return self.path.joinpath('blobs', algorithm, hexdigest)
+
+    def read_json(self, digest):
+        with self.get_blob_path(digest).open('rb') as blob_file:
+            return json.load(blob_file)
+
+    def write_json(self, data, descriptor):
+        content = json.dumps(data, separators=(',', ':')).encode()
+        digest = 'sha256:' + hashlib.sha256(content).hexdigest()
+        blob_path = self.get_blob_path(digest)
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        blob_path.write_bytes(content)
+        descriptor['digest'] = digest
+        descriptor['size'] = len(content)
+
+    def create_temp_blob(self):
+        """Return (file object, path) of a new temporary blob, add it with add_blob()"""
+        blobs_path = self.path.joinpath('blobs', 'sha256')
+        blobs_path.mkdir(parents=True, exist_ok=True)
+        (fd, temp_name) = tempfile.mkstemp(dir=str(blobs_path), prefix='.tmp-')
+        return (os.fdopen(fd, 'wb'), pathlib.Path(temp_name))
+
+    def add_blob(self, temp_path, digest):
+        temp_path.replace(self.get_blob_path(digest))
+
+    def rewrite_layers(self, convert):
+        """Call convert(descriptor, blob_path) for every layer of every image,
+        it returns None to keep the layer or (new descriptor, new diff id),
+        with a None diff id when the uncompressed contents did not change.
+        Returns the number of converted layers."""
+        with self.index_path.open() as index_file:
+            index = json.load(index_file)
+        converted = {}
+        obsolete = set()
+        referenced = set()
+        for manifest_descriptor in index.get('manifests', []):
+            if manifest_descriptor.get('mediaType') not in MANIFEST_MEDIA_TYPES:
+                continue
+            manifest = self.read_json(manifest_descriptor['digest'])
+            config = self.read_json(manifest['config']['digest'])
+            diff_ids = config.get('rootfs', {}).get('diff_ids', [])
+            changed = False
+            for (position, layer_descriptor) in enumerate(manifest['layers']):
+                digest = layer_descriptor['digest']
+                if digest not in converted:
+                    converted[digest] = convert(layer_descriptor, self.get_blob_path(digest))
+                if converted[digest] is None:
+                    continue
+                (new_descriptor, diff_id) = converted[digest]
+                manifest['layers'][position] = new_descriptor
+                if diff_id is not None and position < len(diff_ids):
+                    diff_ids[position] = diff_id
+                obsolete.add(digest)
+                changed = True
+            if changed:
+                obsolete.add(manifest['config']['digest'])
+                obsolete.add(manifest_descriptor['digest'])
+                self.write_json(config, manifest['config'])
+                self.write_json(manifest, manifest_descriptor)
+            referenced.add(manifest_descriptor['digest'])
+            referenced.add(manifest['config']['digest'])
+            referenced.update(layer['digest'] for layer in manifest['layers'])
+        temp_path = self.index_path.with_name('index.json.tmp')
+        with temp_path.open('w') as index_file:
+            json.dump(index, index_file)
+        temp_path.replace(self.index_path)
+        for digest in obsolete - referenced:
+            try:
+                self.get_blob_path(digest).unlink()
+            except FileNotFoundError:
+                pass
+        return sum(1 for result in converted.values() if result is not None)
+
+    def recompress_layers(self, compression, level=None):
+        """Rewrite every layer with another codec, diff ids do not change"""
+        target_codec = get_codec(compression)
+        if target_codec.media_type is None:
+            raise CompressionException('%s compression is not supported for image layers' %
+                compression)
+        def convert(descriptor, blob_path):
+            with blob_path.open('rb') as input_file:
+                (codec, input_file) = detect_codec(input_file)
+                if codec is target_codec and level is None:
+                    return None
+                (output_file, temp_path) = self.create_temp_blob()
+                with output_file:
+                    blob_writer = HashingWriter(output_file)
+                    with target_codec.open_writer(blob_writer, level) as compressed_file, \
+                            codec.open_reader(input_file) as layer_file:
+                        shutil.copyfileobj(layer_file, compressed_file, BUFFER_SIZE)
+            self.add_blob(temp_path, blob_writer.digest())
+            log.debug('Compressed layer (%s) with %s as (%s)' %
+                (descriptor['digest'], compression, blob_writer.digest()))
+            return ({
+                'mediaType': target_codec.media_type,
+                'digest': blob_writer.digest(),
+                'size': blob_writer.size
+            }, None)
+        return self.rewrite_layers(convert)
+
+    @staticmethod
+    def write_plain_tar(input_file, output_file):
+        """Copy the entries of the seekable blob input_file to output_file as
+        a PAX tar stream, leaving out the TOC and landmark entries"""
+        # GzipFile reads every gzip member, tarfile's own stream stops after
+        # the first one
+        with tarfile.open(fileobj=gzip.GzipFile(fileobj=input_file), mode='r|') as input_tar, \
+                tarfile.open(fileobj=output_file, mode='w|',
+                    format=tarfile.PAX_FORMAT) as output_tar:
+            for tar_info in input_tar:
+                if tar_info.name in (TOC_NAME,) + LANDMARK_NAMES:
+                    continue
+                fileobj = input_tar.extractfile(tar_info) if tar_info.isreg() else None
+                output_tar.addfile(tar_info, fileobj)
+                input_tar.members.clear()
+                output_tar.members.clear()
+
+    def convert_to_seekable(self, chunk_size):
+        def convert(descriptor, blob_path):
+            if TOC_DIGEST_ANNOTATION in (descriptor.get('annotations') or {}):
+                return None
+            (output_file, temp_path) = self.create_temp_blob()
+            with output_file, blob_path.open('rb') as input_file:
+                writer = convert_to_seekable(input_file, output_file, chunk_size)
+            self.add_blob(temp_path, writer.digest)
+            log.debug('Converted layer (%s) to seekable (%s)' % (descriptor['digest'], writer.digest))
+            return ({
+                'mediaType': LAYER_MEDIA_TYPE,
+                'digest': writer.digest,
+                'size': writer.offset,
+                'annotations': {
+                    TOC_DIGEST_ANNOTATION: writer.toc_digest,
+                    UNCOMPRESSED_SIZE_ANNOTATION: str(writer.uncompressed_size),
+                    ORIGINAL_DIFF_ID_ANNOTATION: writer.original_diff_id
+                }
+            }, writer.diff_id)
+        return self.rewrite_layers(convert)
+
+    def convert_from_seekable(self):
+        """Rewrite seekable layers as plain tar+gzip without the TOC entries.
+        Layers converted by convert_to_seekable() get back their original tar,
+        and so their original diff id, from the raw headers kept in the TOC.
+        Seekable layers made by other tools do not have them, their entries are
+        written again as PAX headers and their diff ids change."""
+        def convert(descriptor, blob_path):
+            source = FileReader(blob_path)
+            try:
+                if not is_seekable(source):
+                    return None
+                toc = SeekableReader(source).toc
+            finally:
+                source.close()
+            (output_file, temp_path) = self.create_temp_blob()
+            with output_file, blob_path.open('rb') as input_file:
+                blob_writer = HashingWriter(output_file)
+                with get_codec('gzip').open_writer(blob_writer) as compressed_file:
+                    diff_writer = HashingWriter(compressed_file)
+                    if not restore_tar(input_file, toc, diff_writer):
+                        input_file.seek(0)
+                        self.write_plain_tar(input_file, diff_writer)
+            original_diff_id = (descriptor.get('annotations') or {}).get(ORIGINAL_DIFF_ID_ANNOTATION)
+            if original_diff_id is not None and original_diff_id != diff_writer.digest():
+                temp_path.unlink()
+                raise OCIError('Layer (%s) did not restore to its original diff id (%s)' %
+                    (descriptor['digest'], original_diff_id))
+            self.add_blob(temp_path, blob_writer.digest())
+            return ({
+                'mediaType': LAYER_MEDIA_TYPE,
+                'digest': blob_writer.digest(),
+                'size': blob_writer.size
+            }, diff_writer.digest())
+        return self.rewrite_layers(convert)
@@ -19,7 +19,12 @@ import sys
 import logging
 from oci_api import OCIError
 from oci_api.image import Distribution, ImageExistsException
-from oci_api.util.file import untar
+from oci_cli.util import journal
+from oci_cli.util.archive import extract_tar
+from oci_cli.util.compression import open_decompressed
+from oci_cli.util.lock import StoreLock, TAGS
+from oci_cli.util.resolver import ImageResolver
+from .layout import ImageLayout
 
 log = logging.getLogger(__name__)
 
@@ -44,17 +49,27 @@ class Load:
         try:
             with tempfile.TemporaryDirectory() as tmp_dir_name:
                 tmp_dir_path = pathlib.Path(tmp_dir_name)
-                input_file = sys.stdin
+                input_file = sys.stdin.buffer
                 if options.input != 'STDIN':
                     input_file = open(options.input, 'rb')
                 log.debug('Start receiving tar from %s' % options.input)
-                untar(tmp_dir_path, tar_file=input_file)
+                extract_tar(open_decompressed(input_file), tmp_dir_path)
                 log.debug('Finish receiving tar from %s' % options.input)
-                distribution = Image.distribution()
-                distribution.load_image(image_name, tmp_dir_path)
+                if tmp_dir_path.joinpath('index.json').is_file():
+                    converted = ImageLayout(tmp_dir_path).convert_from_seekable()
+                    if converted != 0:
+                        log.debug('Converted %d seekable layers' % converted)
+                with StoreLock(options.root, TAGS):
+                    distribution = Distribution()
+                    image = distribution.load_image(image_name, tmp_dir_path)
+                    ImageResolver.invalidate(options.root)
+                    journal.record(options.root, 'image', 'load', image.id, name=image_name)
         except ImageExistsException:
             log.error('Image (%s) already exists' % image_name)
             exit(-1)
+        except OCIError as e:
+            log.error(e.args[0])
+            exit(-1)
         except Exception as e:
             raise e
             log.error('Could not remove image (%s)' % image_name)
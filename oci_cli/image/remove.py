@@ -19,6 +19,9 @@ import logging
 from oci_api import OCIError
 from oci_api.image import Distribution, ImageInUseException, ImageUnknownException
 from oci_api.runtime import Runtime
+from oci_cli.util import journal
+from oci_cli.util.lock import StoreLock, TAGS, image_lock_name
+from oci_cli.util.resolver import AmbiguousReferenceException, ImageResolver
 
 log = logging.getLogger(__name__)
 
@@ -44,10 +47,15 @@ class Remove:
  
     def __init__(self, options):
         distribution = Distribution()
+        resolver = ImageResolver(options.root, distribution)
         for image_name in options.image:
             try:
-                image = distribution.get_image(image_name)
-                distribution.remove_image(image, options.force)
+                image = resolver.resolve(image_name)
+                with StoreLock(options.root, image_lock_name(image)), \
+                        StoreLock(options.root, TAGS):
+                    Distribution().remove_image(image, options.force)
+                    ImageResolver.invalidate(options.root)
+                    journal.record(options.root, 'image', 'delete', image.id, name=image_name)
             except ImageInUseException:
                 runtime = Runtime()
                 containers =  runtime.get_containers_using_image(image.id)
@@ -58,6 +66,9 @@ class Remove:
             except ImageUnknownException:
                 log.error('Image (%s) does not exist' % image_name)
                 exit(-1)
+            except AmbiguousReferenceException as e:
+                log.error(e.args[0])
+                exit(-1)
             except Exception as e:
                 log.error('Could not remove image (%s)' % image_name)
                 raise e
@@ -16,8 +16,12 @@ import argparse
 import pathlib
 import tempfile
 import logging
+from oci_api import OCIError
 from oci_api.image import Distribution, ImageUnknownException
 from oci_api.util.file import tar
+from oci_cli.util.compression import add_compression_arguments
+from oci_cli.util.seekable import CHUNK_SIZE
+from .layout import ImageLayout
 
 log = logging.getLogger(__name__)
 
@@ -33,18 +37,36 @@ class Save:
             help='Write to a file',
             default='STDOUT',
             metavar='string')
+        add_compression_arguments(parser, default=None,
+            help='Recompress the image layers, kept as stored by default')
+        parser.add_argument('--seekable',
+            help='Write layers in the seekable eStargz format, with a table of contents',
+            action='store_true')
+        parser.add_argument('--chunk-size',
+            help='Size of the independently compressed chunks of seekable layers',
+            type=int,
+            default=CHUNK_SIZE,
+            metavar='int')
         parser.add_argument('image',
             nargs='+',
             metavar='IMAGE',
             help='Name of the image to save')
   
     def __init__(self, options):
+        if options.seekable and options.compression not in (None, 'gzip'):
+            log.error('Seekable layers are always compressed with gzip')
+            exit(-1)
         try:
             with tempfile.TemporaryDirectory() as tmp_dir_name:
                 tmp_dir_path = pathlib.Path(tmp_dir_name)
-                distribution = Image.distribution()
+                distribution = Distribution()
                 for image_name in options.image:
                     distribution.save_image(image_name, tmp_dir_path)
+                if options.seekable:
+                    ImageLayout(tmp_dir_path).convert_to_seekable(options.chunk_size)
+                elif options.compression is not None:
+                    ImageLayout(tmp_dir_path).recompress_layers(options.compression,
+                        options.compression_level)
                 tar_file_path = None
                 if options.output != 'STDOUT':
                     tar_file_path = pathlib.Path(options.output)
@@ -53,4 +75,7 @@ class Save:
         except ImageUnknownException as e:
             log.error(e.args[0])
             exit(-1)
+        except OCIError as e:
+            log.error(e.args[0])
+            exit(-1)
            
\ No newline at end of file
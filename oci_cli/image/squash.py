@@ -0,0 +1,130 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import contextlib
+import functools
+import json
+import tempfile
+import logging
+from oci_api import OCIError
+from oci_api.image import Distribution, ImageUnknownException
+from oci_api.graph import Driver
+from oci_cli.util import journal
+from oci_cli.util.archive import TarExtractor, TarMerger
+from oci_cli.util.compression import open_decompressed
+from oci_cli.util.lock import StoreLock, TAGS, image_lock_name, layer_lock_name
+from oci_cli.util.resolver import ImageResolver
+from .layers import LayerIndex, LayerMetadata, create_layer
+from .layout import ImageLayout
+
+log = logging.getLogger(__name__)
+
+@contextlib.contextmanager
+def open_layer(blob_path):
+    with open(str(blob_path), 'rb') as blob_file:
+        yield open_decompressed(blob_file)
+
+def squash_history(config, start, count):
+    """Mark the history entries of all but the last of the count layers
+    from start as empty, the last one is the squashed layer"""
+    history = config.get('History') or []
+    layer_index = 0
+    squashed = []
+    for history_item in history:
+        if history_item.get('EmptyLayer'):
+            continue
+        if start <= layer_index < start + count:
+            squashed.append(history_item)
+        layer_index += 1
+    if len(squashed) != count:
+        log.warning('History of the image does not match its layers, left as is')
+        return
+    for history_item in squashed[:-1]:
+        history_item['EmptyLayer'] = True
+    squashed[-1]['Comment'] = 'merged %d layers' % count
+
+def squash_image(root, distribution, image, start, layer_metadata=None):
+    """Merge the layers of image from start up into one layer, returns the
+    config and the layers of the squashed image"""
+    layers = image.layers
+    parent = layers[start - 1] if start != 0 else None
+    with tempfile.TemporaryDirectory() as temp_dir_name:
+        with StoreLock(root, image_lock_name(image), shared=True):
+            distribution.save_image(image.id, temp_dir_name)
+        layout = ImageLayout(temp_dir_name)
+        with layout.index_path.open() as index_file:
+            manifest = layout.read_json(json.load(index_file)['manifests'][0]['digest'])
+        blob_paths = [layout.get_blob_path(descriptor['digest'])
+            for descriptor in manifest['layers'][start:]]
+        merger = TarMerger([functools.partial(open_layer, blob_path) for blob_path in blob_paths])
+        merger.scan()
+        filesystem = Driver().create_filesystem(parent)
+        count = TarExtractor(filesystem.path, whiteouts=True).extract_members(merger.members())
+    log.debug('Merged %d layers into %d members' % (len(blob_paths), count))
+    with StoreLock(root, layer_lock_name(parent)):
+        layer = create_layer(filesystem, parent, LayerIndex(distribution), layer_metadata)
+    config = image.config.copy()
+    squash_history(config, start, len(layers) - start)
+    squashed_layers = layers[:start] + [layer]
+    config['RootFS']['DiffIds'] = [squashed_layer.diff_digest for squashed_layer in squashed_layers]
+    return (config, squashed_layers)
+
+class Squash:
+    @staticmethod
+    def init_parser(image_subparsers, parent_parser):
+        parser = image_subparsers.add_parser('squash',
+            parents=[parent_parser],
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+            description='Merge the top layers of an image into one layer',
+            help='Merge the top layers of an image into one layer')
+        parser.add_argument('-n', '--layers',
+            help='Number of top layers to merge, all of them when 0',
+            type=int,
+            default=0,
+            metavar='int')
+        parser.add_argument('-t', '--tag',
+            action='append',
+            help='Name and optionally a tag in the "name:tag" format, the tags of IMAGE move to the squashed image by default',
+            metavar='list')
+        parser.add_argument('image',
+            metavar='IMAGE',
+            help='Name of the image to squash')
+
+    def __init__(self, options):
+        distribution = Distribution()
+        try:
+            image = ImageResolver(options.root, distribution).resolve(options.image)
+            start = 0
+            if options.layers > 0:
+                start = max(len(image.layers) - options.layers, 0)
+            if len(image.layers) - start < 2:
+                log.info('Image (%s) has no layers to merge' % options.image)
+                return
+            (config, layers) = squash_image(options.root, distribution, image, start,
+                LayerMetadata(options.root))
+            with StoreLock(options.root, TAGS):
+                squashed_image = distribution.create_image(config, layers)
+                for tag in options.tag or list(image.tags):
+                    distribution.add_tag(squashed_image, tag)
+                ImageResolver.invalidate(options.root)
+                journal.record(options.root, 'image', 'squash', squashed_image.id,
+                    name=','.join(squashed_image.tags), source=image.id)
+        except ImageUnknownException:
+            log.error('Image (%s) does not exist' % options.image)
+            exit(-1)
+        except OCIError as e:
+            log.error(e.args[0])
+            exit(-1)
+        log.info('Created image (%s) merging %d layers' % (squashed_image.id, len(image.layers) - start))
@@ -0,0 +1,559 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Mirror images to another storage root, local or reached through ssh or
+STDIN/STDOUT, sending only the layers the peer does not have yet.
+
+The peer runs "oci image sync --receive". Both ends exchange messages, a
+line of JSON followed by Size bytes of payload for blobs:
+
+    hello   version of the protocol, the receiver answers with its session
+    offer   the images with their tags and layer diff ids
+    want    the diff ids the receiver is missing, the images it has already
+    blob    a layer, manifest or config blob, checked against its digest
+    load    an image whose blobs were all sent
+    done    end of a data stream, answered with received
+    bye     end of the session
+
+With --parallel, layers are sent through more peers that join the session
+of the first one and write to the same staging directory.
+"""
+
+import os
+import re
+import sys
+import json
+import uuid
+import shlex
+import shutil
+import hashlib
+import pathlib
+import argparse
+import tempfile
+import subprocess
+import urllib.parse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import humanize
+from oci_api import OCIError
+from oci_api.image import Distribution, ImageExistsException, ImageUnknownException
+from oci_cli.util import journal
+from oci_cli.util.lock import StoreLock, TAGS, image_lock_name
+from oci_cli.util.resolver import ImageResolver
+from .layout import MANIFEST_MEDIA_TYPES, ImageLayout
+
+log = logging.getLogger(__name__)
+
+PROTOCOL_VERSION = 1
+
+BUFFER_SIZE = 1024 * 1024
+
+SESSION_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+DIGEST_PATTERN = re.compile(r'^sha256:[0-9a-f]{64}$')
+
+REF_NAME_ANNOTATION = 'org.opencontainers.image.ref.name'
+
+class SyncException(OCIError):
+    pass
+
+class Channel:
+    """Messages to and from a peer over a pair of byte streams"""
+    def __init__(self, input_file, output_file):
+        self.input_file = input_file
+        self.output_file = output_file
+
+    def send(self, message_type, payload_path=None, **fields):
+        message = dict(fields, Type=message_type)
+        if payload_path is not None:
+            message['Size'] = os.stat(str(payload_path)).st_size
+        self.output_file.write((json.dumps(message, separators=(',', ':')) + '\n').encode('utf-8'))
+        if payload_path is not None:
+            with open(str(payload_path), 'rb') as payload_file:
+                shutil.copyfileobj(payload_file, self.output_file, BUFFER_SIZE)
+        self.output_file.flush()
+
+    def receive(self, *message_types):
+        line = self.input_file.readline()
+        if len(line) == 0:
+            raise SyncException('Connection closed by peer')
+        try:
+            message = json.loads(line.decode('utf-8'))
+        except ValueError:
+            raise SyncException('Invalid message from peer')
+        if message.get('Type') == 'error':
+            raise SyncException('Peer failed (%s)' % message.get('Message'))
+        if len(message_types) != 0 and message.get('Type') not in message_types:
+            raise SyncException('Unexpected message (%s) from peer' % message.get('Type'))
+        return message
+
+    def receive_payload(self, message, output_file):
+        """Copy the payload of message to output_file, returns its digest"""
+        hasher = hashlib.sha256()
+        remaining = message['Size']
+        while remaining > 0:
+            data = self.input_file.read(min(remaining, BUFFER_SIZE))
+            if len(data) == 0:
+                raise SyncException('Connection closed by peer')
+            hasher.update(data)
+            output_file.write(data)
+            remaining -= len(data)
+        return 'sha256:' + hasher.hexdigest()
+
+def open_stdio_channel():
+    """Channel over STDIN/STDOUT, anything else written to STDOUT goes to
+    STDERR instead of corrupting the messages"""
+    output_file = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    return Channel(sys.stdin.buffer, output_file)
+
+class Peer:
+    """An oci process receiving images, connected through its STDIN/STDOUT"""
+    def __init__(self, command):
+        log.debug('Starting peer (%s)' % ' '.join(command))
+        try:
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE)
+        except OSError as e:
+            raise SyncException('Could not start peer (%s)' % e)
+        self.channel = Channel(self.process.stdout, self.process.stdin)
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        return self.process.wait()
+
+def get_peer_command(destination, peer_command, log_level):
+    """Command that runs the receiving end for destination, a storage root
+    path or ssh://[USER@]HOST[:PORT][/PATH]"""
+    root = destination
+    if destination.startswith('ssh://'):
+        url = urllib.parse.urlsplit(destination)
+        if url.hostname is None:
+            raise SyncException('Destination (%s) has no host' % destination)
+        host = url.hostname
+        if url.username is not None:
+            host = url.username + '@' + host
+        command = ['ssh', '-e', 'none']
+        if url.port is not None:
+            command += ['-p', str(url.port)]
+        command += [host] + shlex.split(peer_command or 'oci')
+        root = url.path if url.path not in ('', '/') else None
+    elif peer_command is not None:
+        command = shlex.split(peer_command)
+    else:
+        command = [sys.executable, '-m', 'oci_cli.cli']
+    command += ['--log-level', log_level]
+    if root is not None:
+        command += ['--root', root]
+    return command + ['image', 'sync', '--receive']
+
+class ImageOffer:
+    """An image offered to the peer, saved to a layout once the peer wants it"""
+    def __init__(self, image):
+        self.image = image
+        self.diff_ids = [layer.diff_digest for layer in image.layers]
+        self.layout = None
+
+    def save(self, root, distribution, layout_path):
+        with StoreLock(root, image_lock_name(self.image), shared=True):
+            distribution.save_image(self.image.id, layout_path)
+        self.layout = ImageLayout(layout_path)
+        with self.layout.index_path.open() as index_file:
+            self.manifest_digest = json.load(index_file)['manifests'][0]['digest']
+        manifest = self.layout.read_json(self.manifest_digest)
+        self.config_digest = manifest['config']['digest']
+        config = self.layout.read_json(self.config_digest)
+        if config['rootfs']['diff_ids'] != self.diff_ids:
+            raise SyncException('Image (%s) changed while it was being copied' % self.image.small_id)
+        if len(self.diff_ids) != len(manifest['layers']):
+            raise SyncException('Image (%s) has %d layers in its config and %d in its manifest' %
+                (self.image.small_id, len(self.diff_ids), len(manifest['layers'])))
+        self.layer_digests = [descriptor['digest'] for descriptor in manifest['layers']]
+
+    def to_dict(self):
+        return {
+            'Id': self.image.id,
+            'Tags': self.image.tags,
+            'DiffIds': self.diff_ids
+        }
+
+class Sync:
+    @staticmethod
+    def init_parser(image_subparsers, parent_parser):
+        parser = image_subparsers.add_parser('sync',
+            parents=[parent_parser],
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+            description='Copy images to another storage root, sending only the layers it does not have',
+            help='Copy images to another storage root')
+        parser.add_argument('-t', '--to',
+            help='Destination, a root directory, ssh://[USER@]HOST[:PORT][/PATH] or - for a peer on STDIN/STDOUT',
+            metavar='string')
+        parser.add_argument('-a', '--all',
+            help='Copy all tagged images',
+            action='store_true')
+        parser.add_argument('-p', '--parallel',
+            help='Number of streams sending layers',
+            type=int,
+            default=4,
+            metavar='int')
+        parser.add_argument('--peer-command',
+            help='Command running oci on the destination, defaults to oci for ssh and this interpreter otherwise',
+            metavar='string')
+        parser.add_argument('--receive',
+            help='Receive images on STDIN/STDOUT, as the destination of a sync',
+            action='store_true')
+        parser.add_argument('--session',
+            help=argparse.SUPPRESS)
+        parser.add_argument('image',
+            nargs='*',
+            metavar='IMAGE',
+            help='Name of the image to copy')
+
+    def __init__(self, options):
+        self.root = options.root
+        self.options = options
+        self.distribution = Distribution()
+        try:
+            if options.receive:
+                Receiver(options.root, self.distribution, options.session).run()
+                return
+            if options.to is None:
+                log.error('Specify a destination with --to')
+                exit(-1)
+            if options.all == (len(options.image) != 0):
+                log.error('Specify either images or --all')
+                exit(-1)
+            if not self.send():
+                exit(-1)
+        except OCIError as e:
+            log.error(e.args[0])
+            exit(-1)
+
+    def get_images(self):
+        if self.options.all:
+            return [image for image in self.distribution.images.values() if len(image.tags) != 0]
+        images = []
+        resolver = ImageResolver(self.root, self.distribution)
+        for (image_name, image) in resolver.resolve_all(self.options.image):
+            if isinstance(image, ImageUnknownException):
+                raise SyncException('Image (%s) does not exist' % image_name)
+            elif isinstance(image, Exception):
+                raise image
+            elif len(image.tags) == 0:
+                raise SyncException('Image (%s) has no tag to copy it as' % image_name)
+            elif image not in images:
+                images.append(image)
+        return images
+
+    def connect(self, session=None):
+        if self.options.to == '-':
+            channel = open_stdio_channel()
+            peer = None
+        else:
+            command = get_peer_command(self.options.to, self.options.peer_command,
+                self.options.log_level)
+            if session is not None:
+                command += ['--session', session]
+            peer = Peer(command)
+            channel = peer.channel
+        channel.send('hello', Version=PROTOCOL_VERSION)
+        message = channel.receive('hello')
+        if message.get('Version') != PROTOCOL_VERSION:
+            raise SyncException('Peer speaks version %s of the protocol, not %d' %
+                (message.get('Version'), PROTOCOL_VERSION))
+        return (peer, channel, message['Session'])
+
+    def send(self):
+        """Returns whether all the images were copied"""
+        offers = [ImageOffer(image) for image in self.get_images()]
+        (peer, channel, session) = self.connect()
+        try:
+            return self.send_images(channel, session, offers)
+        finally:
+            if peer is not None:
+                peer.close()
+
+    def send_images(self, channel, session, offers):
+        channel.send('offer', Images=[offer.to_dict() for offer in offers])
+        message = channel.receive('want')
+        wanted = set(message['DiffIds'])
+        current = set(message['Current'])
+        offered = set(diff_id for offer in offers for diff_id in offer.diff_ids)
+        # Only the images the peer does not have yet are saved, the layers
+        # come from the layouts of the first ones that have them
+        with tempfile.TemporaryDirectory() as temp_dir_name:
+            blobs = {}
+            for (index, offer) in enumerate(offers):
+                if offer.image.id in current:
+                    continue
+                offer.save(self.root, self.distribution, pathlib.Path(temp_dir_name, str(index)))
+                for (diff_id, digest) in zip(offer.diff_ids, offer.layer_digests):
+                    if diff_id in wanted and digest not in blobs:
+                        blobs[digest] = offer.layout.get_blob_path(digest)
+            self.send_blobs(channel, session, blobs)
+            sent_size = sum(blob_path.stat().st_size for blob_path in blobs.values())
+            failed = 0
+            for offer in offers:
+                if offer.image.id in current:
+                    log.info('Image (%s) is up to date' % offer.image.small_id)
+                    continue
+                for digest in (offer.config_digest, offer.manifest_digest):
+                    channel.send('blob', offer.layout.get_blob_path(digest), Digest=digest)
+                channel.send('load', Id=offer.image.id, Tags=offer.image.tags,
+                    Manifest=offer.manifest_digest)
+                message = channel.receive('loaded', 'failed')
+                if message['Type'] == 'failed':
+                    log.error('Image (%s) was not copied (%s)' % (offer.image.small_id, message['Message']))
+                    failed += 1
+                    continue
+                log.info('Copied image (%s) as %s' % (offer.image.small_id, ', '.join(message['Tags'])))
+                journal.record(self.root, 'image', 'sync', offer.image.id, destination=self.options.to)
+        channel.send('bye')
+        log.info('Sent %d of %d layers (%s)' % (len(blobs), len(offered), humanize.naturalsize(sent_size)))
+        return failed == 0
+
+    def send_blobs(self, channel, session, blobs):
+        if len(blobs) == 0:
+            return
+        streams = min(self.options.parallel, len(blobs))
+        if streams <= 1 or self.options.to == '-':
+            for (digest, blob_path) in blobs.items():
+                channel.send('blob', blob_path, Digest=digest)
+            return
+        # Largest first, each to the stream with the fewest bytes queued
+        queues = [[] for _ in range(streams)]
+        queued = [0] * streams
+        for (digest, blob_path) in sorted(blobs.items(), key=lambda item: -item[1].stat().st_size):
+            index = queued.index(min(queued))
+            queues[index].append((digest, blob_path))
+            queued[index] += blob_path.stat().st_size
+        with ThreadPoolExecutor(max_workers=streams) as executor:
+            futures = [executor.submit(self.send_stream, session, queue) for queue in queues]
+            for future in futures:
+                future.result()
+
+    def send_stream(self, session, queue):
+        (peer, channel, _) = self.connect(session)
+        try:
+            for (digest, blob_path) in queue:
+                channel.send('blob', blob_path, Digest=digest)
+            channel.send('done')
+            message = channel.receive('received')
+            if message['Count'] != len(queue):
+                raise SyncException('Peer received %d of %d layers' % (message['Count'], len(queue)))
+        finally:
+            peer.close()
+
+class Receiver:
+    """The end of a sync that loads the images, or one of its data streams
+    when joining an existing session"""
+    def __init__(self, root, distribution, session=None):
+        self.root = root
+        self.distribution = distribution
+        self.channel = open_stdio_channel()
+        self.session = session
+        self.local_layers = None
+        self.local_layouts = {}
+        self.received = 0
+
+    def run(self):
+        try:
+            message = self.channel.receive('hello')
+            if message.get('Version') != PROTOCOL_VERSION:
+                raise SyncException('Peer speaks version %s of the protocol, not %d' %
+                    (message.get('Version'), PROTOCOL_VERSION))
+            self.start_session()
+            try:
+                self.channel.send('hello', Version=PROTOCOL_VERSION, Session=self.session)
+                self.serve()
+            finally:
+                if self.owner:
+                    shutil.rmtree(str(self.staging_path), ignore_errors=True)
+        except (OCIError, OSError) as e:
+            try:
+                self.channel.send('error', Message=str(e.args[0] if e.args else e))
+            except OSError:
+                pass
+            raise
+
+    def start_session(self):
+        self.owner = self.session is None
+        if self.owner:
+            self.session = uuid.uuid4().hex
+        elif SESSION_PATTERN.match(self.session) is None:
+            raise SyncException('Invalid session (%s)' % self.session)
+        self.staging_path = pathlib.Path(self.root, 'tmp', 'sync', self.session)
+        self.blobs_path = self.staging_path.joinpath('blobs', 'sha256')
+        if self.owner:
+            self.blobs_path.mkdir(parents=True)
+        elif not self.blobs_path.is_dir():
+            raise SyncException('Session (%s) does not exist' % self.session)
+
+    def serve(self):
+        while True:
+            message = self.channel.receive()
+            message_type = message.get('Type')
+            if message_type == 'blob':
+                self.receive_blob(message)
+            elif message_type == 'done':
+                self.channel.send('received', Count=self.received)
+                return
+            elif message_type == 'bye':
+                return
+            elif message_type == 'offer' and self.owner:
+                self.channel.send('want', **self.negotiate(message['Images']))
+            elif message_type == 'load' and self.owner:
+                self.load(message)
+            else:
+                raise SyncException('Unexpected message (%s) from peer' % message_type)
+
+    def receive_blob(self, message):
+        digest = message['Digest']
+        if DIGEST_PATTERN.match(digest) is None:
+            raise SyncException('Invalid digest (%s)' % digest)
+        blob_path = self.blobs_path.joinpath(digest[7:])
+        temp_path = self.blobs_path.joinpath('%s.%d.tmp' % (digest[7:], os.getpid()))
+        with temp_path.open('wb') as blob_file:
+            actual_digest = self.channel.receive_payload(message, blob_file)
+        if actual_digest != digest:
+            temp_path.unlink()
+            raise SyncException('Blob (%s) does not match its digest' % digest)
+        temp_path.replace(blob_path)
+        self.received += 1
+
+    def get_local_layers(self):
+        """Local images by the diff ids of their layers"""
+        if self.local_layers is None:
+            self.local_layers = {}
+            for image in self.distribution.images.values():
+                for layer in image.layers:
+                    self.local_layers.setdefault(layer.diff_digest, image)
+        return self.local_layers
+
+    def negotiate(self, offers):
+        local_layers = self.get_local_layers()
+        wanted = []
+        current = []
+        for offer in offers:
+            if self.is_current(offer):
+                current.append(offer['Id'])
+                continue
+            for diff_id in offer['DiffIds']:
+                if diff_id not in local_layers and diff_id not in wanted:
+                    wanted.append(diff_id)
+        log.debug('Missing %d layers of %d images' % (len(wanted), len(offers) - len(current)))
+        return {'DiffIds': wanted, 'Current': current}
+
+    def is_current(self, offer):
+        """Whether every tag of the offer is an image with the same layers"""
+        for tag in offer['Tags']:
+            try:
+                image = self.distribution.get_image(tag)
+            except ImageUnknownException:
+                return False
+            if [layer.diff_digest for layer in image.layers] != offer['DiffIds']:
+                return False
+        return True
+
+    def get_local_blob(self, diff_id):
+        """(descriptor, path) of the blob of a local layer, saving the image
+        that has it once"""
+        image = self.get_local_layers()[diff_id]
+        if image.id not in self.local_layouts:
+            layout_path = self.staging_path.joinpath('local', image.id)
+            with StoreLock(self.root, image_lock_name(image), shared=True):
+                self.distribution.save_image(image.id, layout_path)
+            layout = ImageLayout(layout_path)
+            with layout.index_path.open() as index_file:
+                manifest = layout.read_json(json.load(index_file)['manifests'][0]['digest'])
+            config = layout.read_json(manifest['config']['digest'])
+            self.local_layouts[image.id] = (layout,
+                dict(zip(config['rootfs']['diff_ids'], manifest['layers'])))
+        (layout, descriptors) = self.local_layouts[image.id]
+        descriptor = descriptors[diff_id]
+        return (descriptor, layout.get_blob_path(descriptor['digest']))
+
+    def load(self, message):
+        tags = message['Tags']
+        layout_path = self.staging_path.joinpath('images', message['Id'])
+        try:
+            self.make_layout(layout_path, message['Manifest'], tags[0])
+            added = []
+            with StoreLock(self.root, TAGS):
+                try:
+                    image = self.distribution.load_image(tags[0], layout_path)
+                    added.append(tags[0])
+                except ImageExistsException:
+                    image = None
+                for tag in tags[1:]:
+                    if image is None:
+                        break
+                    try:
+                        self.distribution.add_tag(image, tag)
+                        added.append(tag)
+                    except OCIError as e:
+                        log.warning(e.args[0])
+                ImageResolver.invalidate(self.root)
+            if image is None:
+                raise ImageExistsException('Image (%s) already exists' % tags[0])
+            self.local_layers = None
+            journal.record(self.root, 'image', 'sync', image.id, name=tags[0])
+            self.channel.send('loaded', Tags=added)
+        except (OCIError, OSError, ValueError, KeyError) as e:
+            log.error('Could not load image (%s)' % tags[0])
+            self.channel.send('failed', Message=str(e.args[0] if e.args else e))
+        finally:
+            shutil.rmtree(str(layout_path), ignore_errors=True)
+
+    def make_layout(self, layout_path, manifest_digest, tag):
+        """Layout of one image, from the received blobs and the local ones of
+        the layers that were not sent"""
+        blobs_path = layout_path.joinpath('blobs', 'sha256')
+        blobs_path.mkdir(parents=True)
+        manifest = json.loads(self.blobs_path.joinpath(manifest_digest[7:]).read_bytes())
+        config_digest = manifest['config']['digest']
+        link_blob(self.blobs_path.joinpath(config_digest[7:]), blobs_path.joinpath(config_digest[7:]))
+        diff_ids = json.loads(self.blobs_path.joinpath(config_digest[7:]).read_bytes())['rootfs']['diff_ids']
+        for (index, diff_id) in enumerate(diff_ids):
+            digest = manifest['layers'][index]['digest']
+            blob_path = self.blobs_path.joinpath(digest[7:])
+            if not blob_path.is_file():
+                (descriptor, blob_path) = self.get_local_blob(diff_id)
+                manifest['layers'][index] = descriptor
+                digest = descriptor['digest']
+            link_blob(blob_path, blobs_path.joinpath(digest[7:]))
+        content = json.dumps(manifest, separators=(',', ':')).encode('utf-8')
+        manifest_descriptor = {
+            'mediaType': manifest.get('mediaType', MANIFEST_MEDIA_TYPES[0]),
+            'digest': 'sha256:' + hashlib.sha256(content).hexdigest(),
+            'size': len(content),
+            'annotations': {REF_NAME_ANNOTATION: tag}
+        }
+        blobs_path.joinpath(manifest_descriptor['digest'][7:]).write_bytes(content)
+        layout_path.joinpath('index.json').write_text(json.dumps({
+            'schemaVersion': 2,
+            'manifests': [manifest_descriptor]
+        }))
+        layout_path.joinpath('oci-layout').write_text(json.dumps({'imageLayoutVersion': '1.0.0'}))
+
+def link_blob(source_path, target_path):
+    if target_path.exists():
+        return
+    try:
+        os.link(str(source_path), str(target_path))
+    except OSError:
+        shutil.copyfile(str(source_path), str(target_path))
@@ -26,6 +26,9 @@ from oci_api import OCIError
 from oci_api.util.file import untar
 from oci_api.image import Distribution
 from oci_api.graph import Driver
+from oci_cli.util import journal
+from oci_cli.util.lock import StoreLock, TAGS
+from oci_cli.util.resolver import ImageResolver
 log = logging.getLogger(__name__)
 
 class Tag:
@@ -47,10 +50,14 @@ class Tag:
   
     def __init__(self, options):
         log.debug('Start adding tag (%s) to image (%s)' % (options.tag, options.image))
-        distribution = Distribution()
         try:
-            image = distribution.get_image(options.image)
-            distribution.add_tag(image, options.tag)
+            with StoreLock(options.root, TAGS):
+                # Loaded under the lock so concurrent tag changes are not lost
+                distribution = Distribution()
+                image = ImageResolver(options.root, distribution).resolve(options.image)
+                distribution.add_tag(image, options.tag)
+                ImageResolver.invalidate(options.root)
+                journal.record(options.root, 'image', 'tag', image.id, name=options.tag)
         except OCIError as e:
             log.error(e.args[0])
             exit(-1)
@@ -0,0 +1,309 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import pathlib
+import argparse
+import tempfile
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from oci_api import OCIError
+from oci_api.image import Distribution, ImageInUseException, ImageUnknownException
+from oci_api.graph import Driver
+from oci_cli.util import journal
+from oci_cli.util.compression import open_decompressed
+from oci_cli.util.fetch import HashingReader
+from oci_cli.util.lock import StoreLock, TAGS, image_lock_name, layer_lock_name
+from oci_cli.util.resolver import ImageResolver
+from .layers import LayerMetadata
+from .layout import ImageLayout
+
+log = logging.getLogger(__name__)
+
+BUFFER_SIZE = 1024 * 1024
+
+def hash_blob(blob_path):
+    """Return (digest, diff digest) of a layer blob, in one read of it"""
+    with open(str(blob_path), 'rb') as blob_file:
+        blob_reader = HashingReader(blob_file)
+        diff_reader = HashingReader(open_decompressed(blob_reader))
+        while len(diff_reader.read(BUFFER_SIZE)) != 0:
+            pass
+        # Trailing bytes the decompressor did not need
+        while len(blob_reader.read(BUFFER_SIZE)) != 0:
+            pass
+    return ('sha256:' + blob_reader.hexdigest(), 'sha256:' + diff_reader.hexdigest())
+
+def verify_blob(blob_path, digest, diff_id):
+    """Runs in the pool, returns None or what is wrong with the blob"""
+    try:
+        (actual_digest, actual_diff_id) = hash_blob(blob_path)
+    except FileNotFoundError:
+        return 'blob is missing'
+    except (OSError, EOFError, OCIError) as e:
+        return 'blob can not be read (%s)' % e
+    if actual_digest != digest:
+        return 'blob digest is %s, expected %s' % (actual_digest, digest)
+    if actual_diff_id != diff_id:
+        return 'diff digest is %s, expected %s' % (actual_diff_id, diff_id)
+    return None
+
+def get_blob_stamp(layer):
+    """Inode, size and times of the blob of layer, which change whenever it
+    is written or replaced. None when it can not be found."""
+    try:
+        blob_stat = os.stat(str(layer.get_blob_path()))
+    except (OSError, OCIError):
+        return None
+    return [blob_stat.st_ino, blob_stat.st_size, blob_stat.st_mtime_ns, blob_stat.st_ctime_ns]
+
+def hash_file(path):
+    hasher = hashlib.sha256()
+    with open(str(path), 'rb') as input_file:
+        for data in iter(lambda: input_file.read(BUFFER_SIZE), b''):
+            hasher.update(data)
+    return 'sha256:' + hasher.hexdigest()
+
+class ImageCheck:
+    """Layers of an image being verified, with the layout they were saved to"""
+    def __init__(self, image, layout_path):
+        self.image = image
+        self.layout_path = layout_path
+        self.futures = []
+
+class Verify:
+    @staticmethod
+    def init_parser(image_subparsers, parent_parser):
+        parser = image_subparsers.add_parser('verify',
+            parents=[parent_parser],
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+            description='Verify the digests of images and their layers',
+            help='Verify the digests of images and their layers')
+        parser.add_argument('-a', '--all',
+            help='Verify all images',
+            action='store_true')
+        parser.add_argument('-j', '--jobs',
+            help='Number of processes computing digests',
+            type=int,
+            default=os.cpu_count() or 1,
+            metavar='int')
+        parser.add_argument('--full',
+            help='Verify layers again even when their blobs did not change since they were verified',
+            action='store_true')
+        parser.add_argument('--max-age',
+            help='Days after which a verified layer is verified again',
+            type=int,
+            default=30,
+            metavar='int')
+        parser.add_argument('--repair',
+            help='Remove the images with broken layers, and the layers, so they can be loaded again',
+            action='store_true')
+        parser.add_argument('image',
+            nargs='*',
+            metavar='IMAGE',
+            help='Name of the image to verify')
+
+    def __init__(self, options):
+        if options.all == (len(options.image) != 0):
+            log.error('Specify either images or --all')
+            exit(-1)
+        self.root = options.root
+        self.options = options
+        self.distribution = Distribution()
+        self.layer_metadata = LayerMetadata(options.root)
+        self.problems = 0
+        self.unresolved = 0
+        self.broken_images = set()
+        self.broken_layers = {}
+        self.verified_layers = set()
+        self.skipped_layers = set()
+        self.blob_stamps = {}
+        if options.all:
+            images = list(self.distribution.images.values())
+        else:
+            images = []
+            resolver = ImageResolver(options.root, self.distribution)
+            for (image_name, image) in resolver.resolve_all(options.image):
+                if isinstance(image, ImageUnknownException):
+                    log.error('Image (%s) does not exist' % image_name)
+                    self.unresolved += 1
+                elif isinstance(image, Exception):
+                    log.error(image.args[0])
+                    self.unresolved += 1
+                else:
+                    images.append(image)
+        try:
+            with tempfile.TemporaryDirectory() as temp_dir_name, \
+                    ProcessPoolExecutor(max_workers=max(options.jobs, 1)) as executor:
+                self.verify_images(images, pathlib.Path(temp_dir_name), executor)
+        finally:
+            self.layer_metadata.save()
+        log.info('Verified %d layers of %d images, %d verified recently, %d problems' %
+            (len(self.verified_layers), len(images), len(self.skipped_layers), self.problems))
+        repaired = False
+        if options.repair and self.problems != 0:
+            repaired = self.repair()
+        if self.unresolved != 0 or (self.problems != 0 and not repaired):
+            exit(-1)
+
+    def verify_images(self, images, temp_path, executor):
+        # Saving an image overlaps with the digests of the ones saved before it
+        window = max(self.options.jobs, 2)
+        checks = []
+        for (index, image) in enumerate(images):
+            check = self.start_check(image, temp_path.joinpath(str(index)), executor)
+            if check is not None:
+                checks.append(check)
+            while len(checks) > window:
+                self.finish_check(checks.pop(0))
+        for check in checks:
+            self.finish_check(check)
+
+    def needs_verification(self, layer):
+        if layer.id in self.verified_layers or layer.id in self.skipped_layers:
+            return False
+        metadata = self.layer_metadata.get(layer) or {}
+        # Taken before hashing, a blob written while it is verified does not
+        # match its stamp on the next run
+        stamp = get_blob_stamp(layer)
+        self.blob_stamps[layer.id] = stamp
+        if self.options.full or metadata.get('VerifiedDigest') != layer.diff_digest:
+            return True
+        # A blob damaged or rewritten since it was verified has another stamp
+        if stamp is None or metadata.get('VerifiedBlob') != stamp:
+            return True
+        return time.time() - metadata.get('Verified', 0) > self.options.max_age * 86400
+
+    def start_check(self, image, layout_path, executor):
+        layer_ids = set(layer.id for layer in image.layers if self.needs_verification(layer))
+        for layer in image.layers:
+            if layer.id not in layer_ids and layer.id not in self.verified_layers:
+                self.skipped_layers.add(layer.id)
+        if len(layer_ids) == 0:
+            return None
+        try:
+            with StoreLock(self.root, image_lock_name(image), shared=True):
+                self.distribution.save_image(image.id, layout_path)
+            layout = ImageLayout(layout_path)
+            manifest = self.read_manifest(layout)
+        except (OCIError, OSError, ValueError, KeyError) as e:
+            self.report(image, None, 'can not be read (%s)' % (e.args[0] if e.args else e))
+            shutil.rmtree(str(layout_path), ignore_errors=True)
+            return None
+        check = ImageCheck(image, layout_path)
+        if manifest is None:
+            return check
+        config = layout.read_json(manifest['config']['digest'])
+        diff_ids = config.get('rootfs', {}).get('diff_ids', [])
+        if len(diff_ids) != len(image.layers) or len(manifest['layers']) != len(image.layers):
+            self.report(image, None, 'has %d layers, its config %d and its manifest %d' %
+                (len(image.layers), len(diff_ids), len(manifest['layers'])))
+            return check
+        for (layer, descriptor, diff_id) in zip(image.layers, manifest['layers'], diff_ids):
+            if layer.id not in layer_ids or layer.id in self.verified_layers:
+                continue
+            if diff_id != layer.diff_digest:
+                self.report(image, layer, 'diff digest is %s in the config, %s in the store' %
+                    (diff_id, layer.diff_digest))
+                continue
+            self.verified_layers.add(layer.id)
+            check.futures.append((layer, executor.submit(verify_blob,
+                layout.get_blob_path(descriptor['digest']), descriptor['digest'], diff_id)))
+        return check
+
+    def read_manifest(self, layout):
+        """Return the manifest of the only image of layout, after checking the
+        digests of the manifest and its config"""
+        with layout.index_path.open() as index_file:
+            manifest_descriptor = json.load(index_file)['manifests'][0]
+        manifest_path = layout.get_blob_path(manifest_descriptor['digest'])
+        if hash_file(manifest_path) != manifest_descriptor['digest']:
+            raise OCIError('Manifest (%s) does not match its digest' % manifest_descriptor['digest'])
+        manifest = layout.read_json(manifest_descriptor['digest'])
+        config_digest = manifest['config']['digest']
+        if hash_file(layout.get_blob_path(config_digest)) != config_digest:
+            raise OCIError('Config (%s) does not match its digest' % config_digest)
+        return manifest
+
+    def finish_check(self, check):
+        try:
+            for (layer, future) in check.futures:
+                problem = future.result()
+                if problem is not None:
+                    self.report(check.image, layer, problem)
+                    continue
+                self.layer_metadata.record(layer, Verified=time.time(),
+                    VerifiedDigest=layer.diff_digest, VerifiedBlob=self.blob_stamps.get(layer.id))
+        finally:
+            shutil.rmtree(str(check.layout_path), ignore_errors=True)
+        # Checkpoint, an interrupted run does not verify these layers again
+        self.layer_metadata.save()
+
+    def report(self, image, layer, problem):
+        self.problems += 1
+        if layer is None:
+            log.error('Image (%s) %s' % (image.small_id, problem))
+            self.broken_images.add(image.id)
+            return
+        log.error('Layer (%s) of image (%s): %s' % (layer.small_id, image.small_id, problem))
+        self.broken_layers[layer.id] = layer
+        self.layer_metadata.record(layer, Verified=0, VerifiedDigest=None, VerifiedBlob=None)
+        journal.record(self.root, 'layer', 'corrupt', layer.id, image=image.id)
+
+    def repair(self):
+        """Remove the broken images and the ones with broken layers, then the
+        layers only they used. Returns whether all of them were removed."""
+        removed_images = []
+        kept_layers = set()
+        for image in list(self.distribution.images.values()):
+            if image.id not in self.broken_images and \
+                    not any(layer.id in self.broken_layers for layer in image.layers):
+                kept_layers.update(layer.id for layer in image.layers)
+                continue
+            try:
+                with StoreLock(self.root, image_lock_name(image)), StoreLock(self.root, TAGS):
+                    self.distribution.remove_image(image, False)
+                    ImageResolver.invalidate(self.root)
+                    journal.record(self.root, 'image', 'delete', image.id,
+                        name=','.join(image.tags))
+                log.info('Removed image (%s) %s' % (image.small_id, ' '.join(image.tags)))
+                removed_images.append(image)
+            except ImageInUseException:
+                log.error('Image (%s) is being used by containers, can not remove it' %
+                    image.small_id)
+                kept_layers.update(layer.id for layer in image.layers)
+        driver = Driver()
+        removed_layers = set()
+        for image in removed_images:
+            # Top down, a layer is the parent of the ones above it
+            for (index, layer) in reversed(list(enumerate(image.layers))):
+                if layer.id in kept_layers or layer.id in removed_layers:
+                    continue
+                parent = image.layers[index - 1] if index != 0 else None
+                try:
+                    with StoreLock(self.root, layer_lock_name(parent)):
+                        driver.remove_layer(layer)
+                except OCIError as e:
+                    # Already gone with the image
+                    log.debug('Could not remove layer (%s): %s' % (layer.small_id, e.args[0]))
+                removed_layers.add(layer.id)
+        log.info('Removed %d images and %d layers, load or import them again' %
+            (len(removed_images), len(removed_layers)))
+        removed_image_ids = set(image.id for image in removed_images)
+        return self.broken_images <= removed_image_ids and \
+            all(layer_id in removed_layers for layer_id in self.broken_layers)
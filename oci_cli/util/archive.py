@@ -0,0 +1,574 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Streaming tar archives of directory trees.
+
+Archives are written member by member straight to the output file object,
+and extracted member by member from the input one, nothing is staged in
+temporary directories and memory does not grow with the number of members.
+
+The archives of a stack of layers can be merged into one, keeping the last
+version of every path and honouring the whiteouts of the OCI image spec.
+"""
+
+import io
+import os
+import sys
+import stat
+import errno
+import fcntl
+import shutil
+import tarfile
+import itertools
+import posixpath
+import logging
+from oci_api import OCIError
+from .compression import detect_codec
+
+log = logging.getLogger(__name__)
+
+def numeric_owner(tar_info):
+    # Names from the host passwd do not mean anything inside the container
+    tar_info.uname = ''
+    tar_info.gname = ''
+    return tar_info
+
+def walk_tree(source_path):
+    """Yield (path, arcname) for everything under source_path, sorted"""
+    for (dir_path, dir_names, file_names) in os.walk(source_path):
+        dir_names.sort()
+        relative_path = os.path.relpath(dir_path, source_path)
+        if relative_path != '.':
+            yield (dir_path, relative_path)
+        prefix = '' if relative_path == '.' else relative_path + '/'
+        for name in sorted(file_names):
+            yield (os.path.join(dir_path, name), prefix + name)
+        # Symbolic links to directories are listed in dir_names but not walked
+        for name in dir_names:
+            path = os.path.join(dir_path, name)
+            if os.path.islink(path):
+                yield (path, prefix + name)
+
+def read_xattrs(path):
+    """Extended attributes of path as pax header values, symbolic links
+    are not followed"""
+    try:
+        names = os.listxattr(path, follow_symlinks=False)
+    except (OSError, AttributeError):
+        return {}
+    xattrs = {}
+    for name in names:
+        try:
+            value = os.getxattr(path, name, follow_symlinks=False)
+        except OSError:
+            continue
+        xattrs[XATTR_PREFIX + name] = value.decode('utf-8', 'surrogateescape')
+    return xattrs
+
+def iterate_tree(source_path, arcname=''):
+    """Yield (member, data) for source_path and everything under it, named
+    under arcname. The contents of a directory are yielded without the
+    directory itself when arcname is ''. data is the open file of regular
+    files and None otherwise."""
+    source_path = str(source_path)
+    # Only used for gettarinfo(), which also tracks the inodes of hard links
+    tar_file = tarfile.TarFile(fileobj=io.BytesIO(), mode='w')
+    is_directory = os.path.isdir(source_path) and not os.path.islink(source_path)
+    entries = []
+    if not is_directory:
+        entries = [(source_path, arcname or os.path.basename(source_path))]
+    elif arcname != '':
+        entries = [(source_path, arcname)]
+    if is_directory:
+        prefix = arcname + '/' if arcname != '' else ''
+        entries = itertools.chain(entries, ((path, prefix + name)
+            for (path, name) in walk_tree(source_path)))
+    for (path, name) in entries:
+        member = tar_file.gettarinfo(path, arcname=name)
+        if member is None:
+            log.warning('Skipping (%s) of unsupported type' % path)
+            continue
+        numeric_owner(member)
+        member.pax_headers.update(read_xattrs(path))
+        if not member.isreg():
+            yield (member, None)
+            continue
+        with open(path, 'rb') as data:
+            yield (member, data)
+
+def write_tar(source_path, fileobj):
+    """Stream the contents of source_path as a tar to fileobj.
+
+    Members are not kept once written, only the inodes of hard links, so
+    memory does not grow with the number of files.
+    """
+    write_members(iterate_tree(source_path), fileobj)
+
+def write_members(members, fileobj):
+    """Stream (member, data) pairs as a tar to fileobj"""
+    with tarfile.open(fileobj=fileobj, mode='w|', format=tarfile.PAX_FORMAT) as tar_file:
+        for (member, data) in members:
+            tar_file.addfile(member, data)
+            tar_file.members.clear()
+
+TAR_MAGIC_OFFSET = 257
+
+def open_tar_archive(file_path):
+    """Return file_path opened and decompressed when it holds a tar archive
+    in any known compression, None otherwise"""
+    fileobj = open(file_path, 'rb')
+    try:
+        (codec, fileobj) = detect_codec(fileobj)
+        reader = io.BufferedReader(codec.open_reader(fileobj))
+        header = reader.peek(TAR_MAGIC_OFFSET + 5)[:TAR_MAGIC_OFFSET + 5]
+    except (OSError, EOFError, OCIError):
+        fileobj.close()
+        return None
+    # Old tar formats have no magic, trust the name for uncompressed ones
+    if header[TAR_MAGIC_OFFSET:] == b'ustar' or \
+            (codec.name == 'none' and str(file_path).endswith('.tar')):
+        return reader
+    reader.close()
+    return None
+
+WHITEOUT_PREFIX = '.wh.'
+WHITEOUT_OPAQUE = WHITEOUT_PREFIX + WHITEOUT_PREFIX + '.opq'
+
+class UnsafePathException(OCIError):
+    pass
+
+def safe_join(target_path, name, checked=None):
+    """Path of archive member name under target_path.
+
+    Absolute names, .. components and parents that are symbolic links
+    leading outside target_path are refused. checked caches the parent
+    directories already verified.
+    """
+    parts = [part for part in name.split('/') if part not in ('', '.')]
+    if '..' in parts:
+        raise UnsafePathException('Archive member (%s) is outside of the target' % name)
+    if len(parts) == 0:
+        return str(target_path)
+    path = os.path.join(target_path, *parts)
+    parent = os.path.dirname(path)
+    if checked is not None and parent in checked:
+        return path
+    real_target = os.path.realpath(target_path)
+    real_parent = os.path.realpath(parent)
+    if real_parent != real_target and not real_parent.startswith(real_target + os.sep):
+        raise UnsafePathException('Archive member (%s) is outside of the target' % name)
+    if checked is not None:
+        checked.add(parent)
+    return path
+
+def apply_metadata(path, mode, uid, gid, mtime, xattrs=None, owner=None):
+    """Set ownership, permissions, extended attributes and time of path.
+
+    Symbolic links are never followed. Ownership is only changed when
+    owner is true, by default when running as root.
+    """
+    if owner is None:
+        owner = os.geteuid() == 0
+    if owner:
+        try:
+            os.chown(path, uid, gid, follow_symlinks=False)
+        except OSError as e:
+            log.debug('Could not change owner of (%s): %s' % (path, e))
+    is_link = os.path.islink(path)
+    for (name, value) in (xattrs or {}).items():
+        try:
+            os.setxattr(path, name, value, follow_symlinks=False)
+        except (OSError, AttributeError) as e:
+            log.debug('Could not set attribute (%s) of (%s): %s' % (name, path, e))
+    if not is_link:
+        os.chmod(path, mode)
+    try:
+        os.utime(path, (mtime, mtime), follow_symlinks=False)
+    except NotImplementedError:
+        if not is_link:
+            os.utime(path, (mtime, mtime))
+
+XATTR_PREFIX = 'SCHILY.xattr.'
+
+BUFFER_SIZE = 1024 * 1024
+
+def get_xattrs(tar_info):
+    return {name[len(XATTR_PREFIX):]: value.encode('utf-8', 'surrogateescape')
+        for (name, value) in tar_info.pax_headers.items() if name.startswith(XATTR_PREFIX)}
+
+# ioctl cloning the extents of a file on Linux copy on write filesystems
+FICLONE = 0x40049409
+
+MAX_SENDFILE = 1024 * 1024 * 1024
+
+def copy_data(input_file, output_file, size):
+    """Copy size bytes from input_file to output_file. When input_file is a
+    file of its own the copy is done by the kernel, sharing the extents on
+    filesystems that can, and the data never goes through Python."""
+    try:
+        input_fd = input_file.fileno()
+        if input_file.tell() != 0:
+            raise ValueError()
+    except (AttributeError, OSError, ValueError):
+        # A member of an archive
+        shutil.copyfileobj(input_file, output_file, BUFFER_SIZE)
+        return
+    output_fd = output_file.fileno()
+    if sys.platform.startswith('linux'):
+        try:
+            fcntl.ioctl(output_fd, FICLONE, input_fd)
+            return
+        except OSError:
+            pass
+    offset = 0
+    try:
+        while offset < size:
+            sent = os.sendfile(output_fd, input_fd, offset, min(size - offset, MAX_SENDFILE))
+            if sent == 0:
+                raise OCIError('File shrank while being copied')
+            offset += sent
+    except (OSError, AttributeError) as e:
+        if offset != 0 or getattr(e, 'errno', errno.EINVAL) not in \
+                (errno.EINVAL, errno.ENOSYS, errno.ENOTSUP, errno.EOPNOTSUPP):
+            raise
+        shutil.copyfileobj(input_file, output_file, BUFFER_SIZE)
+
+class BoundedSet(set):
+    """Set forgetting everything once it holds limit items"""
+    def __init__(self, limit=4096):
+        super().__init__()
+        self.limit = limit
+
+    def add(self, item):
+        if len(self) >= self.limit:
+            self.clear()
+        super().add(item)
+
+class OpenDirectory:
+    """Directory being extracted into, its metadata is applied when left"""
+    def __init__(self, path, member=None):
+        self.path = path
+        self.member = member
+        self.stat = None
+        if member is None:
+            # Entered again, put back the time and mode it had
+            self.stat = os.lstat(path)
+
+class TarExtractor:
+    """Extract a tar stream member by member, in constant memory.
+
+    Members are dropped as soon as they are extracted, tarfile would keep
+    every one of them. Directories are tracked on a stack of the ones being
+    extracted into, so mkdir is only called for new directories and their
+    mode and time are set once, when the archive moves on to another
+    directory. Hard links are made against the already extracted target,
+    only links to members further in the archive are kept for the end.
+    """
+    def __init__(self, target_path, owner=None, whiteouts=False):
+        self.target_path = str(target_path)
+        if owner is None:
+            owner = os.geteuid() == 0
+        self.owner = owner
+        self.whiteouts = whiteouts
+        self.checked = BoundedSet()
+        self.directories = []
+        self.pending_links = {}
+        self.count = 0
+
+    def extract(self, fileobj):
+        """Extract the tar stream in fileobj, returns the number of members"""
+        return self.extract_members(iterate_members(fileobj))
+
+    def extract_members(self, members):
+        """Extract (member, data) pairs, returns the number of members"""
+        os.makedirs(self.target_path, exist_ok=True)
+        for (member, input_file) in members:
+            self.extract_member(member, input_file)
+            self.count += 1
+        self.finish()
+        return self.count
+
+    def extract_member(self, member, input_file):
+        path = safe_join(self.target_path, member.name, self.checked)
+        if path == self.target_path:
+            return
+        if self.whiteouts and os.path.basename(path).startswith(WHITEOUT_PREFIX):
+            self.apply_whiteout(path)
+            return
+        self.enter(os.path.dirname(path))
+        if member.isdir():
+            self.make_directory(path, member)
+        elif member.isreg():
+            self.make_file(path, member, input_file)
+        elif member.issym():
+            self.remove(path)
+            os.symlink(member.linkname, path)
+            # A checked parent may have just been replaced by this link
+            self.checked.clear()
+            apply_metadata(path, member.mode, member.uid, member.gid, member.mtime,
+                get_xattrs(member), self.owner)
+        elif member.islnk():
+            self.make_link(path, member)
+        else:
+            self.make_node(path, member)
+        links = self.pending_links.pop(path, None)
+        if links is not None:
+            for link_path in links:
+                self.enter(os.path.dirname(link_path))
+                self.remove(link_path)
+                os.link(path, link_path)
+
+    def enter(self, path):
+        """Make path the innermost open directory, leaving the ones it is not in"""
+        while len(self.directories) != 0:
+            top_path = self.directories[-1].path
+            if path == top_path:
+                return
+            if path.startswith(top_path + os.sep):
+                break
+            self.leave(self.directories.pop())
+        if os.path.isdir(path) and not os.path.islink(path):
+            directory = OpenDirectory(path)
+            if not self.owner and directory.stat.st_mode & stat.S_IWUSR == 0:
+                # Extracted read only earlier in the archive, restored when left
+                os.chmod(path, stat.S_IMODE(directory.stat.st_mode) | stat.S_IRWXU)
+            self.directories.append(directory)
+            return
+        # Parents missing from the archive
+        os.makedirs(path, exist_ok=True)
+        self.directories.append(OpenDirectory(path, tarfile.TarInfo()))
+
+    def leave(self, directory):
+        if directory.stat is not None:
+            if stat.S_IMODE(os.lstat(directory.path).st_mode) != stat.S_IMODE(directory.stat.st_mode):
+                os.chmod(directory.path, stat.S_IMODE(directory.stat.st_mode))
+            os.utime(directory.path, ns=(directory.stat.st_atime_ns, directory.stat.st_mtime_ns))
+            return
+        member = directory.member
+        if member.name == '':
+            # Created for a member without a directory entry of its own
+            return
+        apply_metadata(directory.path, member.mode, member.uid, member.gid, member.mtime,
+            get_xattrs(member), self.owner)
+
+    def make_directory(self, path, member):
+        if os.path.islink(path) or (os.path.lexists(path) and not os.path.isdir(path)):
+            os.unlink(path)
+        try:
+            os.mkdir(path, 0o700)
+        except FileExistsError:
+            pass
+        self.directories.append(OpenDirectory(path, member))
+
+    def apply_whiteout(self, path):
+        """Remove what a whiteout hides, an opaque one hides all the entries
+        of its directory"""
+        (parent, name) = os.path.split(path)
+        if name == WHITEOUT_OPAQUE:
+            if os.path.isdir(parent) and not os.path.islink(parent):
+                for entry in os.listdir(parent):
+                    self.remove(os.path.join(parent, entry))
+        else:
+            self.remove(os.path.join(parent, name[len(WHITEOUT_PREFIX):]))
+        self.checked.clear()
+
+    def remove(self, path):
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        elif os.path.lexists(path):
+            os.unlink(path)
+
+    def make_file(self, path, member, input_file):
+        flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW | getattr(os, 'O_CLOEXEC', 0)
+        try:
+            fd = os.open(path, flags, 0o600)
+        except FileExistsError:
+            # Never write through an existing file, it may be a hard link
+            self.remove(path)
+            fd = os.open(path, flags, 0o600)
+        with os.fdopen(fd, 'wb') as output_file:
+            copy_data(input_file, output_file, member.size)
+            output_file.flush()
+            if self.owner:
+                try:
+                    os.fchown(fd, member.uid, member.gid)
+                except OSError as e:
+                    log.debug('Could not change owner of (%s): %s' % (path, e))
+            for (name, value) in get_xattrs(member).items():
+                try:
+                    os.setxattr(fd, name, value)
+                except (OSError, AttributeError) as e:
+                    log.debug('Could not set attribute (%s) of (%s): %s' % (name, path, e))
+            os.fchmod(fd, member.mode)
+            os.utime(fd, (member.mtime, member.mtime))
+
+    def make_link(self, path, member):
+        target_path = safe_join(self.target_path, member.linkname, self.checked)
+        if not os.path.lexists(target_path):
+            self.pending_links.setdefault(target_path, []).append(path)
+            return
+        self.remove(path)
+        os.link(target_path, path)
+
+    def make_node(self, path, member):
+        self.remove(path)
+        if member.isfifo():
+            os.mkfifo(path, member.mode)
+        elif member.ischr() or member.isblk():
+            node_type = stat.S_IFCHR if member.ischr() else stat.S_IFBLK
+            try:
+                os.mknod(path, member.mode | node_type, os.makedev(member.devmajor, member.devminor))
+            except PermissionError:
+                log.warning('Could not create device (%s), not running as root' % member.name)
+                return
+        else:
+            log.warning('Skipping member (%s) of unsupported type' % member.name)
+            return
+        apply_metadata(path, member.mode, member.uid, member.gid, member.mtime,
+            get_xattrs(member), self.owner)
+
+    def finish(self):
+        for (target_path, links) in self.pending_links.items():
+            log.warning('Hard link target (%s) is not in the archive, skipping %d links' %
+                (os.path.relpath(target_path, self.target_path), len(links)))
+        self.pending_links.clear()
+        while len(self.directories) != 0:
+            self.leave(self.directories.pop())
+
+def iterate_members(fileobj):
+    """Yield (member, data) for each member of the tar stream in fileobj, data
+    is a file object for regular files and None otherwise. Members are
+    dropped once the next one is read."""
+    with tarfile.open(fileobj=fileobj, mode='r|') as tar_file:
+        while True:
+            member = tar_file.next()
+            if member is None:
+                break
+            yield (member, tar_file.extractfile(member) if member.isreg() else None)
+            tar_file.members.clear()
+
+def normalize_name(name):
+    return '/'.join(part for part in name.split('/') if part not in ('', '.'))
+
+def get_parents(name):
+    """Yield the parent directories of name, innermost first, ending with the
+    root as ''"""
+    while name != '':
+        name = name.rpartition('/')[0]
+        yield name
+
+class TarMerger:
+    """Merge the tar streams of a stack of layers, lowest first, into the
+    members of one layer.
+
+    A first pass over the streams only records which layer has the last
+    version of every path and where the whiteouts are, a second one yields
+    the members that are still visible on top of the stack. Whiteouts that
+    hide entries below the stack are kept, first, so they can be applied
+    before the merged entries. A hard link whose target was replaced later
+    in the stack gets the data of its target instead.
+
+    open_layers are callables returning a context manager of the
+    uncompressed stream of a layer, each is called twice.
+    """
+    def __init__(self, open_layers):
+        self.open_layers = open_layers
+        self.winners = {}
+        self.hidden = {}
+        self.opaque = {}
+        self.links = {}
+
+    def scan(self):
+        for (index, open_layer) in enumerate(self.open_layers):
+            with open_layer() as fileobj:
+                for (member, _) in iterate_members(fileobj):
+                    name = normalize_name(member.name)
+                    (parent, _, base) = name.rpartition('/')
+                    if base == WHITEOUT_OPAQUE:
+                        self.opaque[parent] = index
+                    elif base.startswith(WHITEOUT_PREFIX):
+                        self.hidden[posixpath.join(parent, base[len(WHITEOUT_PREFIX):])] = index
+                    elif name != '':
+                        self.winners[name] = (index, member.isdir())
+                        if member.islnk():
+                            self.links.setdefault((index, normalize_name(member.linkname)),
+                                []).append(name)
+
+    def get_hidden_index(self, name, parents_only=False):
+        """Index of the last layer that removed name, -1 when none did"""
+        index = -1 if parents_only else self.hidden.get(name, -1)
+        for parent in get_parents(name):
+            index = max(index, self.hidden.get(parent, -1), self.opaque.get(parent, -1))
+        return index
+
+    def is_visible(self, name, index):
+        winner = self.winners.get(name)
+        if winner is None or winner[0] != index:
+            return False
+        # A layer only hides the entries of the layers below it
+        return self.get_hidden_index(name) <= index
+
+    def get_whiteouts(self):
+        """Names of the whiteouts still needed below the merged layer"""
+        whiteouts = set()
+        for (name, index) in self.hidden.items():
+            if self.get_hidden_index(name, parents_only=True) > index:
+                continue
+            winner = self.winners.get(name)
+            if winner is None or winner[0] < index:
+                whiteouts.add(posixpath.join(posixpath.dirname(name),
+                    WHITEOUT_PREFIX + posixpath.basename(name)))
+            elif winner[1]:
+                # Replaced by a directory, whose lower entries stay hidden
+                whiteouts.add(posixpath.join(name, WHITEOUT_OPAQUE))
+        for (name, index) in self.opaque.items():
+            if self.get_hidden_index(name) <= index:
+                whiteouts.add(posixpath.join(name, WHITEOUT_OPAQUE))
+        return sorted(whiteouts)
+
+    def members(self):
+        """Yield (member, data) of the merged layer, run scan() first"""
+        for name in self.get_whiteouts():
+            member = tarfile.TarInfo(name)
+            member.mode = 0o644
+            yield (member, io.BytesIO())
+        for (index, open_layer) in enumerate(self.open_layers):
+            replaced_targets = {}
+            with open_layer() as fileobj:
+                for (member, input_file) in iterate_members(fileobj):
+                    name = normalize_name(member.name)
+                    if name == '' or posixpath.basename(name).startswith(WHITEOUT_PREFIX):
+                        continue
+                    member.name = name
+                    if member.islnk():
+                        target = normalize_name(member.linkname)
+                        if target in replaced_targets and self.is_visible(name, index):
+                            if replaced_targets[target] == name:
+                                continue
+                            member.linkname = replaced_targets[target]
+                    if self.is_visible(name, index):
+                        yield (member, input_file)
+                        continue
+                    links = [link for link in self.links.get((index, name), [])
+                        if self.is_visible(link, index)]
+                    if len(links) != 0 and member.isreg():
+                        # The first link still visible takes the data
+                        member.name = links[0]
+                        replaced_targets[name] = links[0]
+                        yield (member, input_file)
+
+def extract_tar(fileobj, target_path, owner=None):
+    """Extract the tar stream in fileobj under target_path, in constant memory.
+    Returns the number of members."""
+    return TarExtractor(target_path, owner).extract(fileobj)
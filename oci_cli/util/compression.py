@@ -0,0 +1,164 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Registry of the compression codecs used by every tar path of the CLI.
+
+Each codec knows its magic number, so input is always decompressed by
+detection, and how to wrap a file object into a streaming reader or
+writer. Codecs backed by optional packages (zstandard, lz4) are registered
+always and fail with a clear error only when used without the package.
+"""
+
+import io
+import gzip
+import importlib
+import lzma
+import bz2
+from oci_api import OCIError
+
+LAYER_MEDIA_TYPE = 'application/vnd.oci.image.layer.v1.tar'
+
+class CompressionException(OCIError):
+    pass
+
+class Codec:
+    def __init__(self, name, magic, reader, writer, default_level=None, media_type=None):
+        self.name = name
+        self.magic = magic
+        self.reader = reader
+        self.writer = writer
+        self.default_level = default_level
+        self.media_type = media_type
+
+    def open_reader(self, fileobj):
+        return self.reader(fileobj)
+
+    def open_writer(self, fileobj, level=None):
+        """Return a writer compressing into fileobj, closing it leaves fileobj open"""
+        if level is None:
+            level = self.default_level
+        return self.writer(fileobj, level)
+
+CODECS = {}
+
+def register_codec(codec):
+    CODECS[codec.name] = codec
+
+def get_codec(name):
+    try:
+        return CODECS[name or 'none']
+    except KeyError:
+        raise CompressionException('Unknown compression (%s), use one of %s' %
+            (name, ', '.join(get_codec_names())))
+
+def get_codec_names():
+    return sorted(CODECS)
+
+def get_codec_by_media_type(media_type):
+    for codec in CODECS.values():
+        if codec.media_type == media_type:
+            return codec
+    return None
+
+def import_optional(codec_name, module_name, package):
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        raise CompressionException('%s compression requires the %s package' % (codec_name, package))
+
+class NonClosingWriter(io.RawIOBase):
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.fileobj.write(data)
+
+    def flush(self):
+        self.fileobj.flush()
+
+def open_zstd_reader(fileobj):
+    zstandard = import_optional('zstd', 'zstandard', 'zstandard')
+    return zstandard.ZstdDecompressor().stream_reader(fileobj, read_across_frames=True)
+
+def open_zstd_writer(fileobj, level):
+    zstandard = import_optional('zstd', 'zstandard', 'zstandard')
+    return zstandard.ZstdCompressor(level=level).stream_writer(fileobj, closefd=False)
+
+def open_lz4_reader(fileobj):
+    lz4_frame = import_optional('lz4', 'lz4.frame', 'lz4')
+    return lz4_frame.LZ4FrameFile(fileobj, mode='rb')
+
+def open_lz4_writer(fileobj, level):
+    lz4_frame = import_optional('lz4', 'lz4.frame', 'lz4')
+    return lz4_frame.LZ4FrameFile(fileobj, mode='wb', compression_level=level)
+
+register_codec(Codec('none', None,
+    lambda fileobj: fileobj,
+    lambda fileobj, level: NonClosingWriter(fileobj),
+    media_type=LAYER_MEDIA_TYPE))
+register_codec(Codec('gzip', b'\x1f\x8b',
+    lambda fileobj: gzip.GzipFile(fileobj=fileobj, mode='rb'),
+    lambda fileobj, level: gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=level, mtime=0),
+    default_level=6,
+    media_type=LAYER_MEDIA_TYPE + '+gzip'))
+register_codec(Codec('zstd', b'\x28\xb5\x2f\xfd',
+    open_zstd_reader,
+    open_zstd_writer,
+    default_level=3,
+    media_type=LAYER_MEDIA_TYPE + '+zstd'))
+register_codec(Codec('lz4', b'\x04\x22\x4d\x18',
+    open_lz4_reader,
+    open_lz4_writer,
+    default_level=0))
+register_codec(Codec('xz', b'\xfd7zXZ\x00',
+    lambda fileobj: lzma.LZMAFile(fileobj, mode='rb'),
+    lambda fileobj, level: lzma.LZMAFile(fileobj, mode='wb', preset=level),
+    default_level=6))
+register_codec(Codec('bzip2', b'BZh',
+    lambda fileobj: bz2.BZ2File(fileobj, mode='rb'),
+    lambda fileobj, level: bz2.BZ2File(fileobj, mode='wb', compresslevel=level),
+    default_level=9))
+
+def detect_codec(fileobj):
+    """Return (codec, peekable fileobj), the none codec when not compressed"""
+    if not hasattr(fileobj, 'peek'):
+        fileobj = io.BufferedReader(fileobj)
+    header = fileobj.peek(6)[:6]
+    for codec in CODECS.values():
+        if codec.magic is not None and header.startswith(codec.magic):
+            return (codec, fileobj)
+    return (CODECS['none'], fileobj)
+
+def open_compressed(fileobj, compression, level=None):
+    """Return a writer compressing into fileobj, closing it leaves fileobj open"""
+    return get_codec(compression).open_writer(fileobj, level)
+
+def open_decompressed(fileobj):
+    """Return fileobj decompressed on the fly, detected by magic number"""
+    (codec, fileobj) = detect_codec(fileobj)
+    return codec.open_reader(fileobj)
+
+def add_compression_arguments(parser, default='none', help='Compression of the written archive'):
+    parser.add_argument('--compression',
+        help='%s (%s)' % (help, '|'.join(get_codec_names())),
+        choices=get_codec_names(),
+        default=default,
+        metavar='string')
+    parser.add_argument('--compression-level',
+        help='Compression level, the default of each compression when not set',
+        type=int,
+        metavar='int')
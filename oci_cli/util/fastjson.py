@@ -0,0 +1,62 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""JSON through orjson when it is installed, the json module otherwise.
+
+Output is the same with both: indented documents use four spaces as
+json.dumps(indent=4) does, compact ones have no spaces, text is not
+escaped to ASCII, key order is kept and values neither can encode go
+through default.
+"""
+
+import re
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+INDENT_PATTERN = re.compile(r'^ +', re.MULTILINE)
+
+def double_indent(match):
+    return match.group(0) * 2
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def load(fileobj):
+    return loads(fileobj.read())
+
+def dumps(value, indent=False, default=None):
+    """value as a str, indented with four spaces when indent is true"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            text = orjson.dumps(value, default=default, option=option).decode('utf-8')
+        except TypeError:
+            # Integers over 64 bits and the like, json encodes them
+            pass
+        else:
+            if indent:
+                # Strings hold no raw newlines, leading spaces are indentation
+                text = INDENT_PATTERN.sub(double_indent, text)
+            return text
+    if indent:
+        return json.dumps(value, indent=4, default=default, ensure_ascii=False)
+    return json.dumps(value, separators=(',', ':'), default=default, ensure_ascii=False)
@@ -0,0 +1,285 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Resumable downloads.
+
+Servers that accept range requests are fetched in fixed size chunks by
+several connections, completed chunks are recorded next to the partial file
+so an interrupted download continues where it stopped. The sha256 digest is
+computed while the download goes on, over the contiguous completed prefix.
+"""
+
+import io
+import os
+import json
+import time
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.error import URLError, HTTPError
+from urllib.request import Request, urlopen
+from oci_api import OCIError
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 8 * 1024 * 1024
+BUFFER_SIZE = 1024 * 1024
+
+class DownloadException(OCIError):
+    pass
+
+class DigestMismatchException(OCIError):
+    pass
+
+class HashingReader(io.RawIOBase):
+    def __init__(self, fileobj, hasher=None):
+        super().__init__()
+        self.fileobj = fileobj
+        self.hasher = hasher or hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.hasher.update(data)
+        return data
+
+    def readinto(self, buffer):
+        count = self.fileobj.readinto(buffer)
+        self.hasher.update(memoryview(buffer)[:count])
+        return count
+
+    def readable(self):
+        return True
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+def verify_digest(hexdigest, expected, name):
+    if expected is not None and hexdigest != expected.lower().split(':')[-1]:
+        raise DigestMismatchException('Digest mismatch for (%s): expected sha256:%s, got sha256:%s' %
+            (name, expected, hexdigest))
+
+def file_digest(file_path):
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as input_file:
+        for data in iter(lambda: input_file.read(BUFFER_SIZE), b''):
+            hasher.update(data)
+    return hasher.hexdigest()
+
+class Download:
+    def __init__(self, url, file_path, sha256=None, timeout=30, connections=4,
+            retries=5, chunk_size=CHUNK_SIZE):
+        self.url = url
+        self.file_path = file_path
+        self.state_path = None
+        if file_path is not None:
+            self.state_path = file_path.with_name(file_path.name + '.json')
+        self.sha256 = sha256
+        self.timeout = timeout
+        self.connections = max(connections, 1)
+        self.retries = retries
+        self.chunk_size = chunk_size
+
+    def run(self):
+        (length, ranges, validator) = self.probe()
+        if ranges and length is not None and length > self.chunk_size:
+            digest = self.fetch_ranges(length, validator)
+        else:
+            digest = self.fetch_stream()
+        try:
+            verify_digest(digest, self.sha256, self.url)
+        except DigestMismatchException:
+            # Resuming would only hash the same bad bytes again
+            self.remove_partial()
+            raise
+        self.remove_state()
+        log.debug('Finished downloading (%s) sha256:%s' % (self.url, digest))
+        return digest
+
+    def remove_state(self):
+        try:
+            self.state_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def remove_partial(self):
+        self.remove_state()
+        try:
+            self.file_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def open(self, start=None, end=None, method=None):
+        request = Request(self.url, method=method)
+        if start is not None:
+            request.add_header('Range', 'bytes=%d-%d' % (start, end))
+        return urlopen(request, timeout=self.timeout)
+
+    def probe(self):
+        try:
+            with self.open(method='HEAD') as response:
+                headers = response.headers
+        except HTTPError:
+            return (None, False, None)
+        except URLError as e:
+            raise DownloadException('Could not connect to (%s): %s' % (self.url, e.reason))
+        length = headers.get('Content-Length')
+        ranges = headers.get('Accept-Ranges', '').lower() == 'bytes'
+        validator = headers.get('ETag') or headers.get('Last-Modified')
+        return (int(length) if length is not None else None, ranges, validator)
+
+    def retry(self, function, *args):
+        delay = 1
+        for attempt in range(self.retries + 1):
+            try:
+                return function(*args)
+            except (URLError, OSError) as e:
+                if attempt == self.retries:
+                    raise DownloadException('Could not download (%s): %s' % (self.url, e))
+                log.warning('Download of (%s) failed, retrying in %ds (%s)' % (self.url, delay, e))
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def fetch_stream(self):
+        return self.retry(self.fetch_stream_once)
+
+    def fetch_stream_once(self):
+        hasher = hashlib.sha256()
+        with self.open() as response, self.file_path.open('wb') as output_file:
+            for data in iter(lambda: response.read(BUFFER_SIZE), b''):
+                hasher.update(data)
+                output_file.write(data)
+        return hasher.hexdigest()
+
+    def load_state(self, length, validator):
+        try:
+            with self.state_path.open() as state_file:
+                state = json.load(state_file)
+        except (OSError, ValueError):
+            return set()
+        if state.get('url') != self.url or state.get('length') != length or \
+                state.get('validator') != validator or state.get('chunk_size') != self.chunk_size or \
+                not self.file_path.is_file():
+            return set()
+        log.info('Resuming download of (%s)' % self.url)
+        return set(state.get('done', []))
+
+    def save_state(self, length, validator, done):
+        state = {
+            'url': self.url,
+            'length': length,
+            'validator': validator,
+            'chunk_size': self.chunk_size,
+            'done': sorted(done)
+        }
+        temp_path = self.state_path.with_name(self.state_path.name + '.tmp')
+        with temp_path.open('w') as state_file:
+            json.dump(state, state_file)
+        temp_path.replace(self.state_path)
+
+    def fetch_ranges(self, length, validator):
+        done = self.load_state(length, validator)
+        if len(done) == 0:
+            with self.file_path.open('wb') as output_file:
+                output_file.truncate(length)
+        chunks = (length + self.chunk_size - 1) // self.chunk_size
+        hasher = hashlib.sha256()
+        next_chunk = 0
+        fd = os.open(str(self.file_path), os.O_RDWR)
+        try:
+            next_chunk = self.hash_chunks(fd, hasher, next_chunk, done, length)
+            pending = [index for index in range(chunks) if index not in done]
+            with ThreadPoolExecutor(max_workers=self.connections) as executor:
+                futures = [executor.submit(self.retry, self.fetch_chunk, fd, index, length)
+                    for index in pending]
+                for future in as_completed(futures):
+                    index = future.result()
+                    done.add(index)
+                    self.save_state(length, validator, done)
+                    next_chunk = self.hash_chunks(fd, hasher, next_chunk, done, length)
+                    log.debug('Downloaded %d of %d chunks of (%s)' % (len(done), chunks, self.url))
+        finally:
+            os.close(fd)
+        return hasher.hexdigest()
+
+    def fetch_chunk(self, fd, index, length):
+        start = index * self.chunk_size
+        end = min(start + self.chunk_size, length) - 1
+        offset = start
+        with self.open(start, end) as response:
+            if response.status != 206:
+                raise DownloadException('Server ignored range request for (%s)' % self.url)
+            for data in iter(lambda: response.read(BUFFER_SIZE), b''):
+                os.pwrite(fd, data, offset)
+                offset += len(data)
+        if offset != end + 1:
+            raise OSError('Short read on chunk %d' % index)
+        return index
+
+    def hash_chunks(self, fd, hasher, next_chunk, done, length):
+        """Feed the hasher with the contiguous completed chunks"""
+        while next_chunk in done:
+            start = next_chunk * self.chunk_size
+            size = min(self.chunk_size, length - start)
+            offset = start
+            while offset < start + size:
+                data = os.pread(fd, min(BUFFER_SIZE, start + size - offset), offset)
+                hasher.update(data)
+                offset += len(data)
+            next_chunk += 1
+        return next_chunk
+
+class RangeReader:
+    """Random access to the contents of a URL through range requests"""
+    def __init__(self, url, timeout=30, retries=5):
+        self.download = Download(url, None, timeout=timeout, retries=retries)
+        self.length = None
+
+    def size(self):
+        if self.length is None:
+            (length, ranges, _) = self.download.probe()
+            if not ranges or length is None:
+                raise DownloadException('Server does not accept range requests for (%s)' %
+                    self.download.url)
+            self.length = length
+        return self.length
+
+    def read_at(self, offset, length):
+        return self.download.retry(self.read_once, offset, length)
+
+    def read_once(self, offset, length):
+        with self.download.open(offset, offset + length - 1) as response:
+            if response.status != 206:
+                raise DownloadException('Server ignored range request for (%s)' %
+                    self.download.url)
+            data = response.read()
+        if len(data) != length:
+            raise OSError('Short read at offset %d' % offset)
+        return data
+
+    def close(self):
+        pass
+
+class FileReader:
+    """Random access to a local file, the counterpart of RangeReader"""
+    def __init__(self, file_path):
+        self.fd = os.open(str(file_path), os.O_RDONLY)
+
+    def size(self):
+        return os.fstat(self.fd).st_size
+
+    def read_at(self, offset, length):
+        return os.pread(self.fd, length, offset)
+
+    def close(self):
+        os.close(self.fd)
@@ -0,0 +1,68 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Minimal Go template style output formatting for --format.
+
+Supports "{{.Field}}", "{{.Field.Subfield}}" and "{{json .Field}}", which
+covers what scripts use from docker style CLIs.
+"""
+
+import re
+import json
+
+class Template:
+    pattern = re.compile(r'{{\s*(json\s+)?\.([A-Za-z0-9_.]*)\s*}}')
+
+    def __init__(self, text):
+        text = text.replace('\\t', '\t').replace('\\n', '\n')
+        self.parts = []
+        self.fields = set()
+        position = 0
+        for match in Template.pattern.finditer(text):
+            self.parts.append(text[position:match.start()])
+            path = [name for name in match.group(2).split('.') if len(name) != 0]
+            self.parts.append((match.group(1) is not None, path))
+            if len(path) != 0:
+                self.fields.add(path[0])
+            else:
+                self.fields.add('.')
+            position = match.end()
+        self.parts.append(text[position:])
+
+    def uses(self, field):
+        return field in self.fields or '.' in self.fields
+
+    def render(self, data):
+        output = []
+        for part in self.parts:
+            if isinstance(part, str):
+                output.append(part)
+                continue
+            (as_json, path) = part
+            value = data
+            for name in path:
+                try:
+                    value = value[name]
+                except (KeyError, IndexError, TypeError):
+                    value = None
+                    break
+            if as_json:
+                output.append(json.dumps(value, default=str))
+            elif value is None:
+                output.append('<no value>')
+            elif isinstance(value, (dict, list)):
+                output.append(json.dumps(value, default=str))
+            else:
+                output.append(str(value))
+        return ''.join(output)
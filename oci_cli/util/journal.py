@@ -0,0 +1,232 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Append-only journal of the changes made by oci commands.
+
+Each record is one compact JSON line in <root>/events/journal, appended
+with a single write on an O_APPEND descriptor so concurrent writers do not
+interleave. Records are in time order, so --since is a binary search over
+byte offsets. Readers follow the journal with inotify where available.
+"""
+
+import os
+import json
+import time
+import errno
+import ctypes
+import ctypes.util
+import select
+import pathlib
+import logging
+from oci_cli.util.lock import StoreLock
+
+log = logging.getLogger(__name__)
+
+JOURNAL_NAME = 'journal'
+JOURNAL_LOCK = 'journal'
+MAX_JOURNAL_SIZE = 16 * 1024 * 1024
+POLL_INTERVAL = 0.5
+READ_SIZE = 64 * 1024
+
+def get_journal_path(root):
+    return pathlib.Path(root, 'events', JOURNAL_NAME)
+
+def record(root, type, action, object_id, **attributes):
+    """Append an event, failures are logged but never fail the command"""
+    event = {'time': time.time(), 'type': type, 'action': action, 'id': object_id}
+    attributes = {name: value for (name, value) in attributes.items() if value is not None}
+    if len(attributes) != 0:
+        event['attributes'] = attributes
+    data = (json.dumps(event, separators=(',', ':')) + '\n').encode('utf-8')
+    journal_path = get_journal_path(root)
+    try:
+        journal_path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(journal_path), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        if size > MAX_JOURNAL_SIZE:
+            rotate(root, journal_path)
+    except OSError as e:
+        log.debug('Could not record event (%s)' % e)
+
+def rotate(root, journal_path):
+    # Writers that saw the same size wait for the first one, then find the
+    # journal already rotated. A lock dies with its holder, so a writer
+    # killed while rotating does not stop the rotations after it.
+    with StoreLock(root, JOURNAL_LOCK):
+        try:
+            if journal_path.stat().st_size <= MAX_JOURNAL_SIZE:
+                return
+        except FileNotFoundError:
+            return
+        os.replace(str(journal_path), str(journal_path.with_name(JOURNAL_NAME + '.1')))
+
+def parse_event(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+class JournalReader:
+    def __init__(self, root):
+        self.journal_path = get_journal_path(root)
+
+    def get_files(self):
+        return [path for path in (self.journal_path.with_name(JOURNAL_NAME + '.1'), self.journal_path)
+            if path.is_file()]
+
+    def find_offset(self, journal_file, size, since):
+        """Offset of the first line at or after since, by bisecting offsets"""
+        low = 0
+        high = size
+        while low < high:
+            middle = (low + high) // 2
+            journal_file.seek(middle)
+            if middle != 0:
+                journal_file.readline()
+            line_offset = journal_file.tell()
+            line = journal_file.readline()
+            event = parse_event(line) if len(line) != 0 else None
+            if event is None or event['time'] >= since:
+                high = middle
+            else:
+                low = line_offset + len(line)
+        journal_file.seek(low)
+        if low != 0:
+            journal_file.seek(low - 1)
+            if journal_file.read(1) != b'\n':
+                journal_file.readline()
+        return journal_file.tell()
+
+    def snapshot(self):
+        """Current (inode, size) of the journal, to read up to and follow from"""
+        try:
+            stat = self.journal_path.stat()
+        except FileNotFoundError:
+            return (None, 0)
+        return (stat.st_ino, stat.st_size)
+
+    def read(self, since=None, until=None, position=None):
+        """Yields the events up to position, as returned by snapshot()"""
+        for journal_path in self.get_files():
+            with journal_path.open('rb') as journal_file:
+                stat = os.fstat(journal_file.fileno())
+                end = stat.st_size
+                if position is not None:
+                    if stat.st_ino == position[0]:
+                        end = position[1]
+                    elif journal_path == self.journal_path:
+                        # Created after the snapshot, follow() reads it
+                        end = 0
+                if since is not None:
+                    self.find_offset(journal_file, end, since)
+                offset = journal_file.tell()
+                for line in journal_file:
+                    offset += len(line)
+                    if offset > end or not line.endswith(b'\n'):
+                        break
+                    event = parse_event(line)
+                    if event is None or (since is not None and event['time'] < since):
+                        continue
+                    if until is not None and event['time'] > until:
+                        return
+                    yield event
+
+    def follow(self, position):
+        """Yields the events appended after position, forever"""
+        (inode, offset) = position
+        watcher = FileWatcher(self.journal_path.parent)
+        try:
+            while True:
+                try:
+                    stat = self.journal_path.stat()
+                except FileNotFoundError:
+                    watcher.wait()
+                    continue
+                if stat.st_ino != inode:
+                    # Rotated, the rest of the old file is in journal.1
+                    if inode is not None:
+                        yield from self.read_from(self.journal_path.with_name(JOURNAL_NAME + '.1'),
+                            offset, inode)
+                    (inode, offset) = (stat.st_ino, 0)
+                if stat.st_size > offset:
+                    with self.journal_path.open('rb') as journal_file:
+                        journal_file.seek(offset)
+                        for line in journal_file:
+                            if not line.endswith(b'\n'):
+                                break
+                            offset += len(line)
+                            event = parse_event(line)
+                            if event is not None:
+                                yield event
+                    continue
+                watcher.wait()
+        finally:
+            watcher.close()
+
+    def read_from(self, journal_path, offset, inode):
+        try:
+            with journal_path.open('rb') as journal_file:
+                if os.fstat(journal_file.fileno()).st_ino != inode:
+                    return
+                journal_file.seek(offset)
+                for line in journal_file:
+                    event = parse_event(line)
+                    if event is not None:
+                        yield event
+        except FileNotFoundError:
+            pass
+
+class FileWatcher:
+    """Waits for changes in a directory with inotify, or polls without it"""
+    IN_MODIFY = 0x002
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_CLOEXEC = 0o2000000
+
+    def __init__(self, dir_path):
+        self.fd = None
+        dir_path.mkdir(parents=True, exist_ok=True)
+        library = ctypes.util.find_library('c')
+        try:
+            libc = ctypes.CDLL(library, use_errno=True)
+            fd = libc.inotify_init1(FileWatcher.IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return
+        if fd < 0:
+            return
+        mask = FileWatcher.IN_MODIFY | FileWatcher.IN_CREATE | FileWatcher.IN_MOVED_TO
+        if libc.inotify_add_watch(fd, str(dir_path).encode(), mask) < 0:
+            os.close(fd)
+            return
+        self.fd = fd
+
+    def wait(self):
+        if self.fd is None:
+            time.sleep(POLL_INTERVAL)
+            return
+        select.select([self.fd], [], [])
+        try:
+            os.read(self.fd, READ_SIZE)
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
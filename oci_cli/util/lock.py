@@ -0,0 +1,91 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Advisory locks on the storage root, shared by concurrent oci processes.
+
+Locks are fcntl.flock locks on files under <root>/locks, taken shared by
+readers and exclusive by writers. To avoid deadlocks they are always taken
+in this order:
+
+    image-<id>, layer-<parent id>, tags
+    container-<id>, image-<id>, containers
+
+The journal lock is taken last, while rotating the event journal, and no
+other lock is taken while holding it.
+"""
+
+import os
+import fcntl
+import pathlib
+import logging
+
+log = logging.getLogger(__name__)
+
+TAGS = 'tags'
+CONTAINERS = 'containers'
+
+# Descriptors of the locks held by this process
+held_fds = set()
+
+def close_inherited_locks():
+    """In a forked child, close the descriptors of the locks held by the
+    parent, so that they are released when the parent releases them"""
+    while len(held_fds) != 0:
+        try:
+            os.close(held_fds.pop())
+        except OSError:
+            pass
+
+def image_lock_name(image):
+    return 'image-%s' % image.id
+
+def layer_lock_name(parent):
+    return 'layer-%s' % (parent.id if parent is not None else 'base')
+
+def container_lock_name(container):
+    return 'container-%s' % container.id
+
+class StoreLock:
+    def __init__(self, root, name, shared=False):
+        self.path = pathlib.Path(root, 'locks', name + '.lock')
+        self.name = name
+        self.shared = shared
+        self.fd = None
+
+    def acquire(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        operation = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+        try:
+            fcntl.flock(self.fd, operation | fcntl.LOCK_NB)
+        except BlockingIOError:
+            log.info('Waiting for lock (%s)' % self.name)
+            fcntl.flock(self.fd, operation)
+        held_fds.add(self.fd)
+        log.debug('Acquired %s lock (%s)' % ('shared' if self.shared else 'exclusive', self.name))
+
+    def release(self):
+        # Closing instead of LOCK_UN, a forked child that did not close its
+        # copy with close_inherited_locks() keeps the lock
+        if self.fd is not None:
+            held_fds.discard(self.fd)
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
@@ -0,0 +1,243 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Resolution of user given references to images and containers.
+
+Ids are kept sorted so any prefix, such as a small id, is found with a
+binary search, names and tags are matched exactly. The index is cached
+under the root and rebuilt when a lookup misses or finds a stale entry,
+mutating commands drop it with invalidate().
+
+Each rebuild also writes the names and short ids as plain lines under
+<root>/cache/completion, read by the shell completion scripts without
+starting python. The CLI rebuilds invalidated indexes once the command
+is done, see refresh_invalidated().
+"""
+
+import os
+import bisect
+import pathlib
+import logging
+from oci_api import OCIError
+from oci_api.image import Distribution, ImageUnknownException
+from oci_api.runtime import Runtime, ContainerUnknownException
+from oci_cli.util import fastjson
+
+log = logging.getLogger(__name__)
+
+SHORT_ID_LENGTH = 12
+
+class AmbiguousReferenceException(OCIError):
+    pass
+
+class ReferenceIndex:
+    def __init__(self, ids=None, names=None):
+        self.ids = sorted(ids or [])
+        self.names = names or {}
+
+    def lookup(self, reference):
+        object_id = self.names.get(reference)
+        if object_id is not None:
+            return object_id
+        if reference.startswith('sha256:'):
+            reference = reference[7:]
+        if len(reference) == 0:
+            return None
+        index = bisect.bisect_left(self.ids, reference)
+        if index == len(self.ids) or not self.ids[index].startswith(reference):
+            return None
+        if self.ids[index] != reference and index + 1 < len(self.ids) and \
+                self.ids[index + 1].startswith(reference):
+            raise AmbiguousReferenceException('Reference (%s) is ambiguous, it matches more than one id' %
+                reference)
+        return self.ids[index]
+
+    def to_dict(self):
+        return {
+            'Ids': self.ids,
+            'Names': self.names
+        }
+
+    @staticmethod
+    def from_dict(data):
+        index = ReferenceIndex()
+        # Stored already sorted
+        index.ids = data['Ids']
+        index.names = data['Names']
+        return index
+
+class Resolver:
+    kind = None
+    unknown_exception = OCIError
+    # (resolver class, root) pairs invalidated by this process
+    invalidated = set()
+
+    def __init__(self, root):
+        self.root = root
+        self.cache_path = Resolver.get_cache_path(root, self.kind)
+        self.index = None
+        self.fresh = False
+        self.objects = None
+
+    @staticmethod
+    def get_cache_path(root, kind):
+        return pathlib.Path(root, 'cache', 'references', kind + '.json')
+
+    @staticmethod
+    def get_words_path(root, kind):
+        return pathlib.Path(root, 'cache', 'completion', kind)
+
+    @classmethod
+    def invalidate(cls, root):
+        Resolver.invalidated.add((cls, str(root)))
+        try:
+            Resolver.get_cache_path(root, cls.kind).unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.debug('Could not invalidate %s references (%s)' % (cls.kind, e))
+
+    @staticmethod
+    def refresh_invalidated():
+        """Rebuild the indexes invalidated by this process, so completion
+        words follow mutating commands"""
+        while len(Resolver.invalidated) != 0:
+            (resolver_class, root) = Resolver.invalidated.pop()
+            try:
+                resolver_class(root).rebuild_index()
+            except (OCIError, OSError) as e:
+                log.debug('Could not refresh %s references (%s)' % (resolver_class.kind, e))
+
+    def get_objects(self):
+        raise NotImplementedError()
+
+    def get_names(self, item):
+        raise NotImplementedError()
+
+    def get_fallback(self, reference):
+        raise self.unknown_exception('%s (%s) does not exist' %
+            (self.kind[:-1].capitalize(), reference))
+
+    def load_index(self):
+        if self.index is not None:
+            return self.index
+        try:
+            with self.cache_path.open('rb') as cache_file:
+                self.index = ReferenceIndex.from_dict(fastjson.load(cache_file))
+        except (OSError, ValueError, KeyError):
+            self.rebuild_index()
+        return self.index
+
+    def get_object_map(self):
+        if self.objects is None:
+            self.objects = {item.id: item for item in self.get_objects()}
+        return self.objects
+
+    def rebuild_index(self):
+        names = {}
+        for item in self.get_object_map().values():
+            for name in self.get_names(item):
+                names[name] = item.id
+        self.index = ReferenceIndex(self.get_object_map().keys(), names)
+        self.fresh = True
+        words = sorted(names) + [object_id[:SHORT_ID_LENGTH] for object_id in self.index.ids]
+        try:
+            Resolver.write_file(self.cache_path, fastjson.dumps(self.index.to_dict()))
+            Resolver.write_file(Resolver.get_words_path(self.root, self.kind),
+                ''.join(word + '\n' for word in words))
+        except OSError as e:
+            log.debug('Could not cache %s references (%s)' % (self.kind, e))
+
+    @staticmethod
+    def write_file(path, text):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name('%s.%d.tmp' % (path.name, os.getpid()))
+        temp_path.write_text(text, encoding='utf-8')
+        temp_path.replace(path)
+
+    def resolve(self, reference):
+        item = self.lookup(reference)
+        if item is None and not self.fresh:
+            self.rebuild_index()
+            item = self.lookup(reference)
+        if item is None:
+            return self.get_fallback(reference)
+        return item
+
+    def lookup(self, reference):
+        object_id = self.load_index().lookup(reference)
+        if object_id is None:
+            return None
+        return self.get_object_map().get(object_id)
+
+    def resolve_id(self, reference):
+        """Id of the referenced object, from the cached index when possible"""
+        object_id = self.load_index().lookup(reference)
+        if object_id is not None:
+            return object_id
+        return self.resolve(reference).id
+
+    def resolve_all(self, references):
+        """Resolve references, returns a list of (reference, object or exception)"""
+        results = []
+        for reference in references:
+            try:
+                results.append((reference, self.resolve(reference)))
+            except OCIError as e:
+                results.append((reference, e))
+        return results
+
+class ImageResolver(Resolver):
+    kind = 'images'
+    unknown_exception = ImageUnknownException
+
+    def __init__(self, root, distribution=None):
+        super().__init__(root)
+        if distribution is None:
+            distribution = Distribution()
+        self.distribution = distribution
+
+    def get_objects(self):
+        return self.distribution.images.values()
+
+    def get_names(self, image):
+        names = []
+        for tag in image.tags:
+            names.append(tag)
+            if tag.endswith(':latest'):
+                names.append(tag[:-7])
+        return names
+
+    def get_fallback(self, reference):
+        # Digest references and other forms only the distribution knows about
+        return self.distribution.get_image(reference)
+
+class ContainerResolver(Resolver):
+    kind = 'containers'
+    unknown_exception = ContainerUnknownException
+
+    def __init__(self, root, runtime=None):
+        super().__init__(root)
+        self.runtime = runtime
+
+    def get_objects(self):
+        # Loaded on first use, resolve_id() from the cache does not need it
+        if self.runtime is None:
+            self.runtime = Runtime()
+        return self.runtime.containers.values()
+
+    def get_names(self, container):
+        if container.name is None:
+            return []
+        return [container.name]
@@ -0,0 +1,463 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Seekable layer blobs in the eStargz format.
+
+A seekable blob is still a valid gzip compressed tar, but every file starts
+a new gzip member, large files are split in chunks of their own members,
+and a table of contents (TOC) listing every entry with the offset of its
+member goes at the end as the stargz.index.json tar entry, located through
+a fixed size footer. A reader needs the footer and the TOC to fetch and
+decompress any single file with a ranged read, so a layer can be extracted
+in parallel or file by file while it is still being fetched.
+
+Converted blobs keep the original tar headers of their entries and the end
+of the original archive in the TOC, as rawHeader and rawTrailer, so the
+original tar, and so its diff id, can be restored byte for byte.
+"""
+
+import io
+import os
+import json
+import stat
+import gzip
+import zlib
+import base64
+import bisect
+import struct
+import hashlib
+import tarfile
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from oci_api import OCIError
+from .archive import apply_metadata, get_xattrs, safe_join
+from .compression import open_decompressed
+
+log = logging.getLogger(__name__)
+
+TOC_NAME = 'stargz.index.json'
+LANDMARK_NAMES = ('.prefetch.landmark', '.no.prefetch.landmark')
+TOC_DIGEST_ANNOTATION = 'containerd.io/snapshot/stargz/toc.digest'
+UNCOMPRESSED_SIZE_ANNOTATION = 'io.containers.estargz.uncompressed-size'
+ORIGINAL_DIFF_ID_ANNOTATION = 'io.github.oci-cli.seekable.original-diff-id'
+FOOTER_SIZE = 51
+CHUNK_SIZE = 4 * 1024 * 1024
+BUFFER_SIZE = 1024 * 1024
+TAR_BLOCK_SIZE = 512
+
+ENTRY_TYPES = {
+    tarfile.REGTYPE: 'reg',
+    tarfile.AREGTYPE: 'reg',
+    tarfile.DIRTYPE: 'dir',
+    tarfile.SYMTYPE: 'symlink',
+    tarfile.LNKTYPE: 'hardlink',
+    tarfile.CHRTYPE: 'char',
+    tarfile.BLKTYPE: 'block',
+    tarfile.FIFOTYPE: 'fifo'
+}
+
+class SeekableException(OCIError):
+    pass
+
+class NotSeekableException(SeekableException):
+    pass
+
+def make_footer(toc_offset):
+    """Empty gzip member carrying the TOC offset in its extra field"""
+    payload = b'%016xSTARGZ' % toc_offset
+    extra = b'SG' + struct.pack('<H', len(payload)) + payload
+    return b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff' + struct.pack('<H', len(extra)) + \
+        extra + b'\x01\x00\x00\xff\xff' + struct.pack('<II', 0, 0)
+
+def parse_footer(footer):
+    if len(footer) != FOOTER_SIZE or not footer.startswith(b'\x1f\x8b\x08\x04'):
+        return None
+    extra = footer[12:38]
+    if extra[:2] != b'SG' or extra[-6:] != b'STARGZ':
+        return None
+    try:
+        return int(extra[4:20], 16)
+    except ValueError:
+        return None
+
+def format_time(mtime):
+    return datetime.fromtimestamp(mtime, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def parse_time(value):
+    if value is None:
+        return 0
+    return datetime.strptime(value, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc).timestamp()
+
+def toc_entry(tar_info):
+    entry = {
+        'name': tar_info.name[2:] if tar_info.name.startswith('./') else tar_info.name,
+        'type': ENTRY_TYPES.get(tar_info.type, 'reg'),
+        'modtime': format_time(tar_info.mtime),
+        'mode': tar_info.mode,
+        'uid': tar_info.uid,
+        'gid': tar_info.gid
+    }
+    if tar_info.uname:
+        entry['uname'] = tar_info.uname
+    if tar_info.gname:
+        entry['gname'] = tar_info.gname
+    if tar_info.isreg():
+        entry['size'] = tar_info.size
+    if tar_info.issym() or tar_info.islnk():
+        entry['linkName'] = tar_info.linkname
+    if tar_info.ischr() or tar_info.isblk():
+        entry['devMajor'] = tar_info.devmajor
+        entry['devMinor'] = tar_info.devminor
+    xattrs = {name: base64.b64encode(value).decode()
+        for (name, value) in get_xattrs(tar_info).items()}
+    if len(xattrs) != 0:
+        entry['xattrs'] = xattrs
+    return entry
+
+class RecordingReader:
+    """Reader over a tar stream that hashes all of it and keeps the bytes
+    from an offset on, to get back the raw headers tarfile parsed"""
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.hasher = hashlib.sha256()
+        self.position = 0
+        self.buffer = bytearray()
+        self.base = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.hasher.update(data)
+        start = self.position
+        self.position += len(data)
+        if self.position > self.base + len(self.buffer):
+            self.buffer += data[max(self.base + len(self.buffer) - start, 0):]
+        return data
+
+    def keep(self, offset):
+        """Forget the bytes before offset"""
+        if offset <= self.base:
+            return
+        del self.buffer[:offset - self.base]
+        self.base = offset
+
+    def get(self, start, end):
+        if start < self.base:
+            raise SeekableException('Tar header at %d was not kept' % start)
+        return bytes(self.buffer[start - self.base:end - self.base])
+
+    def read_to_end(self):
+        while len(self.read(BUFFER_SIZE)) != 0:
+            pass
+
+    def digest(self):
+        return 'sha256:' + self.hasher.hexdigest()
+
+class SeekableWriter:
+    def __init__(self, fileobj, chunk_size=CHUNK_SIZE, level=6):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.level = level
+        self.compressor = None
+        self.offset = 0
+        self.uncompressed_size = 0
+        self.entries = []
+        self.diff_hasher = hashlib.sha256()
+        self.blob_hasher = hashlib.sha256()
+        self.toc_digest = None
+        self.diff_id = None
+        self.digest = None
+        self.original_diff_id = None
+
+    def write_compressed(self, data):
+        self.fileobj.write(data)
+        self.blob_hasher.update(data)
+        self.offset += len(data)
+
+    def start_member(self):
+        self.end_member()
+        self.compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return self.offset
+
+    def end_member(self):
+        if self.compressor is not None:
+            self.write_compressed(self.compressor.flush())
+            self.compressor = None
+
+    def write(self, data):
+        self.diff_hasher.update(data)
+        self.uncompressed_size += len(data)
+        self.write_compressed(self.compressor.compress(data))
+
+    def add(self, tar_info, fileobj=None, raw_header=None):
+        entry = toc_entry(tar_info)
+        if entry['name'] == TOC_NAME or entry['name'] in LANDMARK_NAMES:
+            return
+        if raw_header is not None:
+            entry['rawHeader'] = base64.b64encode(raw_header).decode()
+        entry['offset'] = self.start_member()
+        self.write(tar_info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape'))
+        self.entries.append(entry)
+        if not tar_info.isreg() or tar_info.size == 0:
+            return
+        hasher = hashlib.sha256()
+        chunked = tar_info.size > self.chunk_size
+        chunk = entry
+        chunk_offset = 0
+        while chunk_offset < tar_info.size:
+            if chunk_offset != 0:
+                chunk = {
+                    'name': entry['name'],
+                    'type': 'chunk',
+                    'offset': self.start_member(),
+                    'chunkOffset': chunk_offset
+                }
+                self.entries.append(chunk)
+            length = min(self.chunk_size, tar_info.size - chunk_offset)
+            chunk_hasher = hashlib.sha256()
+            remaining = length
+            while remaining != 0:
+                data = fileobj.read(min(BUFFER_SIZE, remaining))
+                if len(data) == 0:
+                    raise SeekableException('Unexpected end of data in (%s)' % tar_info.name)
+                hasher.update(data)
+                chunk_hasher.update(data)
+                self.write(data)
+                remaining -= len(data)
+            if chunked:
+                chunk['chunkSize'] = length
+                chunk['chunkDigest'] = 'sha256:' + chunk_hasher.hexdigest()
+            chunk_offset += length
+        entry['digest'] = 'sha256:' + hasher.hexdigest()
+        padding = -tar_info.size % TAR_BLOCK_SIZE
+        if padding != 0:
+            self.write(b'\0' * padding)
+
+    def close(self, raw_trailer=None):
+        toc = {'version': 1, 'entries': self.entries}
+        if raw_trailer is not None:
+            toc['rawTrailer'] = base64.b64encode(raw_trailer).decode()
+        toc = json.dumps(toc, separators=(',', ':')).encode()
+        self.toc_digest = 'sha256:' + hashlib.sha256(toc).hexdigest()
+        toc_offset = self.start_member()
+        tar_info = tarfile.TarInfo(TOC_NAME)
+        tar_info.size = len(toc)
+        tar_info.mode = 0o644
+        self.write(tar_info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape'))
+        self.write(toc + b'\0' * (-len(toc) % TAR_BLOCK_SIZE))
+        # End of archive marker
+        self.write(b'\0' * (2 * TAR_BLOCK_SIZE))
+        self.end_member()
+        self.write_compressed(make_footer(toc_offset))
+        self.diff_id = 'sha256:' + self.diff_hasher.hexdigest()
+        self.digest = 'sha256:' + self.blob_hasher.hexdigest()
+
+def convert_to_seekable(input_file, output_file, chunk_size=CHUNK_SIZE):
+    """Rewrite the (possibly compressed) tar stream input_file as a
+    seekable blob into output_file, returns the writer for its digests"""
+    writer = SeekableWriter(output_file, chunk_size)
+    reader = RecordingReader(open_decompressed(input_file))
+    end = 0
+    with tarfile.open(fileobj=reader, mode='r|') as tar_file:
+        for tar_info in tar_file:
+            raw_header = reader.get(tar_info.offset, tar_info.offset_data)
+            # Past the data of the member, where the next header starts
+            end = tar_file.offset
+            reader.keep(end)
+            fileobj = tar_file.extractfile(tar_info) if tar_info.isreg() else None
+            writer.add(tar_info, fileobj, raw_header)
+            tar_file.members.clear()
+        reader.read_to_end()
+    writer.close(reader.get(end, reader.position))
+    writer.original_diff_id = reader.digest()
+    return writer
+
+def restore_tar(input_file, toc, output_file):
+    """Write the original tar of the seekable blob input_file to output_file
+    from the raw headers in its TOC. Returns False without writing anything
+    when the TOC does not have them."""
+    raw_headers = [entry.get('rawHeader') for entry in toc['entries']
+        if entry['type'] != 'chunk']
+    if 'rawTrailer' not in toc or None in raw_headers:
+        return False
+    raw_headers = iter(raw_headers)
+    # GzipFile reads every gzip member, tarfile's own stream stops after the
+    # first one
+    with tarfile.open(fileobj=gzip.GzipFile(fileobj=input_file), mode='r|') as tar_file:
+        for tar_info in tar_file:
+            if tar_info.name == TOC_NAME:
+                continue
+            try:
+                output_file.write(base64.b64decode(next(raw_headers)))
+            except StopIteration:
+                raise SeekableException('Entry (%s) is not in the table of contents' % tar_info.name)
+            if tar_info.isreg() and tar_info.size != 0:
+                data_file = tar_file.extractfile(tar_info)
+                for data in iter(lambda: data_file.read(BUFFER_SIZE), b''):
+                    output_file.write(data)
+                output_file.write(b'\0' * (-tar_info.size % TAR_BLOCK_SIZE))
+            tar_file.members.clear()
+    output_file.write(base64.b64decode(toc['rawTrailer']))
+    return True
+
+class SeekableReader:
+    """Reader of seekable blobs over any source with size() and
+    read_at(offset, length), such as fetch.FileReader or fetch.RangeReader"""
+    def __init__(self, source):
+        self.source = source
+        size = source.size()
+        toc_offset = None
+        if size >= FOOTER_SIZE:
+            toc_offset = parse_footer(source.read_at(size - FOOTER_SIZE, FOOTER_SIZE))
+        if toc_offset is None or toc_offset >= size - FOOTER_SIZE:
+            raise NotSeekableException('Blob has no table of contents')
+        data = zlib.decompressobj(31).decompress(source.read_at(toc_offset,
+            size - FOOTER_SIZE - toc_offset))
+        (self.toc, toc_data) = self.parse_toc(data)
+        self.toc_digest = 'sha256:' + hashlib.sha256(toc_data).hexdigest()
+        self.entries = self.toc['entries']
+        self.chunks = {}
+        offsets = {toc_offset}
+        for entry in self.entries:
+            if 'offset' in entry:
+                offsets.add(entry['offset'])
+            if entry['type'] in ('reg', 'chunk'):
+                self.chunks.setdefault(entry['name'], []).append(entry)
+        self.offsets = sorted(offsets)
+
+    def close(self):
+        self.source.close()
+
+    def parse_toc(self, data):
+        try:
+            with tarfile.open(fileobj=io.BytesIO(data), mode='r:') as tar_file:
+                tar_info = tar_file.next()
+                if tar_info is None or tar_info.name != TOC_NAME:
+                    raise NotSeekableException('Blob has no table of contents')
+                toc_data = tar_file.extractfile(tar_info).read()
+            return (json.loads(toc_data), toc_data)
+        except (tarfile.TarError, ValueError) as e:
+            raise SeekableException('Invalid table of contents: %s' % e)
+
+    def get_member_end(self, offset):
+        return self.offsets[bisect.bisect_right(self.offsets, offset)]
+
+    def read_chunk(self, entry, chunk):
+        """Uncompressed contents of one chunk of the regular file entry"""
+        offset = chunk['offset']
+        data = zlib.decompressobj(31).decompress(self.source.read_at(offset,
+            self.get_member_end(offset) - offset))
+        size = entry.get('size', 0)
+        chunk_offset = chunk.get('chunkOffset', 0)
+        length = chunk.get('chunkSize', size - chunk_offset)
+        if chunk is entry:
+            # The member starts with the tar header of the file
+            padding = -size % TAR_BLOCK_SIZE if chunk_offset + length == size else 0
+            start = len(data) - length - padding
+        else:
+            start = 0
+        content = data[start:start + length]
+        if len(content) != length:
+            raise SeekableException('Truncated chunk of (%s)' % entry['name'])
+        digest = chunk.get('chunkDigest')
+        if digest is not None and 'sha256:' + hashlib.sha256(content).hexdigest() != digest:
+            raise SeekableException('Digest mismatch in chunk of (%s)' % entry['name'])
+        return content
+
+    def read_file(self, entry):
+        """Yield the contents of the regular file entry, chunk by chunk"""
+        hasher = hashlib.sha256()
+        for chunk in self.chunks.get(entry['name'], []):
+            content = self.read_chunk(entry, chunk)
+            hasher.update(content)
+            yield content
+        if 'digest' in entry and 'sha256:' + hasher.hexdigest() != entry['digest']:
+            raise SeekableException('Digest mismatch in (%s)' % entry['name'])
+
+    def extract(self, target_path, workers=4):
+        """Extract every entry under target_path, regular files in parallel"""
+        target_path = str(target_path)
+        checked = set()
+        directories = []
+        files = []
+        links = []
+        for entry in self.entries:
+            entry_type = entry['type']
+            if entry_type == 'chunk' or entry['name'] in LANDMARK_NAMES:
+                continue
+            path = safe_join(target_path, entry['name'], checked)
+            if entry_type == 'dir':
+                os.makedirs(path, exist_ok=True)
+                directories.append((path, entry))
+            elif entry_type == 'reg':
+                files.append((path, entry))
+            elif entry_type in ('symlink', 'hardlink'):
+                links.append((path, entry))
+            else:
+                self.make_node(path, entry)
+        for (path, _) in files:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            for _ in executor.map(lambda item: self.extract_file(*item), files):
+                pass
+        for (path, entry) in links:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.lexists(path):
+                os.unlink(path)
+            if entry['type'] == 'symlink':
+                os.symlink(entry['linkName'], path)
+                apply_metadata(path, entry['mode'], entry['uid'], entry['gid'],
+                    parse_time(entry.get('modtime')), self.get_xattrs(entry))
+            else:
+                os.link(safe_join(target_path, entry['linkName'], checked), path)
+        # Deepest first, so setting a parent time is not undone by its children
+        for (path, entry) in reversed(directories):
+            apply_metadata(path, entry['mode'], entry['uid'], entry['gid'],
+                parse_time(entry.get('modtime')), self.get_xattrs(entry))
+
+    def extract_file(self, path, entry):
+        if os.path.lexists(path) and not os.path.isfile(path):
+            os.unlink(path)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_NOFOLLOW, 0o600)
+        with os.fdopen(fd, 'wb') as output_file:
+            for content in self.read_file(entry):
+                output_file.write(content)
+        apply_metadata(path, entry['mode'], entry['uid'], entry['gid'],
+            parse_time(entry.get('modtime')), self.get_xattrs(entry))
+
+    def make_node(self, path, entry):
+        if os.path.lexists(path):
+            os.unlink(path)
+        if entry['type'] == 'fifo':
+            os.mkfifo(path, entry['mode'])
+        else:
+            node_type = stat.S_IFCHR if entry['type'] == 'char' else stat.S_IFBLK
+            try:
+                os.mknod(path, entry['mode'] | node_type,
+                    os.makedev(entry.get('devMajor', 0), entry.get('devMinor', 0)))
+            except PermissionError:
+                log.warning('Could not create device (%s), not running as root' % entry['name'])
+                return
+        apply_metadata(path, entry['mode'], entry['uid'], entry['gid'],
+            parse_time(entry.get('modtime')), self.get_xattrs(entry))
+
+    def get_xattrs(self, entry):
+        return {name: base64.b64decode(value) for (name, value) in
+            (entry.get('xattrs') or {}).items()}
+
+def is_seekable(source):
+    size = source.size()
+    if size < FOOTER_SIZE:
+        return False
+    return parse_footer(source.read_at(size - FOOTER_SIZE, FOOTER_SIZE)) is not None
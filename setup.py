@@ -80,6 +80,11 @@ if __name__ == "__main__":
         setup_requires=["pytest-runner"],
         #tests_require=TESTS_REQUIRES,
         install_requires=INSTALL_REQUIRES,
+        extras_require={
+            'zstd': ['zstandard'],
+            'lz4': ['lz4'],
+            'orjson': ['orjson']
+        },
         entry_points={
             'console_scripts': [
                 'oci = oci_cli.cli:main'
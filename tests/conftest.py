@@ -0,0 +1,50 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests run against the in-process fake oci_api of the benchmarks"""
+
+import os
+import sys
+import pytest
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKES_PATH = os.path.join(REPOSITORY_PATH, 'benchmarks', 'fakes')
+
+sys.path[:0] = [FAKES_PATH, REPOSITORY_PATH]
+
+@pytest.fixture
+def root(tmp_path):
+    """Empty storage root the fake api and the CLI both use"""
+    from oci_api import oci_config, store
+    root_path = tmp_path.joinpath('root')
+    root_path.mkdir()
+    oci_config['global']['path'] = str(root_path)
+    store.reset()
+    return root_path
+
+@pytest.fixture
+def oci(root):
+    """Run the CLI in this process against root, returns its exit status"""
+    def run(*args):
+        from oci_cli.cli import CLI
+        argv = sys.argv
+        sys.argv = ['oci', '--log-level', 'error', '--root', str(root)] + [str(arg) for arg in args]
+        try:
+            CLI()
+        except SystemExit as e:
+            return e.code or 0
+        finally:
+            sys.argv = argv
+        return 0
+    return run
@@ -0,0 +1,53 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Receiving end of oci image sync for the tests, the CLI on the fake
+oci_api. Its images only live in memory, so the session that owns the
+destination loads the layouts in ROOT/preload first and writes what it
+has to ROOT/images.json when it ends."""
+
+import os
+import sys
+import json
+import pathlib
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(REPOSITORY_PATH, 'benchmarks', 'fakes'), REPOSITORY_PATH]
+
+from oci_api import oci_config
+from oci_api.image import Distribution
+from oci_cli.cli import CLI
+
+def main():
+    root_path = pathlib.Path(sys.argv[sys.argv.index('--root') + 1])
+    owner = '--session' not in sys.argv
+    oci_config['global']['path'] = str(root_path)
+    distribution = Distribution()
+    preload_path = root_path.joinpath('preload')
+    if owner and preload_path.is_dir():
+        for layout_path in sorted(preload_path.iterdir()):
+            distribution.load_image(layout_path.name, layout_path)
+    try:
+        CLI()
+    finally:
+        if owner:
+            root_path.joinpath('images.json').write_text(json.dumps({
+                'Images': {
+                    tag: [layer.diff_digest for layer in image.layers]
+                    for image in distribution.images.values() for tag in image.tags
+                }
+            }))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Concurrent commands against one root. The fake oci_api keeps its store in
+memory, so the commands run on threads of this process; the store locks are
+flock locks on files opened by each command, which exclude each other
+between threads the same way as between processes."""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from oci_api import store
+from oci_api.image import Distribution
+from oci_api.seed import seed
+from oci_cli.cli import CLI
+from oci_cli.util.resolver import ImageResolver, Resolver
+
+BASES = 4
+BUILDS = 24
+REMOVES = 8
+
+@pytest.fixture
+def tag_writes(monkeypatch):
+    """Writes to the tag index that overlapped another one. The real store
+    rewrites the tag index file on each change and loses concurrent
+    updates, the in-memory fake does not, so they are caught here."""
+    overlapped = []
+    writing = []
+    def exclusive(method):
+        def write(*args, **kwargs):
+            writing.append(method.__name__)
+            if len(writing) != 1:
+                overlapped.append(list(writing))
+            try:
+                # Widen the window a lost update would need
+                time.sleep(0.002)
+                return method(*args, **kwargs)
+            finally:
+                writing.remove(method.__name__)
+        return write
+    for name in ('create_image', 'add_tag', 'remove_image'):
+        monkeypatch.setattr(Distribution, name, exclusive(getattr(Distribution, name)))
+    return overlapped
+
+def run_commands(root, commands):
+    """Run the commands at the same time, returns their exit statuses"""
+    barrier = threading.Barrier(len(commands))
+    def run(args):
+        options = CLI.get_parser().parse_args(['--log-level', 'critical', '--root', str(root)] + args)
+        barrier.wait()
+        try:
+            CLI.commands[options.command](options)
+        except SystemExit as e:
+            return e.code or 0
+        return 0
+    with ThreadPoolExecutor(max_workers=len(commands)) as executor:
+        statuses = list(executor.map(run, commands))
+    Resolver.refresh_invalidated()
+    return statuses
+
+def test_concurrent_builds_and_removes(root, tmp_path, tag_writes):
+    images = seed(images=BASES + REMOVES, layers=2, files=4, file_size=1024)
+    for layer in list(store.layers.values()):
+        layer.get_path()
+    commands = []
+    for index in range(BUILDS):
+        context_path = tmp_path.joinpath('context%d' % index)
+        context_path.mkdir()
+        # Builds on the same base with the same content commit on the same parent
+        context_path.joinpath('Dockerfile').write_text(
+            'FROM repository%d:tag0\nCOPY <<EOF /etc/build\n%d\nEOF\nCMD ["/bin/true"]\n' %
+            (index % BASES, index % 3))
+        commands.append(['image', 'build', '-t', 'built%d:latest' % index, str(context_path)])
+    for index in range(BASES, BASES + REMOVES):
+        commands.append(['image', 'rm', 'repository%d:tag0' % index])
+    assert run_commands(root, commands) == [0] * (BUILDS + REMOVES)
+    assert tag_writes == []
+
+    distribution = Distribution()
+    tags = [tag for image in distribution.images.values() for tag in image.tags]
+    assert len(tags) == len(set(tags))
+    assert sorted(tags) == sorted(['built%d:latest' % index for index in range(BUILDS)] +
+        ['repository%d:tag0' % index for index in range(BASES)])
+    for image in images[BASES:]:
+        assert image.id not in distribution.images
+    for image in distribution.images.values():
+        for layer in image.layers:
+            assert store.layers.get(layer.id) is layer
+    for index in range(BUILDS):
+        image = distribution.get_image('built%d:latest' % index)
+        assert image.layers[:-1] == images[index % BASES].layers
+        assert image.layers[-1].get_path().joinpath('etc', 'build').read_text() == '%d\n' % (index % 3)
+
+    # The cached tag index agrees with the store
+    resolver = ImageResolver(root, distribution)
+    for image in distribution.images.values():
+        for tag in image.tags:
+            assert resolver.load_index().lookup(tag) == image.id
+    for index in range(BASES, BASES + REMOVES):
+        assert resolver.load_index().lookup('repository%d:tag0' % index) is None
@@ -0,0 +1,81 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import fcntl
+import pytest
+from oci_api import OCIError
+from oci_api.runtime import Container, Runtime
+from oci_api.seed import seed
+from oci_cli.util.lock import StoreLock, close_inherited_locks, container_lock_name
+
+@pytest.fixture
+def container(root):
+    image = seed(images=1, layers=1, files=2, file_size=64)[0]
+    return Runtime().create_container(image, name='c1')
+
+def is_locked(root, name):
+    """Whether another open file description holds the lock"""
+    fd = os.open(str(StoreLock(root, name).path), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return False
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+
+def test_lock_not_held_while_container_runs(oci, root, container, monkeypatch):
+    locked = []
+    start = Container.start
+    def start_checking(self):
+        locked.append(is_locked(root, container_lock_name(self)))
+        start(self)
+    monkeypatch.setattr(Container, 'start', start_checking)
+    assert oci('container', 'start', 'c1') == 0
+    assert locked == [False]
+
+def test_start_running_container(oci, container):
+    container.set_running(os.getpid())
+    with pytest.raises(OCIError, match='already running'):
+        oci('container', 'start', 'c1')
+
+def test_remove_running_container(oci, container):
+    container.set_running(os.getpid())
+    assert oci('container', 'rm', 'c1') != 0
+    assert container.id in Runtime().containers
+    container.start()
+    assert oci('container', 'rm', 'c1') == 0
+    assert container.id not in Runtime().containers
+
+def test_forked_child_closes_inherited_locks(root):
+    (ready_read, ready_write) = os.pipe()
+    (done_read, done_write) = os.pipe()
+    with StoreLock(root, 'test'):
+        child_pid = os.fork()
+        if child_pid == 0:
+            close_inherited_locks()
+            os.write(ready_write, b'x')
+            # Alive until the parent checked the lock
+            os.read(done_read, 1)
+            os._exit(0)
+        os.read(ready_read, 1)
+    try:
+        assert not is_locked(root, 'test')
+    finally:
+        os.write(done_write, b'x')
+        os.waitpid(child_pid, 0)
+        for fd in (ready_read, ready_write, done_read, done_write):
+            os.close(fd)
@@ -0,0 +1,98 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import io
+import sys
+import tarfile
+import pytest
+from oci_api.runtime import Runtime
+from oci_api.seed import seed
+
+@pytest.fixture
+def container(root):
+    image = seed(images=1, layers=1, files=2, file_size=64)[0]
+    container = Runtime().create_container(image, name='c1')
+    container.filesystem.path.joinpath('etc').mkdir(exist_ok=True)
+    container.filesystem.path.joinpath('etc', 'hostname').write_text('c1\n')
+    return container
+
+@pytest.fixture
+def source(tmp_path):
+    source_path = tmp_path.joinpath('source')
+    source_path.mkdir()
+    source_path.joinpath('a.txt').write_text('a\n')
+    source_path.joinpath('dir').mkdir()
+    source_path.joinpath('dir', 'b.txt').write_text('b\n')
+    return source_path
+
+def container_path(container, *names):
+    return container.filesystem.path.joinpath(*names)
+
+def test_copy_file_to_container(oci, container, source):
+    assert oci('container', 'cp', source.joinpath('a.txt'), 'c1:/etc/a.txt') == 0
+    assert container_path(container, 'etc', 'a.txt').read_text() == 'a\n'
+    assert oci('container', 'cp', source.joinpath('a.txt'), 'c1:/etc/') == 0
+    assert container_path(container, 'etc', 'a.txt').read_text() == 'a\n'
+
+def test_copy_directory_to_container(oci, container, source):
+    assert oci('container', 'cp', source.joinpath('dir'), 'c1:/etc') == 0
+    assert container_path(container, 'etc', 'dir', 'b.txt').read_text() == 'b\n'
+    assert oci('container', 'cp', '%s/.' % source.joinpath('dir'), 'c1:/srv') == 0
+    assert container_path(container, 'srv', 'b.txt').read_text() == 'b\n'
+
+def test_copy_to_missing_container_directory(oci, container, source):
+    assert oci('container', 'cp', source.joinpath('a.txt'), 'c1:/tmp/') != 0
+    assert not container_path(container, 'tmp').exists()
+    assert oci('container', 'cp', source.joinpath('a.txt'), 'c1:/tmp/a.txt') != 0
+    assert not container_path(container, 'tmp').exists()
+
+def test_copy_to_container_file_as_directory(oci, container, source):
+    assert oci('container', 'cp', source.joinpath('a.txt'), 'c1:/etc/hostname/') != 0
+    assert container_path(container, 'etc', 'hostname').read_text() == 'c1\n'
+
+def test_copy_from_container(oci, container, tmp_path):
+    target_path = tmp_path.joinpath('target')
+    target_path.mkdir()
+    assert oci('container', 'cp', 'c1:/etc/hostname', target_path) == 0
+    assert target_path.joinpath('hostname').read_text() == 'c1\n'
+    assert oci('container', 'cp', 'c1:/etc', target_path.joinpath('copy')) == 0
+    assert target_path.joinpath('copy', 'hostname').read_text() == 'c1\n'
+    assert oci('container', 'cp', 'c1:/etc/hostname', '%s/missing/' % target_path) != 0
+    assert not target_path.joinpath('missing').exists()
+
+def test_copy_through_symbolic_link_stays_in_container(oci, container, source):
+    container_path(container, 'escape').symlink_to(source)
+    assert oci('container', 'cp', source.joinpath('dir', 'b.txt'), 'c1:/escape/') != 0
+    assert not source.joinpath('b.txt').exists()
+
+def test_copy_tar_to_container(oci, container, monkeypatch):
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w') as tar_file:
+        member = tarfile.TarInfo('streamed.txt')
+        member.size = 3
+        tar_file.addfile(member, io.BytesIO(b'st\n'))
+    monkeypatch.setattr(sys, 'stdin', io.TextIOWrapper(io.BytesIO(archive.getvalue())))
+    assert oci('container', 'cp', '-', 'c1:/etc') == 0
+    assert container_path(container, 'etc', 'streamed.txt').read_text() == 'st\n'
+    monkeypatch.setattr(sys, 'stdin', io.TextIOWrapper(io.BytesIO(archive.getvalue())))
+    assert oci('container', 'cp', '-', 'c1:/missing') != 0
+
+def test_copy_tar_from_container(oci, container, monkeypatch):
+    output = io.BytesIO()
+    monkeypatch.setattr(sys, 'stdout', io.TextIOWrapper(output))
+    assert oci('container', 'cp', 'c1:/etc', '-') == 0
+    sys.stdout.flush()
+    with tarfile.open(fileobj=io.BytesIO(output.getvalue())) as tar_file:
+        assert tar_file.extractfile('etc/hostname').read() == b'c1\n'
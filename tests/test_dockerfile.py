@@ -0,0 +1,239 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import pytest
+from oci_cli.image import dockerfile
+from oci_cli.image.dockerfile import (DockerfileParseException, Dockerfile, Expander,
+    EXPANDABLE, KEY_VALUE_FORM, parse, parse_file, split_words)
+
+def summarize(text):
+    """(command, arguments, flags, json, heredocs) of each instruction"""
+    return [(instruction.command, instruction.arguments, instruction.flags, instruction.json,
+            [(heredoc.name, heredoc.content, heredoc.expand) for heredoc in instruction.heredocs])
+        for instruction in parse(text)]
+
+# Heredocs
+@pytest.mark.parametrize('text, expected', [
+    ('RUN <<EOF\necho hi\nEOF\n',
+        [('RUN', ['<<EOF'], {}, False, [('EOF', 'echo hi\n', True)])]),
+    ('RUN <<-EOT bash\n\techo a\n\tEOT\n',
+        [('RUN', ['<<-EOT bash'], {}, False, [('EOT', 'echo a\n', True)])]),
+    ("COPY <<'EOF' /x\n$HOME\nEOF\n",
+        [('COPY', ["<<'EOF'", '/x'], {}, False, [('EOF', '$HOME\n', False)])]),
+    ('COPY <<A <<B /dir/\none\nA\ntwo\nB\n',
+        [('COPY', ['<<A', '<<B', '/dir/'], {}, False, [('A', 'one\n', True), ('B', 'two\n', True)])]),
+    ('RUN <<EOF\n\nEOF\nCMD x\n',
+        [('RUN', ['<<EOF'], {}, False, [('EOF', '\n', True)]), ('CMD', ['x'], {}, False, [])]),
+    # Not heredocs: in JSON form, in an instruction without them, or a bad name
+    ('RUN ["cat", "<<EOF"]\n', [('RUN', ['cat', '<<EOF'], {}, True, [])]),
+    ('CMD cat <<EOF\n', [('CMD', ['cat <<EOF'], {}, False, [])]),
+    ('RUN echo <<1\n', [('RUN', ['echo <<1'], {}, False, [])]),
+])
+def test_heredoc(text, expected):
+    assert summarize(text) == expected
+
+def test_unterminated_heredoc():
+    with pytest.raises(DockerfileParseException, match=r'Unterminated heredoc \(EOF\) on line 2'):
+        parse('FROM a\nRUN cat <<EOF\nno end\n')
+
+# Parser directives and the escape token
+@pytest.mark.parametrize('text, escape, directives, arguments', [
+    ('FROM a\nRUN a \\\n  b\n', '\\', {}, ['a b']),
+    ('# escape=`\nFROM a\nRUN dir `\n  c:\\windows\n', '`', {'escape': '`'}, ['dir c:\\windows']),
+    ('# Escape = `\n# syntax=docker/dockerfile:1\nFROM a\nRUN a\n', '`',
+        {'escape': '`', 'syntax': 'docker/dockerfile:1'}, ['a']),
+    # Only before the first instruction or comment, later it is a comment
+    ('# comment\n# escape=`\nFROM a\nRUN a \\\nb\n', '\\', {}, ['a b']),
+    ('FROM a\n# escape=`\nRUN a \\\nb\n', '\\', {}, ['a b']),
+    # Comments and empty lines inside a continuation are dropped
+    ('FROM a\nRUN a \\\n# comment\n\n  b\n', '\\', {}, ['a b']),
+])
+def test_escape(text, escape, directives, arguments):
+    parsed = parse(text)
+    assert parsed.escape == escape
+    assert parsed.directives == directives
+    assert parsed.instructions[-1].arguments == arguments
+
+@pytest.mark.parametrize('text, message', [
+    ('# escape=x\nFROM a\n', r'Invalid escape token \(x\)'),
+    ('# escape=`\n# escape=\\\nFROM a\n', 'Only one escape parser directive'),
+])
+def test_invalid_escape(text, message):
+    with pytest.raises(DockerfileParseException, match=message):
+        parse(text)
+
+@pytest.mark.parametrize('text, commands', [
+    ('FROM a\nRUN b \\', ['FROM', 'RUN']),
+    ('FROM a\nRUN b\n\\\n', ['FROM', 'RUN']),
+    ('\\\n\n', []),
+])
+def test_trailing_continuation(text, commands):
+    assert [instruction.command for instruction in parse(text)] == commands
+
+# JSON and shell form
+@pytest.mark.parametrize('text, arguments, json', [
+    ('CMD ["a", "b"]', ['a', 'b'], True),
+    ('CMD a b', ['a b'], False),
+    ('CMD ["a", 1]', ['["a", 1]'], False),
+    ('CMD [a]', ['[a]'], False),
+    ('CMD ["a" "b"]', ['["a" "b"]'], False),
+    ('ENTRYPOINT []', [], True),
+    ('RUN ["echo", "$HOME"]', ['echo', '$HOME'], True),
+    ('VOLUME ["/c"]', ['/c'], True),
+    ('VOLUME /a /b', ['/a', '/b'], False),
+    ('SHELL ["sh", "-c"]', ['sh', '-c'], True),
+    ('HEALTHCHECK --interval=5s CMD ["curl", "x"]', ['curl', 'x'], True),
+    ('HEALTHCHECK CMD curl x', ['curl x'], False),
+    ('HEALTHCHECK NONE', ['NONE'], False),
+    ('EXPOSE ["80"]', ['["80"]'], False),
+])
+def test_form(text, arguments, json):
+    instruction = parse(text).instructions[0]
+    assert (instruction.arguments, instruction.json) == (arguments, json)
+
+def test_flags():
+    instruction = parse('RUN --mount=type=cache,target=/c --network=none -- --make\n').instructions[0]
+    assert instruction.flags == {'mount': 'type=cache,target=/c', 'network': 'none'}
+    assert instruction.arguments == ['--make']
+
+@pytest.mark.parametrize('text, message', [
+    ('SHELL sh -c', 'SHELL requires the arguments to be in JSON form on line 1'),
+    ('HEALTHCHECK --interval=5s true', 'Use HEALTHCHECK'),
+    ('RUN', 'RUN requires at least one argument on line 1'),
+    ('COPY --from=a', 'COPY requires at least one argument on line 1'),
+    ('FROB a', r'Unrecognized command \(FROB\) on line 1'),
+    ('ONBUILD ONBUILD RUN a', 'ONBUILD is not allowed as ONBUILD trigger'),
+    ('ONBUILD FROM a', 'FROM is not allowed as ONBUILD trigger'),
+    ('ENV A', 'ENV requires a value for A on line 1'),
+    ('ENV =1', 'ENV names can not be blank on line 1'),
+    ('LABEL a=1 b', 'LABEL requires a value for b on line 1'),
+])
+def test_invalid_instruction(text, message):
+    with pytest.raises(DockerfileParseException, match=message):
+        parse(text)
+
+# ARG/ENV forms and expansion
+@pytest.mark.parametrize('text, arguments', [
+    ('ENV A=1 B="two words" C=3', [['A', '1'], ['B', '"two words"'], ['C', '3']]),
+    ('ENV D four  five', [['D', 'four  five']]),
+    ('ENV E=a\\ b', [['E', 'a\\ b']]),
+    ('ARG X', [['X', None]]),
+    ('ARG X Y=2', [['X', None], ['Y', '2']]),
+    ('LABEL "k"="v"', [['"k"', '"v"']]),
+])
+def test_key_values(text, arguments):
+    assert parse(text).instructions[0].arguments == arguments
+
+ENVIRONMENT = {'A': '1', 'EMPTY': '', 'HOME': '/root'}
+
+@pytest.mark.parametrize('word, expected', [
+    ('$A', '1'),
+    ('${A}', '1'),
+    ('a$Ab', 'a'),
+    ('a${A}b', 'a1b'),
+    ('${HOME}/x', '/root/x'),
+    ('$UNSET', ''),
+    ('$', '$'),
+    ('$$', '$$'),
+    ('${UNSET:-d}', 'd'),
+    ('${EMPTY:-d}', 'd'),
+    ('${EMPTY-d}', ''),
+    ('${A:+x}', 'x'),
+    ('${UNSET:+x}', ''),
+    ('${EMPTY+x}', 'x'),
+    ('${UNSET:-${A}}', '1'),
+    ('${UNSET:-"a b"}', 'a b'),
+    ('"$A b"', '1 b'),
+    ("'$A'", '$A'),
+    ('"\'$A\'"', "'1'"),
+    ('\\$A', '$A'),
+    ('"\\$A"', '$A'),
+    ('a\\ b', 'a b'),
+    ('plain', 'plain'),
+])
+def test_expand(word, expected):
+    assert Expander(ENVIRONMENT).expand(word) == expected
+
+@pytest.mark.parametrize('word, message', [
+    ('${A', 'Bad substitution'),
+    ('${}', 'Bad substitution'),
+    ('${A:-x', 'Bad substitution'),
+    ('${A%x}', r'Unsupported modifier \(%\)'),
+    ('${UNSET:?must be set}', 'UNSET: must be set'),
+    ('${EMPTY:?}', 'EMPTY: is not allowed to be empty'),
+    ('"unterminated', 'Unmatched quote'),
+    ("'x", 'Unmatched quote'),
+])
+def test_expand_error(word, message):
+    with pytest.raises(DockerfileParseException, match=message):
+        Expander(ENVIRONMENT).expand(word)
+
+def test_expand_with_backtick_escape():
+    assert Expander(ENVIRONMENT, '`').expand('`$A\\x') == '$A\\x'
+
+def test_expand_heredoc_text():
+    assert Expander(ENVIRONMENT).expand_text('home=$HOME \\$A "$A" \'$A\'\n') == \
+        'home=/root $A "1" \'1\'\n'
+
+def test_split_words():
+    assert split_words('a "b c" \'d e\' f\\ g  h') == ['a', '"b c"', "'d e'", 'f\\ g', 'h']
+    assert split_words("'a\\' b", '\\') == ["'a\\'", 'b']
+
+# Parse cache
+def test_parse_file_cache(tmp_path):
+    dockerfile_path = tmp_path.joinpath('Dockerfile')
+    dockerfile_path.write_text('FROM a\nONBUILD RUN make\nCOPY <<EOF /x\n$A\nEOF\nCMD ["b"]\n')
+    cache_path = tmp_path.joinpath('cache')
+    first = parse_file(dockerfile_path, cache_path)
+    dockerfile._parse_cache.clear()
+    cached = parse_file(dockerfile_path, cache_path)
+    assert cached is not first
+    assert cached.to_dict() == first.to_dict()
+    assert len(list(cache_path.iterdir())) == 1
+
+# Random Dockerfiles only ever fail with DockerfileParseException
+FUZZ_TOKENS = ('RUN', 'COPY', 'ENV', 'ARG', 'FROM', 'CMD', 'HEALTHCHECK', 'ONBUILD',
+    'SHELL', 'LABEL', 'VOLUME', ' ', '\\', '`', '"', "'", '$', '{', '}', '[', ']', '<<',
+    '<<-', 'EOF', '=', '--', 'a', '\n', '\t', '#', ':', '-', '+', '?', ',', '1',
+    '# escape=`\n')
+
+def expand_all(parsed):
+    expander = Expander({'a': '1'}, parsed.escape)
+    for instruction in parsed:
+        if instruction.command in KEY_VALUE_FORM:
+            words = [value for (_, value) in instruction.arguments if value is not None]
+        elif instruction.command in EXPANDABLE:
+            words = instruction.arguments
+        else:
+            words = []
+        for word in words:
+            try:
+                expander.expand(word)
+            except DockerfileParseException:
+                pass
+        for heredoc in instruction.heredocs:
+            expander.expand_text(heredoc.content)
+
+@pytest.mark.parametrize('seed', range(4))
+def test_fuzz(seed):
+    generator = random.Random(seed)
+    for _ in range(2000):
+        text = ''.join(generator.choice(FUZZ_TOKENS) for _ in range(generator.randint(1, 30)))
+        try:
+            parsed = parse(text)
+        except DockerfileParseException:
+            continue
+        expand_all(parsed)
+        assert Dockerfile.from_dict(parsed.to_dict()).to_dict() == parsed.to_dict()
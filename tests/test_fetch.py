@@ -0,0 +1,115 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from oci_cli.util.fetch import Download, DownloadException, DigestMismatchException
+
+CONTENT = bytes(range(256)) * 4096
+CHUNK_SIZE = 64 * 1024
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_content_headers(self, length):
+        self.send_header('Content-Length', str(length))
+        if self.server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', '"content"')
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_content_headers(len(CONTENT))
+
+    def do_GET(self):
+        requested = self.headers.get('Range')
+        if requested is None or not self.server.ranges:
+            self.server.requests.append(None)
+            self.send_response(200)
+            self.send_content_headers(len(CONTENT))
+            self.wfile.write(CONTENT)
+            return
+        (start, end) = (int(value) for value in requested[6:].split('-'))
+        self.server.requests.append(start)
+        if start in self.server.failing:
+            self.send_error(500)
+            return
+        self.send_response(206)
+        self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end, len(CONTENT)))
+        self.send_content_headers(end + 1 - start)
+        self.wfile.write(CONTENT[start:end + 1])
+
+@pytest.fixture
+def server():
+    http_server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    http_server.ranges = True
+    http_server.failing = set()
+    http_server.requests = []
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    yield http_server
+    http_server.shutdown()
+    http_server.server_close()
+
+def get_url(server):
+    return 'http://127.0.0.1:%d/layer.tar' % server.server_address[1]
+
+def get_download(server, file_path, **kwargs):
+    return Download(get_url(server), file_path, chunk_size=CHUNK_SIZE, retries=0, **kwargs)
+
+def test_parallel_ranges(server, tmp_path):
+    file_path = tmp_path.joinpath('layer.tar')
+    digest = get_download(server, file_path, connections=4).run()
+    assert digest == hashlib.sha256(CONTENT).hexdigest()
+    assert file_path.read_bytes() == CONTENT
+    assert sorted(server.requests) == list(range(0, len(CONTENT), CHUNK_SIZE))
+    assert not file_path.with_name('layer.tar.json').exists()
+
+def test_resume_after_interruption(server, tmp_path):
+    file_path = tmp_path.joinpath('layer.tar')
+    server.failing.add(8 * CHUNK_SIZE)
+    with pytest.raises(DownloadException):
+        get_download(server, file_path, connections=1).run()
+    assert file_path.with_name('layer.tar.json').exists()
+    first_requests = len(server.requests)
+    server.failing.clear()
+    server.requests.clear()
+    digest = get_download(server, file_path, connections=1).run()
+    assert digest == hashlib.sha256(CONTENT).hexdigest()
+    assert file_path.read_bytes() == CONTENT
+    # Chunks completed before the interruption are not fetched again
+    assert 8 * CHUNK_SIZE in server.requests
+    assert len(server.requests) < len(CONTENT) // CHUNK_SIZE
+    assert len(server.requests) + first_requests >= len(CONTENT) // CHUNK_SIZE
+
+def test_wrong_sha256_removes_partial_download(server, tmp_path):
+    file_path = tmp_path.joinpath('layer.tar')
+    with pytest.raises(DigestMismatchException):
+        get_download(server, file_path, sha256='sha256:' + '0' * 64).run()
+    assert not file_path.exists()
+    assert not file_path.with_name('layer.tar.json').exists()
+    # Nothing left to resume, a later run fetches everything again
+    digest = get_download(server, file_path, sha256=hashlib.sha256(CONTENT).hexdigest()).run()
+    assert digest == hashlib.sha256(CONTENT).hexdigest()
+
+def test_stream_without_ranges(server, tmp_path):
+    server.ranges = False
+    file_path = tmp_path.joinpath('layer.tar')
+    digest = get_download(server, file_path).run()
+    assert digest == hashlib.sha256(CONTENT).hexdigest()
+    assert server.requests == [None]
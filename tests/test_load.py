@@ -0,0 +1,28 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from oci_api.image import Distribution
+from oci_api.seed import seed
+from oci_cli.util.journal import JournalReader
+
+def test_load_records_image_id(oci, root, tmp_path):
+    seed(images=1, layers=2, files=4, file_size=1024)
+    archive_path = tmp_path.joinpath('image.tar')
+    assert oci('image', 'save', '-o', archive_path, 'repository0:tag0') == 0
+    assert oci('image', 'load', '-i', archive_path, 'loaded:latest') == 0
+    image = Distribution().get_image('loaded:latest')
+    events = [event for event in JournalReader(str(root)).read() if event['action'] == 'load']
+    assert [(event['id'], event['attributes']['name']) for event in events] == \
+        [(image.id, 'loaded:latest')]
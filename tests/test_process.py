@@ -0,0 +1,122 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Signalling of containers whose processes are plain child processes"""
+
+import os
+import sys
+import time
+import signal
+import threading
+import subprocess
+import pytest
+from oci_api.runtime import Runtime
+from oci_api.seed import seed
+from oci_cli.container import process
+from oci_cli.container.process import signal_containers, wait_for_exit
+
+SLEEPER = '''
+import sys, time, signal
+if sys.argv[1] == 'ignore':
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+print('ready', flush=True)
+time.sleep(60)
+'''
+
+@pytest.fixture(params=['pidfd', 'polling'])
+def wait_method(request, monkeypatch):
+    if request.param == 'polling':
+        monkeypatch.delattr(os, 'pidfd_open', raising=False)
+    elif not hasattr(os, 'pidfd_open'):
+        pytest.skip('No pidfd_open on this platform')
+    return request.param
+
+@pytest.fixture
+def start_process():
+    """Start a child that ignores SIGTERM or not, reaped as soon as it exits
+    so that it does not linger as a zombie"""
+    processes = []
+    def start(sigterm='default'):
+        child = subprocess.Popen([sys.executable, '-c', SLEEPER, sigterm],
+            stdout=subprocess.PIPE)
+        assert child.stdout.readline() == b'ready\n'
+        threading.Thread(target=child.wait, daemon=True).start()
+        processes.append(child)
+        return child
+    yield start
+    for child in processes:
+        if child.poll() is None:
+            child.kill()
+        child.wait()
+        child.stdout.close()
+
+@pytest.fixture
+def create_container(root):
+    image = seed(images=1, layers=1, files=1, file_size=64)[0]
+    def create(name, pid=None):
+        container = Runtime().create_container(image, name=name)
+        if pid is not None:
+            container.set_running(pid)
+        return container
+    return create
+
+def test_stop_kills_stragglers_at_deadline(wait_method, start_process, create_container):
+    stopping = create_container('stopping', start_process().pid)
+    ignoring = create_container('ignoring', start_process('ignore').pid)
+    stopped = create_container('stopped')
+    start = time.monotonic()
+    results = signal_containers([stopping, ignoring, stopped], signal.SIGTERM, 1)
+    elapsed = time.monotonic() - start
+    assert [(result.container, result.status) for result in results] == \
+        [(stopping, 'stopped'), (ignoring, 'killed'), (stopped, 'not running')]
+    (stopping_result, ignoring_result, stopped_result) = results
+    assert stopping_result.elapsed < 1
+    assert 1 <= ignoring_result.elapsed < 1 + process.KILL_TIMEOUT
+    assert stopped_result.elapsed == 0
+    # One deadline for all of them, not one per container
+    assert elapsed < 3
+
+def test_shared_deadline(wait_method, start_process, create_container):
+    containers = [create_container('ignoring%d' % index, start_process('ignore').pid)
+        for index in range(3)]
+    start = time.monotonic()
+    results = signal_containers(containers, signal.SIGTERM, 1)
+    assert [result.status for result in results] == ['killed'] * 3
+    assert time.monotonic() - start < 3
+
+def test_signal_without_timeout(start_process, create_container):
+    child = start_process()
+    container = create_container('running', child.pid)
+    results = signal_containers([container], signal.SIGKILL)
+    assert [result.status for result in results] == ['SIGKILL']
+    assert child.wait(5) == -signal.SIGKILL
+
+def test_signal_exited_process(start_process, create_container):
+    child = start_process()
+    child.kill()
+    child.wait()
+    container = create_container('exited', child.pid)
+    assert [result.status for result in signal_containers([container], signal.SIGTERM, 1)] == \
+        ['exited']
+
+def test_wait_for_exit_until_deadline(wait_method, start_process):
+    child = start_process('ignore')
+    start = time.monotonic()
+    (exited, remaining) = wait_for_exit({'child': child.pid}, start + 0.3)
+    assert (exited, remaining) == ({}, {'child': child.pid})
+    assert 0.3 <= time.monotonic() - start < 1
+    child.kill()
+    (exited, remaining) = wait_for_exit({'child': child.pid}, time.monotonic() + 5)
+    assert list(exited) == ['child'] and remaining == {}
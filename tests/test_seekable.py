@@ -0,0 +1,204 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import io
+import gzip
+import json
+import hashlib
+import tarfile
+import pytest
+from oci_api.image import Distribution
+from oci_api.seed import seed
+from oci_cli.image.layout import ImageLayout
+from oci_cli.util.fetch import FileReader
+from oci_cli.util.seekable import ORIGINAL_DIFF_ID_ANNOTATION, SeekableReader, \
+    SeekableWriter, convert_to_seekable, is_seekable, restore_tar
+
+CHUNK_SIZE = 1024
+LONG_NAME = 'directory/' + 'a' * 50 + '/' + 'b' * 60
+
+def make_tar(tar_format):
+    """Tar of a small tree with the entry types a layer has"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w', format=tar_format) as tar_file:
+        def add(name, entry_type=tarfile.REGTYPE, data=b'', **attributes):
+            tar_info = tarfile.TarInfo(name)
+            tar_info.type = entry_type
+            tar_info.size = len(data)
+            tar_info.mtime = 1600000000
+            for (key, value) in attributes.items():
+                setattr(tar_info, key, value)
+            tar_file.addfile(tar_info, io.BytesIO(data))
+        add('directory', tarfile.DIRTYPE, mode=0o755)
+        add('directory/empty')
+        add('directory/small', data=b'small contents', uname='user', gname='group')
+        add('directory/large', data=bytes(range(256)) * 20)
+        add(LONG_NAME, data=b'long name')
+        add('directory/symlink', tarfile.SYMTYPE, linkname='small')
+        add('directory/hardlink', tarfile.LNKTYPE, linkname='directory/small')
+    return buffer.getvalue()
+
+def sha256(data):
+    return 'sha256:' + hashlib.sha256(data).hexdigest()
+
+def write_blob(layout_path, data):
+    blobs_path = layout_path.joinpath('blobs', 'sha256')
+    blobs_path.mkdir(parents=True, exist_ok=True)
+    digest = sha256(data)
+    blobs_path.joinpath(digest[7:]).write_bytes(data)
+    return {'digest': digest, 'size': len(data)}
+
+def make_layout(layout_path, layer_tars):
+    """OCI image layout of one image with the tar+gzip layers layer_tars"""
+    layers = []
+    for layer_tar in layer_tars:
+        descriptor = write_blob(layout_path, gzip.compress(layer_tar))
+        descriptor['mediaType'] = 'application/vnd.oci.image.layer.v1.tar+gzip'
+        layers.append(descriptor)
+    config = {'rootfs': {'type': 'layers', 'diff_ids': [sha256(data) for data in layer_tars]}}
+    config_descriptor = write_blob(layout_path, json.dumps(config).encode())
+    config_descriptor['mediaType'] = 'application/vnd.oci.image.config.v1+json'
+    manifest = {'schemaVersion': 2, 'config': config_descriptor, 'layers': layers}
+    manifest_descriptor = write_blob(layout_path, json.dumps(manifest).encode())
+    manifest_descriptor['mediaType'] = 'application/vnd.oci.image.manifest.v1+json'
+    layout_path.joinpath('index.json').write_text(json.dumps({
+        'schemaVersion': 2, 'manifests': [manifest_descriptor]}))
+    return ImageLayout(layout_path)
+
+def read_layout(layout):
+    """(layer descriptors, diff ids) of the only image in layout"""
+    index = json.loads(layout.index_path.read_text())
+    manifest = layout.read_json(index['manifests'][0]['digest'])
+    config = layout.read_json(manifest['config']['digest'])
+    return (manifest['layers'], config['rootfs']['diff_ids'])
+
+def read_layer_tars(layout):
+    (layers, _) = read_layout(layout)
+    return [gzip.decompress(layout.get_blob_path(layer['digest']).read_bytes())
+        for layer in layers]
+
+@pytest.mark.parametrize('tar_format', [tarfile.GNU_FORMAT, tarfile.USTAR_FORMAT,
+    tarfile.PAX_FORMAT], ids=['gnu', 'ustar', 'pax'])
+def test_restore_tar_is_byte_exact(tmp_path, tar_format):
+    original = make_tar(tar_format)
+    blob_path = tmp_path.joinpath('seekable')
+    with blob_path.open('wb') as output_file:
+        writer = convert_to_seekable(io.BytesIO(gzip.compress(original)), output_file,
+            CHUNK_SIZE)
+    assert writer.original_diff_id == sha256(original)
+    assert writer.diff_id != writer.original_diff_id
+    source = FileReader(blob_path)
+    try:
+        toc = SeekableReader(source).toc
+    finally:
+        source.close()
+    restored = io.BytesIO()
+    with blob_path.open('rb') as input_file:
+        assert restore_tar(input_file, toc, restored)
+    assert restored.getvalue() == original
+
+def test_layout_round_trip_restores_diff_ids(tmp_path):
+    originals = [make_tar(tarfile.GNU_FORMAT), make_tar(tarfile.PAX_FORMAT)]
+    layout = make_layout(tmp_path.joinpath('layout'), originals)
+    (_, diff_ids) = read_layout(layout)
+    assert layout.convert_to_seekable(CHUNK_SIZE) == 2
+    (layers, seekable_diff_ids) = read_layout(layout)
+    assert seekable_diff_ids != diff_ids
+    assert [layer['annotations'][ORIGINAL_DIFF_ID_ANNOTATION] for layer in layers] == diff_ids
+    assert layout.convert_from_seekable() == 2
+    assert read_layout(layout)[1] == diff_ids
+    assert read_layer_tars(layout) == originals
+
+def test_layout_round_trip_of_saved_image(root, tmp_path):
+    seed(images=1, layers=2, files=4, file_size=3000)
+    for layer in Distribution().get_image('repository0:tag0').layers:
+        layer.get_blob_path()
+    layout_path = tmp_path.joinpath('layout')
+    Distribution().save_image('repository0:tag0', layout_path)
+    layout = ImageLayout(layout_path)
+    (_, diff_ids) = read_layout(layout)
+    originals = read_layer_tars(layout)
+    layout.convert_to_seekable(CHUNK_SIZE)
+    for layer in read_layout(layout)[0]:
+        source = FileReader(layout.get_blob_path(layer['digest']))
+        try:
+            assert is_seekable(source)
+        finally:
+            source.close()
+    layout.convert_from_seekable()
+    assert read_layout(layout)[1] == diff_ids
+    assert read_layer_tars(layout) == originals
+
+def test_foreign_seekable_layer_is_rewritten(tmp_path):
+    # Seekable blobs of other tools have no raw headers, their entries are
+    # written again and the diff id is the one of the new tar
+    layout = make_layout(tmp_path.joinpath('layout'), [make_tar(tarfile.GNU_FORMAT)])
+    (layers, _) = read_layout(layout)
+    blob_path = layout.get_blob_path(layers[0]['digest'])
+    buffer = io.BytesIO()
+    writer = SeekableWriter(buffer, CHUNK_SIZE)
+    with tarfile.open(blob_path, mode='r:gz') as tar_file:
+        for tar_info in tar_file:
+            writer.add(tar_info, tar_file.extractfile(tar_info) if tar_info.isreg() else None)
+    writer.close()
+    blob_path.write_bytes(buffer.getvalue())
+    assert layout.convert_from_seekable() == 1
+    [restored] = read_layer_tars(layout)
+    assert read_layout(layout)[1] == [sha256(restored)]
+    with tarfile.open(fileobj=io.BytesIO(restored)) as tar_file:
+        assert tar_file.extractfile(LONG_NAME).read() == b'long name'
+
+def test_seekable_reader_extracts_files(tmp_path):
+    blob_path = tmp_path.joinpath('seekable')
+    with blob_path.open('wb') as output_file:
+        convert_to_seekable(io.BytesIO(make_tar(tarfile.GNU_FORMAT)), output_file, CHUNK_SIZE)
+    reader = SeekableReader(FileReader(blob_path))
+    try:
+        reader.extract(tmp_path.joinpath('rootfs'))
+    finally:
+        reader.close()
+    rootfs_path = tmp_path.joinpath('rootfs')
+    assert rootfs_path.joinpath('directory', 'large').read_bytes() == bytes(range(256)) * 20
+    assert rootfs_path.joinpath(LONG_NAME).read_bytes() == b'long name'
+    assert rootfs_path.joinpath('directory', 'empty').read_bytes() == b''
+    assert rootfs_path.joinpath('directory', 'symlink').resolve() == \
+        rootfs_path.joinpath('directory', 'small').resolve()
+
+def test_save_load_and_import_seekable(oci, root, tmp_path):
+    seed(images=1, layers=2, files=4, file_size=3000)
+    archive_path = tmp_path.joinpath('image.tar')
+    assert oci('image', 'save', '--seekable', '--chunk-size', CHUNK_SIZE,
+        '-o', archive_path, 'repository0:tag0') == 0
+    assert oci('image', 'load', '-i', archive_path, 'loaded:latest') == 0
+    # The fake load takes the diff ids from the extracted files, so compare
+    # with a load of the plain archive
+    plain_archive_path = tmp_path.joinpath('plain.tar')
+    assert oci('image', 'save', '-o', plain_archive_path, 'repository0:tag0') == 0
+    assert oci('image', 'load', '-i', plain_archive_path, 'plain:latest') == 0
+    image = Distribution().get_image('repository0:tag0')
+    loaded = Distribution().get_image('loaded:latest')
+    assert loaded.id == Distribution().get_image('plain:latest').id
+    assert [layer.diff_digest for layer in loaded.layers] == \
+        [layer.diff_digest for layer in image.layers]
+    layout_path = tmp_path.joinpath('layout')
+    with tarfile.open(archive_path) as tar_file:
+        tar_file.extractall(layout_path)
+    (layers, _) = read_layout(ImageLayout(layout_path))
+    blob_path = ImageLayout(layout_path).get_blob_path(layers[0]['digest'])
+    assert oci('image', 'import', blob_path, 'imported:latest') == 0
+    imported = Distribution().get_image('imported:latest')
+    with tarfile.open(imported.layers[0].get_blob_path()) as imported_tar, \
+            tarfile.open(image.layers[0].get_blob_path()) as original_tar:
+        assert sorted(imported_tar.getnames()) == sorted(original_tar.getnames())
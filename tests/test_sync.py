@@ -0,0 +1,101 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import json
+import shlex
+import hashlib
+import pytest
+from oci_api import store
+from oci_api.image import Distribution
+from oci_api.seed import seed
+from oci_cli.image import sync
+from oci_cli.image.sync import Peer, SyncException, get_peer_command
+
+PEER_COMMAND = '%s %s' % (shlex.quote(sys.executable),
+    shlex.quote(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sync_peer.py')))
+
+@pytest.fixture
+def destination(tmp_path):
+    destination_path = tmp_path.joinpath('destination')
+    destination_path.mkdir()
+    return destination_path
+
+@pytest.fixture
+def sent_blobs(monkeypatch):
+    """Digests of the layers each sync sent"""
+    sent = []
+    send_blobs = sync.Sync.send_blobs
+    def record(self, channel, session, blobs):
+        sent.append(sorted(blobs))
+        return send_blobs(self, channel, session, blobs)
+    monkeypatch.setattr(sync.Sync, 'send_blobs', record)
+    return sent
+
+def seed_images(images, layers):
+    """Seeded images, with the blobs of their layers written so that the
+    layers have their final digests before they are offered"""
+    seeded_images = seed(images=images, layers=layers, files=4, file_size=1024)
+    for layer in store.layers.values():
+        layer.get_blob_path()
+    return seeded_images
+
+def get_images():
+    return {tag: [layer.diff_digest for layer in image.layers]
+        for image in Distribution().images.values() for tag in image.tags}
+
+def read_destination(destination):
+    return json.loads(destination.joinpath('images.json').read_text())
+
+def test_sync_all_images_in_parallel(oci, destination, sent_blobs):
+    seed_images(3, 3)
+    assert oci('image', 'sync', '--to', destination, '--peer-command', PEER_COMMAND,
+        '--parallel', '3', '--all') == 0
+    assert read_destination(destination)['Images'] == get_images()
+    # The base layer is shared, each image adds two
+    assert len(sent_blobs[0]) == 7
+    assert list(destination.joinpath('tmp', 'sync').iterdir()) == []
+
+def test_sync_only_missing_layers(oci, destination, sent_blobs):
+    images = seed_images(2, 3)
+    Distribution().save_image(images[0].id, destination.joinpath('preload', 'repository0:tag0'))
+    assert oci('image', 'sync', '--to', destination, '--peer-command', PEER_COMMAND,
+        'repository0:tag0', 'repository1:tag0') == 0
+    assert read_destination(destination)['Images'] == get_images()
+    # Only the two layers of the second image on top of the shared base
+    assert sent_blobs == [sorted(layer.digest for layer in images[1].layers[1:])]
+
+def test_sync_up_to_date(oci, destination, sent_blobs):
+    images = seed_images(1, 3)
+    Distribution().save_image(images[0].id, destination.joinpath('preload', 'repository0:tag0'))
+    assert oci('image', 'sync', '--to', destination, '--peer-command', PEER_COMMAND,
+        'repository0:tag0') == 0
+    assert sent_blobs == [[]]
+    assert read_destination(destination)['Images'] == get_images()
+
+def test_receive_blob_rejects_wrong_digest(destination, tmp_path):
+    payload_path = tmp_path.joinpath('payload')
+    payload_path.write_bytes(b'layer')
+    wrong_digest = 'sha256:' + hashlib.sha256(b'other layer').hexdigest()
+    peer = Peer(get_peer_command(str(destination), PEER_COMMAND, 'critical'))
+    try:
+        peer.channel.send('hello', Version=sync.PROTOCOL_VERSION)
+        session = peer.channel.receive('hello')['Session']
+        peer.channel.send('blob', payload_path, Digest=wrong_digest)
+        with pytest.raises(SyncException, match='does not match its digest'):
+            peer.channel.receive()
+    finally:
+        assert peer.close() != 0
+    assert not destination.joinpath('tmp', 'sync', session).exists()
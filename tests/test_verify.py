@@ -0,0 +1,63 @@
+# Copyright 2020, Guillermo Adrián Molina
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import pytest
+from oci_api import store
+from oci_api.seed import seed
+from oci_cli.image.layers import LayerMetadata
+
+@pytest.fixture
+def layer(root):
+    image = seed(images=1, layers=2, files=4, file_size=1024)[0]
+    for seeded_layer in store.layers.values():
+        seeded_layer.get_blob_path()
+    return image.layers[-1]
+
+def get_verified(root, layer):
+    return (LayerMetadata(str(root)).get(layer) or {}).get('Verified')
+
+def test_verified_layer_is_skipped(oci, root, layer):
+    assert oci('image', 'verify', '--all') == 0
+    verified = get_verified(root, layer)
+    assert verified is not None
+    assert oci('image', 'verify', '--all') == 0
+    assert get_verified(root, layer) == verified
+    assert oci('image', 'verify', '--all', '--full') == 0
+    assert get_verified(root, layer) > verified
+
+def test_rewritten_blob_is_verified_again(oci, root, layer):
+    assert oci('image', 'verify', '--all') == 0
+    verified = get_verified(root, layer)
+    blob_path = layer.get_blob_path()
+    content = blob_path.read_bytes()
+    # Same content, written again
+    temp_path = blob_path.with_name(blob_path.name + '.tmp')
+    temp_path.write_bytes(content)
+    temp_path.replace(blob_path)
+    assert oci('image', 'verify', '--all') == 0
+    assert get_verified(root, layer) > verified
+
+def test_damaged_blob_is_verified_again(oci, root, layer):
+    assert oci('image', 'verify', '--all') == 0
+    blob_path = layer.get_blob_path()
+    blob_stat = blob_path.stat()
+    with blob_path.open('r+b') as blob_file:
+        blob_file.seek(blob_stat.st_size // 2)
+        blob_file.write(b'\0' * 16)
+    # Same size and inode, the mtime set back, only the ctime changes
+    os.utime(str(blob_path), ns=(blob_stat.st_atime_ns, blob_stat.st_mtime_ns))
+    assert oci('image', 'verify', '--all') != 0
+    assert get_verified(root, layer) == 0